@@ -9,6 +9,11 @@ This module contains the classes and functions for the FiPi web app.
 from __future__ import division
 
 
+import os
+import json
+import logging
+
+import flask
 import dash
 import dash_html_components as html
 import dash_core_components as dcc
@@ -16,22 +21,29 @@ from dash.dependencies import Input, Output
 import plotly.figure_factory as ff
 import dash_auth
 import plotly.graph_objs as go
+import plotly.utils
 
 
 import securities as st
 from portfolio import *
 from ssap import *
+from cache import LruCache
+import priceStore
+import portfolioRegistry
+import priceRefresher
+import downsample
+import instrumentation
 
 import numpy as np
 import pandas as pd
 
 
-def generate_assetMenu():
+def generate_assetMenu(portfolio):
     """
     This helper method creates the menu items that lists the assets in the portfolio
 
     Args :
-        - None
+        - portfolio (Portfolio)
 
     Return :
         - (list of dicts) label and value of all the assets in the portfolio
@@ -41,16 +53,36 @@ def generate_assetMenu():
 
     menuItems = []
 
-    for asset in app.config['PORT'].getAssetList():
+    for asset in portfolio.getAssetList():
         menuItems.append(dict(label=asset, value=asset))
 
     return menuItems
 
 
 
+def getPortfolio(dbFile):
+    """
+    This helper method gets a portfolio given the database file that contains the info of the assets in the portfolio.
+    The portfolio comes from the portfolio registry so it is only loaded again when its db file changes
+
+    Args :
+        - dbFile (string)
+
+    Return :
+        - (Portfolio) the portfolio
+
+
+    """
+
+    instrumentation.setCallbackField('portfolio', dbFile)
+
+    return portfolioRegistry.registry.getPortfolio('./data/'+dbFile)
+
+
+
 def loadPortfolio(dbFile):
     """
-    This helper method loads a portfolio given the tiny db file that contains the info of the assets int
+    This helper method loads a portfolio given the database file that contains the info of the assets int
     the portfolio. The portfolio object and a list of assets are stored in the app.config variable
 
     Args :
@@ -63,11 +95,128 @@ def loadPortfolio(dbFile):
     """
 
 
-    # create the portfolio object
-    app.config['PORT'] = Portfolio('./data/'+dbFile)
+    # get the portfolio object
+    app.config['PORT'] = getPortfolio(dbFile)
 
     # create a menu of the assets in the portfolio
-    app.config['MENU'] = generate_assetMenu()
+    app.config['MENU'] = generate_assetMenu(app.config['PORT'])
+
+
+
+def getFigureKey(figureType, dbFile, *args):
+    """
+    This helper method creates the key of a figure in the figure cache. The key contains the version of the portfolio
+    and of the price data so that the figure is created again when they change
+
+    Args :
+        - figureType (string) type of the figure
+        - dbFile (string) database file of the portfolio
+        - args other parameters of the figure (ex graf type)
+
+    Return :
+        - (tuple) key of the figure
+
+
+    """
+
+    portfolioDBFile = './data/'+dbFile
+
+    return (figureType, portfolioDBFile, portfolioRegistry.registry.getVersion(portfolioDBFile),
+            priceStore.store.getDataVersion()) + args
+
+
+def getFigure(figureType, key, create):
+    """
+    This helper method gets a figure from the figure cache, it is created only if it is not already in the cache. The
+    creation of a figure is timed and the size of its JSON payload is measured once, when it is created. The figure
+    type, the cache result and the payload size are added to the log line of the callback
+
+    Args :
+        - figureType (string) type of the figure
+        - key (tuple) key of the figure (see getFigureKey)
+        - create (function) function without arguments that creates the figure
+
+    Return :
+        - (dict) plotly graf object
+
+
+    """
+
+    isCreated = []
+
+
+    def createFigure():
+
+        isCreated.append(True)
+
+        with instrumentation.timer('fipi_stage_seconds', stage=figureType):
+            figure = create()
+
+        return figure, len(json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+    figure, payloadBytes = figureCache.getOrCreate(key, createFigure)
+
+    instrumentation.observe('fipi_figure_payload_bytes', payloadBytes, figure=figureType)
+
+    instrumentation.setCallbackField('figure', figureType)
+    instrumentation.setCallbackField('cache', 'miss' if isCreated else 'hit')
+    instrumentation.setCallbackField('payload_bytes', payloadBytes)
+
+    return figure
+
+
+
+def getVisibleRange(relayoutData):
+    """
+    This helper method gets the visible date range of a graf from its relayout data (sent when the graf is zoomed with
+    the mouse, the range selector or the range slider)
+
+    Args :
+        - relayoutData (dict) relayout data of the graf
+
+    Return :
+        - (tuple of strings) start and end dates of the visible range. (None, None) if the whole graf is visible
+
+
+    """
+
+    if not relayoutData or relayoutData.get('xaxis.autorange'):
+        return (None, None)
+
+    if 'xaxis.range[0]' in relayoutData and 'xaxis.range[1]' in relayoutData:
+        dateRange = [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']]
+
+    elif 'xaxis.range' in relayoutData:
+        dateRange = relayoutData['xaxis.range']
+
+    else:
+        return (None, None)
+
+    # the dates are rounded to the day so that the figures of close ranges share the same cache entry
+    return tuple(pd.Timestamp(date).strftime('%Y-%m-%d') for date in dateRange)
+
+
+
+def getRangeLayout(visibleRange):
+    """
+    This helper method creates the x axis layout attributes that keep the visible range of a graf when its figure is
+    created again
+
+    Args :
+        - visibleRange (tuple of strings) start and end dates of the visible range
+
+    Return :
+        - (dict) x axis layout attributes
+
+
+    """
+
+    if visibleRange[0] is None:
+        return {}
+
+    return {'range': list(visibleRange)}
+
 
 
 #load ssap
@@ -87,6 +236,17 @@ auth = dash_auth.BasicAuth(
 server = app.server
 
 
+# one log line per callback (see instrumentation)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+
+# metrics of the app in the Prometheus text format
+@server.route('/metrics')
+def metrics():
+
+    return flask.Response(instrumentation.renderMetrics(), content_type=instrumentation.CONTENT_TYPE)
+
+
 
 # load the dash CSS
 app.css.append_css({'external_url': 'https://codepen.io/chriddyp/pen/bWLwgP.css'})
@@ -95,14 +255,20 @@ app.css.append_css({'external_url': 'https://codepen.io/chriddyp/pen/bWLwgP.css'
 app.css.append_css({"external_url": "https://codepen.io/chriddyp/pen/brPBPO.css"})
 
 # create a dictionary of the available portfolios
-availPortfolios = [{'label': 'regular', 'value': 'reg.json'},
-                    {'label': 'fiducie Amelie', 'value': 'fidAmelie.json'},
-                    {'label': 'test', 'value': 'fiDB.json'}]
+availPortfolios = [{'label': 'regular', 'value': 'reg.db'},
+                    {'label': 'fiducie Amelie', 'value': 'fidAmelie.db'},
+                    {'label': 'test', 'value': 'fiDB.db'}]
 
 
 
 # create a portfolio object for the first portfolio
-loadPortfolio('reg.json')
+loadPortfolio('reg.db')
+
+
+# cache of the figures already created (with the size of their payload). The figures are keyed by portfolio, version
+# of the price data and graf type so that they are created again when the price store advances to a new trading day
+FIGURE_CACHE_SIZE = 128
+figureCache = LruCache(FIGURE_CACHE_SIZE, name='figure')
 
 
 # app layout
@@ -122,10 +288,10 @@ app.layout = html.Div([
                 dcc.Dropdown(
                     id='portfolio_name_menu',
                     options=[
-                        {'label': 'regular', 'value': 'reg.json'},
-                        {'label': 'fiducie Amelie', 'value': 'fidAmelie.json'},
-                        {'label': 'test', 'value': 'fiDB.json'}],
-                    value='reg.json'
+                        {'label': 'regular', 'value': 'reg.db'},
+                        {'label': 'fiducie Amelie', 'value': 'fidAmelie.db'},
+                        {'label': 'test', 'value': 'fiDB.db'}],
+                    value='reg.db'
                     )
                 ],style={'width': '150px'}),
                 html.Br(),
@@ -199,13 +365,14 @@ app.layout = html.Div([
     Output(component_id='asset_menu', component_property='options'),
     [Input(component_id='portfolio_name_menu', component_property='value')]
 )
+@instrumentation.instrumentCallback('update_asset_menu_options')
 def update_asset_menu_options(input_value):
 
-    # load the selected portfolio
-    loadPortfolio(input_value)
+    # get the selected portfolio, it is only loaded if it is not already in the registry
+    portfolio = getPortfolio(input_value)
 
     # return to the asset selection menu the new list of assets in the menu form (labal and value)
-    return app.config['MENU']
+    return generate_assetMenu(portfolio)
 
 
 
@@ -214,11 +381,12 @@ def update_asset_menu_options(input_value):
     Output(component_id='asset_menu', component_property='value'),
     [Input(component_id='asset_menu', component_property='options')]
 )
+@instrumentation.instrumentCallback('update_asset_menu_value')
 def update_asset_menu_value(input_value):
 
 
-    # return to the asset selection menu the new list of assets in the menu form (labal and value)
-    return app.config['MENU'][0]['label']
+    # return to the asset selection menu the first asset of the new list of assets
+    return input_value[0]['label']
 
 
 
@@ -228,19 +396,49 @@ def update_asset_menu_value(input_value):
 @app.callback(
     Output(component_id='portfolio_graf', component_property='figure'),
     [Input(component_id='portfolio_graf_type', component_property='value'),
-     Input(component_id='portfolio_name_menu', component_property='value')]
+     Input(component_id='portfolio_name_menu', component_property='value'),
+     Input(component_id='portfolio_graf', component_property='relayoutData')]
 )
-def update_portfolio_graf(input_value1,input_value2):
+@instrumentation.instrumentCallback('update_portfolio_graf')
+def update_portfolio_graf(input_value1,input_value2,input_value3):
 
     # get the desired portfolio graf type value
     columnToGraf = input_value1
 
+    # get the visible date range of the graf (the graf is queried again when it is zoomed)
+    visibleRange = getVisibleRange(input_value3)
+
+    # get the figure from the cache, it is created only if it is not already in the cache
+    portfolio = getPortfolio(input_value2)
+    key = getFigureKey('portfolio_graf', input_value2, columnToGraf, visibleRange)
+
+    return getFigure('portfolio_graf', key, lambda: create_portfolio_graf(portfolio, columnToGraf, visibleRange))
+
+
+
+def create_portfolio_graf(portfolio, columnToGraf, visibleRange=(None, None)):
+    """
+    This helper method creates the graf of the performance of the assets of a portfolio. The traces are downsampled
+    according to the visible date range
+
+    Args :
+        - portfolio (Portfolio) portfolio to graf
+        - columnToGraf (string) column of the performance matrices to graf
+        - visibleRange (tuple of strings) start and end dates of the visible range (None if the whole graf is visible)
+
+    Return :
+        - (dict) plotly graf object
+
+
+    """
+
     # for each asset create a scatter (trace) object based on the selected graf type
     traces = []
-    for asset in app.config['PORT'].assets:
+    for asset in portfolio.assets:
+        values = downsample.downsampleSeries(asset.perfMatrix[columnToGraf], *visibleRange)
         tempTrace = go.Scatter(
-            x=asset.perfMatrix.index,
-            y=asset.perfMatrix[columnToGraf],
+            x=values.index,
+            y=values,
             mode='lines',
             name=asset.assetID)
 
@@ -273,7 +471,8 @@ def update_portfolio_graf(input_value1,input_value2):
                     ])
                 ),
                 type='date',
-                title='Date'
+                title='Date',
+                **getRangeLayout(visibleRange)
             ),
             #xaxis={'title': 'Date'},
             yaxis={'title': columnToGraf},
@@ -290,29 +489,59 @@ def update_portfolio_graf(input_value1,input_value2):
     Output(component_id='asset_graf', component_property='figure'),
     [Input(component_id='asset_menu', component_property='value'),
      Input(component_id='asset_graf_type', component_property='value'),
-     Input(component_id='portfolio_name_menu', component_property='value')]
+     Input(component_id='portfolio_name_menu', component_property='value'),
+     Input(component_id='asset_graf', component_property='relayoutData')]
 )
-def update_asset_graf(input_value1,input_value2,input_value3):
+@instrumentation.instrumentCallback('update_asset_graf')
+def update_asset_graf(input_value1,input_value2,input_value3,input_value4):
 
-    # get the asset index from input value 1
-    assetIdx = app.config['PORT'].getAssetIdx(input_value1)
+    # get the portfolio from input value 3
+    portfolio = getPortfolio(input_value3)
+
+    # get the asset from the portfolio with input value 1
+    asset = portfolio.getAsset(input_value1)
 
     # get the graf type from input value 2
     grafType = input_value2
 
-    # get the asset from the portfolio
-    asset = app.config['PORT'].assets[assetIdx]
+    # get the visible date range of the graf from input value 4 (the graf is queried again when it is zoomed)
+    visibleRange = getVisibleRange(input_value4)
+
+    # get the figure from the cache, it is created only if it is not already in the cache
+    key = getFigureKey('asset_graf', input_value3, asset.assetID, grafType, visibleRange)
+
+    return getFigure('asset_graf', key, lambda: create_asset_graf(asset, grafType, visibleRange))
+
+
+
+def create_asset_graf(asset, grafType, visibleRange=(None, None)):
+    """
+    This helper method creates the graf of the performance of an asset. The traces are downsampled according to the
+    visible date range
+
+    Args :
+        - asset (Asset) asset to graf
+        - grafType (string) column of the performance matrix to graf
+        - visibleRange (tuple of strings) start and end dates of the visible range (None if the whole graf is visible)
+
+    Return :
+        - (dict) plotly graf object
+
+
+    """
+
+    values = downsample.downsampleSeries(asset.perfMatrix[grafType], *visibleRange)
 
     # create the trace for the upper and down component of the graf
     trace_high = go.Scatter(
-        x=asset.perfMatrix.index,
-        y=asset.perfMatrix[grafType],
+        x=values.index,
+        y=values,
         line=dict(color='#17BECF'),
         opacity=0.8)
 
     trace_low = go.Scatter(
-        x=asset.perfMatrix.index,
-        y=asset.perfMatrix[grafType],
+        x=values.index,
+        y=values,
         line=dict(color='#7F7F7F'),
         opacity=0.8)
 
@@ -336,7 +565,8 @@ def update_asset_graf(input_value1,input_value2,input_value3):
             ),
             rangeslider=dict(),
             type='date',
-            title='Date'
+            title='Date',
+            **getRangeLayout(visibleRange)
         ),
         yaxis = {'title': grafType},
     )
@@ -352,13 +582,24 @@ def update_asset_graf(input_value1,input_value2,input_value3):
     [Input(component_id='portfolio_name_menu', component_property='value'),
      Input(component_id='portfolio_graf_type', component_property='value')]
 )
+@instrumentation.instrumentCallback('update_portfolio_table')
 def update_portfolio_table(input_value,input2):
 
-    return ff.create_table(app.config['PORT'].summary)
+    # get the table from the cache, it is created only if it is not already in the cache
+    portfolio = getPortfolio(input_value)
+    key = getFigureKey('portfolio_table', input_value)
+
+    return getFigure('portfolio_table', key, lambda: ff.create_table(portfolio.getSummaryTable()))
 
 
 if __name__ == '__main__':
 
+    # the prices are refreshed after each market close by a background thread (the worker process of the Procfile
+    # does it when the app is served by gunicorn). In debug mode the reloader runs the module in a parent process that
+    # only watches the files and in the child process that serves the app, the thread is only started in the child
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        priceRefresher.PriceRefresher(registry=portfolioRegistry.registry).start()
+
     app.run_server(debug=True)
 
 
@@ -14,6 +14,8 @@ import numpy as np
 import pandas as pd
 import datetime
 
+import performanceEngine
+
 
 class Asset(object):
     """
@@ -57,6 +59,9 @@ class Asset(object):
                 % Est Profit
                 Annual Return
         - annualReturn : (float) based on the simple return
+
+    Note : perfMatrix, perfVector and annualReturn are computed the first time they are read and are invalidated
+    when one of the purchase, sale or volume attributes is modified
         
         
     """
@@ -73,12 +78,98 @@ class Asset(object):
         self.percentOwnership = percentOwnership
         self.ticker = ticker
         self.feedType = feedType
-        self.perfMatrix = []
-        self.perfVector = []
-        self.annualReturn = []
 
-        # set the asset data that come from calculations
-        self.setAssetData()
+        # the asset data that come from calculations are only computed when they are first needed
+        self.invalidate()
+
+
+
+    def invalidate(self):
+        """
+        This method discards the asset data that come from calculations (perfMatrix, perfVector and annualReturn) so
+        that they are computed again the next time they are needed
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        self._perfMatrix = None
+        self._perfVector = None
+        self._annualReturn = None
+        self._anchors = None
+
+
+
+    def setInvalidatingAttribute(self, name, value):
+        """
+        This helper method sets an attribute on which the asset data depend and invalidates the asset data if the
+        value has changed
+
+        Args :
+            - name : (string) name of the attribute
+            - value : value of the attribute
+
+        Return :
+            - None
+        """
+
+        if not hasattr(self, name) or getattr(self, name) != value:
+            setattr(self, name, value)
+            self.invalidate()
+
+
+    # purchase, sale and volume attributes, setting one of them invalidates the asset data
+    purchaseDate = property(lambda self: self._purchaseDate,
+                            lambda self, value: self.setInvalidatingAttribute('_purchaseDate', value))
+
+    purchasePrice = property(lambda self: self._purchasePrice,
+                             lambda self, value: self.setInvalidatingAttribute('_purchasePrice', value))
+
+    saleDate = property(lambda self: self._saleDate,
+                        lambda self, value: self.setInvalidatingAttribute('_saleDate', value))
+
+    salePrice = property(lambda self: self._salePrice,
+                         lambda self, value: self.setInvalidatingAttribute('_salePrice', value))
+
+    volume = property(lambda self: self._volume,
+                      lambda self, value: self.setInvalidatingAttribute('_volume', value))
+
+
+
+    @property
+    def perfMatrix(self):
+
+        if self._perfMatrix is None:
+            self.setAssetData()
+
+        return self._perfMatrix
+
+
+    @property
+    def perfVector(self):
+
+        if self._perfVector is None:
+            self.setAssetData()
+
+        return self._perfVector
+
+
+    @property
+    def annualReturn(self):
+
+        if self._annualReturn is None:
+            self.setAssetData()
+
+        return self._annualReturn
+
+
+    @property
+    def anchors(self):
+
+        return self._anchors
 
 
     def calcAcquistionValue(self):
@@ -109,7 +200,7 @@ class Asset(object):
 
 
 
-    def calcAssetPerformanceMatrix(self,startDate,endDate):
+    def calcAssetPerformanceMatrix(self,startDate,endDate,histValues=None):
         """
         Calculates the asset performance matrix composed of the key performance indicators for each of the trading dates
         between the selected start and end dates :
@@ -122,6 +213,8 @@ class Asset(object):
         Args :
         - startDate : (string) start date of the extraction (format YY-MM-DD)
         - endDate : (string) end date of the extraction (format YY-MM-DD)
+        - histValues : (DataFrame) prices between the start and end dates when they have already been fetched (ex by
+        a batched request of the portfolio). If None the prices are requested from the feed
 
 
         Return :
@@ -129,38 +222,11 @@ class Asset(object):
         """
 
         # get the price data from the feed
-        perfMat = self.getHistoricalPrice(startDate, endDate)
-
-        # calculate the performance values for each time stamp
-        perfMat['Market'] = perfMat[['Close']] * self.volume
-        perfMat['Est Profit'] = perfMat['Market'] - self.calcAcquistionValue()
-        perfMat['% Est Profit'] = perfMat['Est Profit'] / self.calcAcquistionValue() * 100
-
-        # calculate the daily simple return
-        perfMat['RateReturn'] = perfMat['Adj Close'] / perfMat['Adj Close'].shift(1) - 1
+        if histValues is None:
+            histValues = self.getHistoricalPrice(startDate, endDate)
 
-        # calculate the elapsed time in years
-        perfMat['Time Delta'] = (perfMat.index.values - perfMat.index.values[0]) / np.timedelta64(1, 'D') / 365
-
-        #
-        perfMat['% Return'] = perfMat['Adj Close'] / perfMat[0:]['Adj Close'].values[0]
-
-        # calculate the annual return
-        perfMat['Annual Return'] = perfMat['% Return'] ** (1 / perfMat['Time Delta']) - 1
-
-
-        perfMat = perfMat.round(2)
-
-
-        # if the asset is sold then insert nans for the performance values
-        if self.saleDate != None:
-
-            perfMat.loc[self.saleDate:,'Market'] = np.nan
-            perfMat.loc[self.saleDate:,'Est Profit'] = np.nan
-            perfMat.loc[self.saleDate:,'% Est Profit'] = np.nan
-
-
-        return perfMat
+        # calculate the performance values with the vectorized engine, with the asset as a portfolio of one
+        return performanceEngine.calcPerformanceMatrices([self], [histValues])[0]
 
 
     def calcCurrentPerformanceVector(self):
@@ -182,23 +248,30 @@ class Asset(object):
         """
 
 
-        # get the last row of the performance matrix
-        perfVector = self.perfMatrix.iloc[[-1]]
-
-        # extract the desired columns
-        perfVector = perfVector[['Close', 'Market', 'Est Profit', '% Est Profit','Annual Return']]
-
-        # add other indicators
-        perfVector['Asset ID'] = self.assetID
-        perfVector['Purchase date'] = self.purchaseDate
-        perfVector['Purchase price'] = self.purchasePrice
-        perfVector['Volume'] = self.volume
-        perfVector['Acquisition'] = self.volume * self.purchasePrice
+        # get the last row of the performance matrix (a row of nans if the asset has no prices)
+        if len(self.perfMatrix) > 0:
+            lastRow = self.perfMatrix.iloc[-1]
+            dates = self.perfMatrix.index[-1:]
 
-
-        # reorganize the sequence of the indicators
-        perfVector = perfVector[['Asset ID','Purchase date','Purchase price','Volume','Acquisition','Close', 'Market',
-                                 'Est Profit', '% Est Profit', 'Annual Return']]
+        else:
+            lastRow = pd.Series(np.nan, index=self.perfMatrix.columns)
+            dates = pd.DatetimeIndex([self.getPerformanceDates()[1]], name=self.perfMatrix.index.name)
+
+        # the vector is built in one go rather than by assigning columns to a slice of the performance matrix, each
+        # of those assignments checks for a chained assignment (which runs the garbage collector)
+        perfVector = pd.DataFrame({'Asset ID': [self.assetID],
+                                   'Purchase date': [self.purchaseDate],
+                                   'Purchase price': [self.purchasePrice],
+                                   'Volume': [self.volume],
+                                   'Acquisition': [self.volume * self.purchasePrice],
+                                   'Close': [lastRow['Close']],
+                                   'Market': [lastRow['Market']],
+                                   'Est Profit': [lastRow['Est Profit']],
+                                   '% Est Profit': [lastRow['% Est Profit']],
+                                   'Annual Return': [lastRow['Annual Return']]},
+                                  index=dates,
+                                  columns=['Asset ID','Purchase date','Purchase price','Volume','Acquisition','Close',
+                                           'Market', 'Est Profit', '% Est Profit', 'Annual Return'])
 
 
         return perfVector
@@ -226,18 +299,17 @@ class Asset(object):
 
 
 
-    def setAssetData(self):
+    def getPerformanceDates(self):
         """
-        This method is called after the asset is created to set the perfMatrix and the perfVector 
-        
+        This method determines the start and end dates of the performance matrix of the asset
+
         Args :
             - None
 
         Return :
-            - None
+            - (tuple of strings) start and end dates of the performance matrix (format YY-MM-DD)
         """
 
-
         # determin the end date of the oerformance matrix based on the status of the asset. If the asset has already been
         # sold then the end date will correspond to the sale date, inf not then it is the last trading day
         if self.saleDate != None:
@@ -248,14 +320,134 @@ class Asset(object):
 
             endDate = datetime.datetime.now().strftime("%Y-%m-%d")
 
+        return self.purchaseDate, endDate
+
+
+
+    def setAssetData(self, histValues=None):
+        """
+        This method is called the first time the asset data are needed to set the perfMatrix and the perfVector
+        
+        Args :
+            - histValues : (DataFrame) prices of the asset when they have already been fetched. If None the prices are
+            requested from the feed
+
+        Return :
+            - None
+        """
+
+
+        startDate, endDate = self.getPerformanceDates()
+
+        # get the price data from the feed
+        if histValues is None:
+            histValues = self.getHistoricalPrice(startDate, endDate)
+
+
+        # calculate the performance matrix and the data that derive from it
+        self.setPerformanceMatrix(self.calcAssetPerformanceMatrix(startDate,endDate,histValues),
+                                  performanceEngine.getAnchors(histValues))
+
+
+
+    def setPerformanceMatrix(self, perfMatrix, anchors=None):
+        """
+        This method sets the perfMatrix of the asset when it has been calculated outside of the asset (ex by the
+        performance engine of the portfolio) and sets the data that derive from it
+
+        Args :
+            - perfMatrix : (DataFrame) performance matrix of the asset. None if the prices of the asset are not
+            available, the matrix is then empty
+            - anchors : (dict) anchor values of the prices of the performance matrix, needed to append new trading days
+            to the matrix (see performanceEngine.getAnchors)
+
+        Return :
+            - None
+        """
+
+        if perfMatrix is None:
+            perfMatrix = pd.DataFrame(columns=performanceEngine.PERF_COLUMNS, index=pd.DatetimeIndex([], name='Date'),
+                                      dtype=float)
 
-        # calculate the performance matrix
-        self.perfMatrix = self.calcAssetPerformanceMatrix(self.purchaseDate,endDate)
+        self._perfMatrix = perfMatrix
+        self._anchors = anchors
 
         # calculate the performace vector
-        self.perfVector = self.calcCurrentPerformanceVector()
+        self._perfVector = self.calcCurrentPerformanceVector()
 
         # get the annual return from the perfmatrix for the last trading day
-        self.annualReturn = self.perfMatrix[-1:]['Annual Return']
+        self._annualReturn = self.perfMatrix[-1:]['Annual Return']
+
+
+
+    def getLastPerformanceDate(self):
+        """
+        This method gets the last trading day of the perfMatrix, from which new trading days can be appended
+
+        Args :
+            - None
+
+        Return :
+            - (string) last trading day of the performance matrix (format YYYY-MM-DD). None if the matrix has not been
+            calculated yet or if new days can not be appended to it
+        """
+
+        if self._perfMatrix is None or self._anchors is None:
+            return None
+
+        return self._perfMatrix.index[-1].strftime('%Y-%m-%d')
+
+
+
+    def appendBars(self, newBars):
+        """
+        This method appends the prices of new trading days to the perfMatrix of the asset. Only the rows of the new
+        days are calculated, from the anchor values of the matrix, and the perfVector and annualReturn are updated. A
+        bar for the last day of the matrix replaces its last row (ex the final bar of a day first taken during the
+        trading day). The bars of older days are ignored
+
+        Args :
+            - newBars : (DataFrame) open, low, high, close, adj close and volume matrix of the new trading days
+
+        Return :
+            - None
+        """
+
+        # the matrix has not been calculated yet, the new days will be included when it is
+        if self._perfMatrix is None or self._anchors is None:
+            return
+
+        lastDate = self._perfMatrix.index[-1]
+        newBars = newBars[newBars.index >= lastDate]
+
+        if len(newBars) == 0:
+            return
+
+
+        # the last row of the matrix is replaced by the new bar of the same day
+        if newBars.index[0] == lastDate:
+
+            # the replaced row is the anchor of the matrix, it is calculated again from the new bars
+            if len(self._perfMatrix) == 1:
+                self.setAssetData(newBars)
+                return
+
+            perfMatrix = self._perfMatrix.iloc[:-1]
+            prevAdjClose = self._anchors['prevAdjClose']
+
+        else:
+
+            perfMatrix = self._perfMatrix
+            prevAdjClose = self._anchors['lastAdjClose']
+
+
+        newRows = performanceEngine.calcNewPerformanceRows(self, newBars, self._anchors, prevAdjClose)
+
+        # update the anchor values with the new last trading days
+        anchors = dict(self._anchors)
+        adjClose = newBars['Adj Close'].values
 
+        anchors['prevAdjClose'] = adjClose[-2] if len(adjClose) > 1 else prevAdjClose
+        anchors['lastAdjClose'] = adjClose[-1]
 
+        self.setPerformanceMatrix(pd.concat([perfMatrix, newRows]), anchors)
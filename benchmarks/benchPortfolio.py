@@ -0,0 +1,548 @@
+"""
+@author: Vincent Roy [*]
+
+This script benchmarks the loading and the computation of the portfolios. Synthetic portfolios (portfolio stores of
+common and preferred stock lots with histories of a few years) are generated with a synthetic price feed, served by
+the recorded feed backend (see feedBackends). Each portfolio size is run in its own process, so that its peak memory
+can be measured, and the time of each stage is recorded :
+
+    - load_cold : creation of the portfolio with an empty price store (feed, store, engine and summary)
+    - load_warm : creation of the portfolio with the prices already in the store
+    - fetch_prices : prices of all the assets (Portfolio.fetchHistoricalPrices)
+    - engine : performance matrices of all the assets (performanceEngine.calcPerformanceMatrices)
+    - asset_matrix : performance matrix of a sample of assets, one asset at a time (Asset.calcAssetPerformanceMatrix)
+    - summary : summary table of the portfolio (Portfolio.createSummaryTable and getSummaryTable)
+    - refresh : refresh of the prices of the portfolio (Portfolio.refreshPrices)
+    - snapshot_save, snapshot_load : snapshot of the portfolio (portfolioSnapshot)
+    - app_import : import of the app, which loads the portfolio through the registry
+    - callback_* : figures and tables of the callbacks of the app (skipped if dash is not installed)
+
+The results are written as JSON and two result files can be compared to catch the regressions
+
+usage :
+    python benchmarks/benchPortfolio.py [--sizes 10,100,1000,10000] [--years 1,20] [--output results.json]
+    python benchmarks/benchPortfolio.py --compare base.json new.json [--threshold 1.2]
+
+"""
+
+
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# default settings of the benchmark
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_YEARS = (1, 20)
+DEFAULT_THRESHOLD = 1.2
+
+# share of the lots that are sold and of the lots that are preferred stocks, number of lots per ticker
+SOLD_SHARE = 0.1
+PREFERRED_SHARE = 0.05
+LOTS_PER_TICKER = 5
+MAX_TICKERS = 100
+MAX_QUOTES = 20
+
+# number of assets of the asset_matrix stage
+NB_SAMPLE_ASSETS = 100
+
+# marker of the line of the results of a size in the output of its process
+RESULT_MARKER = 'BENCH_RESULT '
+
+# page of a synthetic quote
+QUOTE_PAGE = ('<html><body><div class="quote-price priceLarge"><span>%.2f</span></div>'
+              '<div class="quote-volume volumeLarge">Volume: %d</div></body></html>')
+
+
+
+def generateFeed(fixturesDir, nbTickers, nbQuotes, maxYears, seed):
+    """
+    This function generates the synthetic price feed : the yahoo prices of a set of tickers (random walks over the
+    trading days of the last maxYears years) and the pages of a set of quotes, in the layout of the recorded backend
+
+    Args :
+        - fixturesDir : (string) fixtures directory of the feed
+        - nbTickers : (int) number of tickers
+        - nbQuotes : (int) number of quotes
+        - maxYears : (int) number of years of the prices
+        - seed : (int) seed of the random generator
+
+    Return :
+        - (tuple of lists) tickers and urls of the quotes
+    """
+
+    import tradingCalendar
+
+    randomState = np.random.RandomState(seed)
+
+    today = datetime.datetime.now()
+    dates = tradingCalendar.getBusinessDays((today - datetime.timedelta(days=365 * maxYears + 30)).strftime('%Y-%m-%d'),
+                                            today.strftime('%Y-%m-%d'))
+
+    yahooDir = os.path.join(fixturesDir, 'yahoo')
+    pagesDir = os.path.join(fixturesDir, 'pages')
+
+    for directory in (yahooDir, pagesDir):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    tickers = ['SYN%03d.TO' % idx for idx in range(nbTickers)]
+
+    for ticker in tickers:
+
+        close = 20 * np.exp(np.cumsum(randomState.normal(0.0002, 0.015, len(dates))))
+        dividends = np.exp(np.cumsum(np.full(len(dates), 0.0001)))
+        adjClose = close * dividends / dividends[-1]
+
+        prices = pd.DataFrame({'Open': close * (1 + randomState.normal(0, 0.002, len(dates))),
+                               'High': close * 1.01, 'Low': close * 0.99, 'Close': close, 'Adj Close': adjClose,
+                               'Volume': randomState.randint(1000, 100000, len(dates)).astype(float)},
+                              index=pd.DatetimeIndex(dates, name='Date'),
+                              columns=['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'])
+
+        prices.round(4).to_csv(os.path.join(yahooDir, ticker + '.csv'))
+
+
+    urls = ['http://quotes.bench/quote/SYN%03d.PR.A' % idx for idx in range(nbQuotes)]
+    pageNames = {}
+
+    for idx, url in enumerate(urls):
+
+        pageNames[url] = 'quote_%03d.html' % idx
+
+        with open(os.path.join(pagesDir, pageNames[url]), 'w') as pageFile:
+            pageFile.write(QUOTE_PAGE % (randomState.uniform(15, 25), randomState.randint(0, 50000)))
+
+    with open(os.path.join(pagesDir, 'index.json'), 'w') as indexFile:
+        json.dump(pageNames, indexFile, indent=4, sort_keys=True)
+
+    return tickers, urls
+
+
+
+def generatePortfolio(portfolioDBFile, nbLots, tickers, urls, years, seed):
+    """
+    This function generates a synthetic portfolio database (portfolio store, see portfolioStore)
+
+    Args :
+        - portfolioDBFile : (string) database file of the portfolio
+        - nbLots : (int) number of lots of the portfolio
+        - tickers : (list of strings) tickers of the common stocks
+        - urls : (list of strings) urls of the quotes of the preferred stocks
+        - years : (tuple of ints) minimum and maximum number of years of the histories of the lots
+        - seed : (int) seed of the random generator
+
+    Return :
+        - None
+    """
+
+    from portfolioStore import PortfolioStore
+
+    generator = random.Random(seed)
+    today = datetime.datetime.now()
+
+    records = []
+
+    for idx in range(nbLots):
+
+        purchaseDate = today - datetime.timedelta(days=int(365 * generator.uniform(*years)))
+        isPreferred = generator.random() < PREFERRED_SHARE
+
+        saleDate = None
+        salePrice = None
+
+        if generator.random() < SOLD_SHARE:
+            saleDate = purchaseDate + datetime.timedelta(days=generator.randint(1, (today - purchaseDate).days))
+            saleDate = saleDate.strftime('%Y-%m-%d')
+            salePrice = round(generator.uniform(10, 40), 2)
+
+        records.append({'assetType': 'PREFFERED' if isPreferred else 'COMMON',
+                        'assetID': 'LOT-%05d' % idx,
+                        'purchaseDate': purchaseDate.strftime('%Y-%m-%d'),
+                        'purchasePrice': round(generator.uniform(10, 40), 2),
+                        'saleDate': saleDate,
+                        'salePrice': salePrice,
+                        'volume': generator.randint(10, 1000),
+                        'percentOwnership': 1,
+                        'priceFeedType': 'TMX' if isPreferred else 'YAHOO',
+                        'priceFeedRef': generator.choice(urls) if isPreferred else generator.choice(tickers),
+                        'debtFeedType': None,
+                        'debtFeedRef': None,
+                        'thresholds': []})
+
+    PortfolioStore(portfolioDBFile).insertMany(records, replace=True)
+
+
+
+def timeStage(results, stage, func):
+    """
+    This function runs and times a stage of the benchmark
+
+    Args :
+        - results : (dict) time of each stage (s)
+        - stage : (string) name of the stage
+        - func : (function) function without arguments that runs the stage
+
+    Return :
+        - result of the function
+    """
+
+    start = time.time()
+    value = func()
+    results[stage] = time.time() - start
+
+    return value
+
+
+
+def getPeakMemory():
+    """
+    This function gets the peak memory (resident set size) of the process
+
+    Args :
+        - None
+
+    Return :
+        - (float) peak memory (MB)
+    """
+
+    import resource
+
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # the peak memory is in kB on linux and in bytes on mac os
+    return maxRss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+
+def runSize(portfolioDBFile):
+    """
+    This function runs the stages of the benchmark on a portfolio. It is run in the process of the portfolio size, with
+    the recorded backend and an empty price store (see runProcess)
+
+    Args :
+        - portfolioDBFile : (string) database file of the portfolio
+
+    Return :
+        - (dict) time of each stage (s), peak memory (MB) and size of the portfolio
+    """
+
+    sys.path.insert(0, REPO_DIR)
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    from portfolio import Portfolio
+    import performanceEngine
+    import portfolioSnapshot
+    import tradingCalendar
+
+    stages = {}
+    payloads = {}
+
+    timeStage(stages, 'load_cold', lambda: Portfolio(portfolioDBFile))
+    portfolio = timeStage(stages, 'load_warm', lambda: Portfolio(portfolioDBFile))
+
+    prices = timeStage(stages, 'fetch_prices', portfolio.fetchHistoricalPrices)
+    timeStage(stages, 'engine', lambda: performanceEngine.calcPerformanceMatrices(portfolio.assets, prices))
+
+
+    def calcAssetMatrices():
+
+        for asset, assetPrices in list(zip(portfolio.assets, prices))[:NB_SAMPLE_ASSETS]:
+            asset.calcAssetPerformanceMatrix(*(asset.getPerformanceDates() + (assetPrices,)))
+
+    timeStage(stages, 'asset_matrix', calcAssetMatrices)
+    stages['asset_matrix_per_asset'] = stages['asset_matrix'] / max(min(len(portfolio.assets), NB_SAMPLE_ASSETS), 1)
+
+    timeStage(stages, 'summary', lambda: (portfolio.createSummaryTable(), portfolio.getSummaryTable()))
+    timeStage(stages, 'refresh', portfolio.refreshPrices)
+
+    snapshotDir = os.path.abspath('snapshots')
+    closingDay = tradingCalendar.getLastClosingDay()
+
+    timeStage(stages, 'snapshot_save', lambda: portfolioSnapshot.saveSnapshot(portfolio, closingDay, snapshotDir))
+    timeStage(stages, 'snapshot_load', lambda: portfolioSnapshot.loadSnapshot(portfolioDBFile, snapshotDir))
+
+
+    # the callbacks of the app, the app loads data/reg.db of the working directory (the portfolio)
+    try:
+        app = timeStage(stages, 'app_import', lambda: __import__('app'))
+
+    except ImportError:
+        app = None
+
+    if app is not None:
+
+        import plotly
+
+        asset = portfolio.assets[0]
+
+        figures = {'callback_asset_menu': lambda: app.generate_assetMenu(portfolio),
+                   'callback_portfolio_graf': lambda: app.create_portfolio_graf(portfolio, 'Market'),
+                   'callback_asset_graf': lambda: app.create_asset_graf(asset, 'Market'),
+                   'callback_portfolio_table': lambda: app.ff.create_table(portfolio.getSummaryTable())}
+
+        for stage, func in sorted(figures.items()):
+            figure = timeStage(stages, stage, func)
+            payloads[stage] = len(json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+    return {'stages': stages,
+            'payloadBytes': payloads,
+            'peakMemoryMB': getPeakMemory(),
+            'nbAssets': len(portfolio.assets),
+            'nbRows': int(sum(len(asset.perfMatrix) for asset in portfolio.assets))}
+
+
+
+def runProcess(portfolioDBFile, fixturesDir, workDir, latency):
+    """
+    This function runs the benchmark of a portfolio in a new process. The process works in its own directory with an
+    empty price store and reads the synthetic feed with the recorded backend
+
+    Args :
+        - portfolioDBFile : (string) database file of the portfolio
+        - fixturesDir : (string) fixtures directory of the synthetic feed
+        - workDir : (string) working directory of the process
+        - latency : (float) simulated latency of the feed (s)
+
+    Return :
+        - (dict) results of the portfolio (see runSize), or the error of the process if it failed
+    """
+
+    dataDir = os.path.join(workDir, 'data')
+
+    if os.path.exists(workDir):
+        shutil.rmtree(workDir)
+
+    os.makedirs(dataDir)
+
+    # the app loads data/reg.db at import and reads its credentials from data/ssap.txt
+    shutil.copy(portfolioDBFile, os.path.join(dataDir, 'reg.db'))
+
+    with open(os.path.join(dataDir, 'ssap.txt'), 'w') as ssapFile:
+        ssapFile.write('bench;bench\n')
+
+    env = dict(os.environ)
+    env.update({'FIPI_FEED_BACKEND': 'recorded',
+                'FIPI_FIXTURES_DIR': fixturesDir,
+                'FIPI_FEED_LATENCY': str(latency),
+                'FIPI_PRICE_STORE': os.path.join(dataDir, 'prices.db'),
+                'PYTHONPATH': REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')})
+
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run', portfolioDBFile],
+                               cwd=workDir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = process.communicate()
+
+    for line in output.decode('utf-8').splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+
+    return {'error': 'process failed with code %s : %s' % (process.returncode,
+                                                          errors.decode('utf-8').strip().splitlines()[-1:])}
+
+
+
+def getCommit():
+    """
+    This function gets the commit of the repository
+
+    Args :
+        - None
+
+    Return :
+        - (string) hash of the current commit. None if it is not available
+    """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR).decode('utf-8').strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def runBenchmark(sizes, years, latency, seed, workDir):
+    """
+    This function runs the benchmark : the synthetic feed and portfolios are generated and each portfolio size is run
+    in its own process
+
+    Args :
+        - sizes : (list of ints) number of lots of the portfolios
+        - years : (tuple of ints) minimum and maximum number of years of the histories of the lots
+        - latency : (float) simulated latency of the feed (s)
+        - seed : (int) seed of the random generators
+        - workDir : (string) working directory of the benchmark
+
+    Return :
+        - (dict) settings and results of the benchmark
+    """
+
+    sys.path.insert(0, REPO_DIR)
+
+    fixturesDir = os.path.join(workDir, 'fixtures')
+
+    nbTickers = min(max(max(sizes) // LOTS_PER_TICKER, 1), MAX_TICKERS)
+    nbQuotes = min(max(int(max(sizes) * PREFERRED_SHARE), 1), MAX_QUOTES)
+
+    tickers, urls = generateFeed(fixturesDir, nbTickers, nbQuotes, years[1], seed)
+
+    results = {}
+
+    for size in sizes:
+
+        portfolioDBFile = os.path.join(workDir, 'lots_%d.db' % size)
+        generatePortfolio(portfolioDBFile, size, tickers, urls, years, seed)
+
+        results[str(size)] = runProcess(portfolioDBFile, fixturesDir, os.path.join(workDir, 'run_%d' % size), latency)
+
+        printResult(size, results[str(size)])
+
+    return {'commit': getCommit(),
+            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {'sizes': sizes, 'years': list(years), 'latency': latency, 'seed': seed},
+            'results': results}
+
+
+
+def printResult(size, result):
+    """
+    This function prints the results of a portfolio size
+
+    Args :
+        - size : (int) number of lots of the portfolio
+        - result : (dict) results of the portfolio (see runSize)
+
+    Return :
+        - None
+    """
+
+    if 'error' in result:
+        print('%6d lots : %s' % (size, result['error']))
+        return
+
+    print('%6d lots : %d rows, peak memory %.0f MB' % (size, result['nbRows'], result['peakMemoryMB']))
+
+    for stage, value in sorted(result['stages'].items()):
+        print('    %-28s %10.4f s' % (stage, value))
+
+
+
+def compareResults(baseFile, newFile, threshold):
+    """
+    This function compares the results of two runs of the benchmark. A stage or a peak memory is a regression when it
+    is more than threshold times the base
+
+    Args :
+        - baseFile : (string) result file of the base run
+        - newFile : (string) result file of the new run
+        - threshold : (float) ratio from which a difference is a regression
+
+    Return :
+        - (int) number of regressions
+    """
+
+    with open(baseFile) as resultFile:
+        base = json.load(resultFile)
+
+    with open(newFile) as resultFile:
+        new = json.load(resultFile)
+
+    print('base %s (%s) / new %s (%s)' % (base.get('commit'), base.get('date'), new.get('commit'), new.get('date')))
+
+    nbRegressions = 0
+
+    for size in sorted(set(base['results']) & set(new['results']), key=int):
+
+        baseResult, newResult = base['results'][size], new['results'][size]
+
+        if 'error' in baseResult or 'error' in newResult:
+            print('%6s lots : not compared (%s)' % (size, newResult.get('error', baseResult.get('error'))))
+            continue
+
+        print('%6s lots' % size)
+
+        values = [(stage, baseResult['stages'][stage], newResult['stages'][stage], 's')
+                  for stage in sorted(set(baseResult['stages']) & set(newResult['stages']))]
+        values.append(('peak memory', baseResult['peakMemoryMB'], newResult['peakMemoryMB'], 'MB'))
+
+        for name, baseValue, newValue, unit in values:
+
+            ratio = newValue / baseValue if baseValue > 0 else float('inf')
+            isRegression = ratio > threshold
+
+            nbRegressions += isRegression
+
+            print('    %-28s %10.4f %s -> %10.4f %s  x%.2f%s' % (name, baseValue, unit, newValue, unit, ratio,
+                                                                   '  REGRESSION' if isRegression else ''))
+
+    return nbRegressions
+
+
+
+def main():
+
+    argParser = argparse.ArgumentParser(description='Benchmark of the loading and the computation of the portfolios')
+    argParser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                           help='number of lots of the portfolios (comma separated)')
+    argParser.add_argument('--years', default='%d,%d' % DEFAULT_YEARS,
+                           help='minimum and maximum number of years of the histories of the lots')
+    argParser.add_argument('--latency', type=float, default=0.0, help='simulated latency of the feed (s)')
+    argParser.add_argument('--seed', type=int, default=0, help='seed of the random generators')
+    argParser.add_argument('--output', help='result file (JSON)')
+    argParser.add_argument('--workdir', help='working directory, a temporary directory is used if not set')
+    argParser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two result files')
+    argParser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                           help='ratio from which a difference is a regression')
+    argParser.add_argument('--run', help=argparse.SUPPRESS)
+    args = argParser.parse_args()
+
+
+    # process of a portfolio size
+    if args.run is not None:
+        print(RESULT_MARKER + json.dumps(runSize(args.run)))
+        return
+
+
+    if args.compare is not None:
+        sys.exit(1 if compareResults(args.compare[0], args.compare[1], args.threshold) > 0 else 0)
+
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    years = tuple(float(year) for year in args.years.split(','))
+
+    workDir = args.workdir or tempfile.mkdtemp(prefix='benchPortfolio')
+
+    try:
+        benchmark = runBenchmark(sizes, years, args.latency, args.seed, os.path.abspath(workDir))
+
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as resultFile:
+            json.dump(benchmark, resultFile, indent=4, sort_keys=True)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+@author: Vincent Roy [*]
+
+This script benchmarks the extraction of the quotes from the saved quote pages of data/fixtures/pages. Each page is
+parsed with the BeautifulSoup extraction that the quote feed used to do (whole tree of the page) and with the
+extractors of quoteParser, the two must give the same quote. The CPU time per quote of each method is printed
+
+usage : python benchmarks/benchQuoteParser.py [--repeat N] [--pages DIR]
+
+"""
+
+
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import quoteParser
+
+
+# directory of the saved pages, the name of a page starts with the prefix of its feed type (ex tmx_BCE.PR.Q.html)
+DEFAULT_PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'fixtures', 'pages')
+
+# default number of times each page is parsed
+DEFAULT_REPEAT = 20
+
+# cpu time of the process
+processTime = getattr(time, 'process_time', None) or time.clock
+
+
+
+def soupParseTmxPage(page):
+    """
+    This function extracts the quote from a TMX quote page by building the whole tree of the page (reference method)
+
+    Args :
+        - page : (string) content of the page
+
+    Return :
+        - (tuple of floats) price and volume of the quote
+    """
+
+    parsedPage = BeautifulSoup(page, 'lxml')
+
+    stockPrice = float(parsedPage.find('div', attrs={'class': 'quote-price priceLarge'}).find('span').text)
+
+    volume = parsedPage.find('div', attrs={'class': 'quote-volume volumeLarge'}).text.strip()[8:].strip()
+    volume = float(volume.replace(',', ''))
+
+    return stockPrice, volume
+
+
+
+def soupParsePrefStockChannelPage(page):
+    """
+    This function extracts the quote from a preferred stock channel page by building the whole tree of the page
+    (reference method)
+
+    Args :
+        - page : (string) content of the page
+
+    Return :
+        - (tuple of floats) price and volume of the quote
+    """
+
+    parsedPage = BeautifulSoup(page, 'lxml')
+
+    categories = parsedPage.find_all('td', attrs={'class': 'dsty'})
+
+    for idx in range(len(categories)):
+        if categories[idx].text == 'Recent Market Price:':
+            break
+
+    stockPrice = parsedPage.find_all('td', attrs={'class': 'dstyb'})[idx].text
+
+    return float(stockPrice.strip('$')), 1
+
+
+
+# reference and lightweight parser of each feed type prefix
+PARSERS = {'tmx': (soupParseTmxPage, quoteParser.parseTmxPage),
+           'psc': (soupParsePrefStockChannelPage, quoteParser.parsePrefStockChannelPage)}
+
+
+
+def timeParser(parser, page, repeat):
+    """
+    This function measures the CPU time of a parser on a page
+
+    Args :
+        - parser : (function) parser of the page
+        - page : (string) content of the page
+        - repeat : (int) number of times the page is parsed
+
+    Return :
+        - (float) CPU time per parse (ms)
+    """
+
+    start = processTime()
+
+    for _ in range(repeat):
+        parser(page)
+
+    return (processTime() - start) / repeat * 1000
+
+
+
+def main():
+
+    argParser = argparse.ArgumentParser(description='Benchmark of the extraction of the quotes from the quote pages')
+    argParser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='number of times each page is parsed')
+    argParser.add_argument('--pages', default=DEFAULT_PAGES_DIR, help='directory of the saved pages')
+    args = argParser.parse_args()
+
+    print('%-28s %10s %12s %12s %8s' % ('page', 'size (kB)', 'soup (ms)', 'lxml (ms)', 'speedup'))
+
+    totals = [0.0, 0.0]
+
+    for fileName in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+
+        name = os.path.basename(fileName)
+        prefix = name.split('_')[0]
+
+        if prefix not in PARSERS:
+            continue
+
+        with open(fileName, 'rb') as pageFile:
+            page = pageFile.read().decode('utf-8')
+
+        soupParser, lightParser = PARSERS[prefix]
+
+        # both methods must extract the same quote
+        if soupParser(page) != lightParser(page):
+            raise AssertionError('The quotes of %s differ : %s != %s' % (name, soupParser(page), lightParser(page)))
+
+        times = [timeParser(soupParser, page, args.repeat), timeParser(lightParser, page, args.repeat)]
+        totals = [total + value for total, value in zip(totals, times)]
+
+        print('%-28s %10.1f %12.2f %12.2f %7.1fx' % (name, len(page) / 1024.0, times[0], times[1], times[0] / times[1]))
+
+    if totals[1] > 0:
+        print('%-28s %10s %12.2f %12.2f %7.1fx' % ('total', '', totals[0], totals[1], totals[0] / totals[1]))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,682 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the bulk import of the lots of an account from a csv file (ex an account export of a broker).
+The columns of the file are matched to the attributes of the lots by their usual names (ex Symbol, Quantity, Trade
+Date), the lines before the header of the file are skipped and the values are converted (dates, amounts with currency
+signs, thousands separators and decimal commas, asset types). All the rows are validated in one batch and each invalid
+row is reported with its line and its error. The lots are then written at once : in a single transaction for a
+portfolio store or in a single write for a TinyDB portfolio
+
+usage : python bulkImport.py IMPORT_FILE DB_FILE [--replace] [--skip-invalid] [--dry-run] [--date-format FORMAT]
+
+"""
+
+
+from __future__ import print_function
+
+import io
+import re
+import sys
+import csv
+import codecs
+import argparse
+import datetime
+
+import pandas as pd
+from tinydb import TinyDB
+
+import portfolioStore
+
+
+# attributes of the lots that the import file can set and the normalized column names that match each of them, from
+# the most to the least specific (ex the average cost of a position is its purchase price rather than its last price)
+COLUMN_ALIASES = {'assetID': ['assetid', 'id', 'lotid', 'lot', 'lotnumber'],
+                  'assetType': ['assettype', 'type', 'securitytype', 'assetclass', 'class'],
+                  'purchaseDate': ['purchasedate', 'tradedate', 'acquisitiondate', 'acquireddate', 'dateacquired',
+                                   'opendate', 'date'],
+                  'purchasePrice': ['purchaseprice', 'unitcost', 'costpershare', 'averagecost', 'avgcost',
+                                    'bookvalueperunit', 'costbasisperunit', 'price'],
+                  'saleDate': ['saledate', 'solddate', 'closedate', 'datesold'],
+                  'salePrice': ['saleprice', 'soldprice', 'closeprice', 'proceedsperunit'],
+                  'volume': ['volume', 'quantity', 'qty', 'shares', 'units', 'nbshares'],
+                  'percentOwnership': ['percentownership', 'ownership', 'ownershippercent', 'percentowned'],
+                  'priceFeedType': ['pricefeedtype', 'feedtype', 'feed'],
+                  'priceFeedRef': ['pricefeedref', 'symbol', 'ticker', 'feedref', 'url', 'valuationsfile'],
+                  'debtFeedType': ['debtfeedtype'],
+                  'debtFeedRef': ['debtfeedref']}
+
+# attributes that must be in the import file
+REQUIRED_COLUMNS = ['priceFeedRef', 'purchaseDate', 'purchasePrice', 'volume']
+
+# asset types of the portfolios and the normalized values of the import file that match each of them
+ASSET_TYPE_ALIASES = {'COMMON': ['common', 'stock', 'stocks', 'equity', 'commonstock', 'cs'],
+                      'PREFFERED': ['preffered', 'preferred', 'pref', 'pfd', 'preferredstock', 'ps'],
+                      'REAL': ['real', 'realestate', 'property']}
+
+# default price feed type of each asset type (the preferred stocks are matched on the host of their url)
+DEFAULT_FEED_TYPES = {'COMMON': 'YAHOO', 'REAL': 'ARCHIVED'}
+QUOTE_FEED_HOSTS = {'tmxmoney.com': 'TMX', 'preferredstockchannel.com': 'PREFSTOCKCHANNEL'}
+
+# minimum number of known columns of the header line, number of lines in which it is searched and delimiters tried
+MIN_HEADER_COLUMNS = 3
+MAX_HEADER_LINE = 50
+DELIMITERS = [',', ';', '\t', '|']
+
+# decimal mark of the amounts of the files of each delimiter (the files delimited by semicolons are the exports of the
+# locales that write decimal commas)
+DECIMAL_MARKS = {',': '.', ';': ','}
+
+# numeric dates whose day and month can be in either order (ex 03/02/2018, 23.02.18) and attributes that are dates
+NUMERIC_DATE = re.compile(r'(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})$')
+DATE_COLUMNS = ['purchaseDate', 'saleDate']
+
+# characters of the amounts that are not part of the number : currency signs and spaces (including the non breaking
+# spaces that separate the thousands in French)
+AMOUNT_IGNORED = u'$\u20ac\xa3 \xa0\u202f'
+
+
+
+class ImportReport(object):
+    """
+    This class is the report of an import : the lots that were read from the import file and the errors of the rows
+    that could not be read
+
+
+    Attributes :
+
+        - records : (list of dicts) records of the valid lots in the order of the file
+        - errors : (list of tuples) line number in the import file and message of each invalid row
+        - nbWritten : (int) number of lots written to the portfolio
+
+    """
+
+    def __init__(self):
+
+        self.records = []
+        self.errors = []
+        self.nbWritten = 0
+
+
+
+def normalizeName(name):
+    """
+    This helper function normalizes a column name or a value for the matching of the aliases : lower case, without
+    spaces and punctuation
+
+    Args :
+        - name : (string) name to normalize
+
+    Return :
+        - (string) normalized name
+    """
+
+    return re.sub('[^a-z0-9]', '', name.strip().lower())
+
+
+
+def mapColumns(header):
+    """
+    This function matches the columns of the header of an import file to the attributes of the lots. When several
+    columns match an attribute, the column of its most specific alias is used. The unknown columns are ignored
+
+    Args :
+        - header : (list of strings) names of the columns
+
+    Return :
+        - (dict) attribute of the lots of each matched column index
+    """
+
+    aliases = dict((alias, (name, rank)) for name, names in COLUMN_ALIASES.items() for rank, alias in enumerate(names))
+
+    # rank of the alias and index of the best column of each attribute
+    bestColumns = {}
+
+    for idx, columnName in enumerate(header):
+
+        name, rank = aliases.get(normalizeName(columnName), (None, None))
+
+        if name is not None and (name not in bestColumns or rank < bestColumns[name][0]):
+            bestColumns[name] = (rank, idx)
+
+    return dict((idx, name) for name, (rank, idx) in bestColumns.items())
+
+
+
+def readLines(importFile):
+    """
+    This function reads the lines of an import file as unicode text. The file is decoded as UTF-8, with or without a
+    byte order mark (as Excel writes it), and split on its line breaks only, so that the values of the file that span
+    several lines (quoted values with line breaks) keep their line breaks
+
+    Args :
+        - importFile : (string) name of the csv file
+
+    Return :
+        - (list of unicode strings) lines of the file, with their line breaks
+
+    Raise :
+        - (ValueError) if the file is not UTF-8 text
+    """
+
+    with open(importFile, 'rb') as csvFile:
+        content = csvFile.read()
+
+    if content.startswith(codecs.BOM_UTF8):
+        content = content[len(codecs.BOM_UTF8):]
+
+    try:
+        text = content.decode('utf-8')
+
+    except UnicodeDecodeError as error:
+        raise ValueError('%s is not a UTF-8 file (line %d), save it as CSV UTF-8' %
+                         (importFile, content.count(b'\n', 0, error.start) + 1))
+
+    return list(io.StringIO(text, newline=''))
+
+
+
+def splitLines(lines, delimiter):
+    """
+    This helper function splits lines of an import file into rows of values. A quoted value can span several lines,
+    the number of the first line of each row is given by the csv reader. The csv module of python 2 only reads byte
+    strings, the lines are then encoded as UTF-8 and the values decoded
+
+    Args :
+        - lines : (list of unicode strings) lines to split, with their line breaks
+        - delimiter : (string) delimiter of the values
+
+    Return :
+        - (list of tuples) number of the first line of each row in the lines (starting at 1) and its values (unicode
+        strings)
+
+    Raise :
+        - (csv.Error) if a quoted value is not closed
+    """
+
+    isBytes = sys.version_info[0] < 3
+
+    reader = csv.reader((line.encode('utf-8') for line in lines) if isBytes else iter(lines), delimiter=delimiter)
+
+    rows = []
+
+    while True:
+
+        lineNumber = reader.line_num + 1
+
+        try:
+            row = next(reader)
+
+        except StopIteration:
+            return rows
+
+        rows.append((lineNumber, [value.decode('utf-8') for value in row] if isBytes else row))
+
+
+
+def readRows(importFile):
+    """
+    This function reads the rows of an import file. The header is the first line that names enough attributes of the
+    lots with one of the delimiters, the lines before it (ex the account number and date of a broker export) are
+    skipped
+
+    Args :
+        - importFile : (string) name of the csv file (UTF-8)
+
+    Return :
+        - (tuple) attribute of the lots of each matched column index (see mapColumns), line number in the file and
+        values (unicode strings) of each row and delimiter of the file
+
+    Raise :
+        - (ValueError) if the file is not UTF-8 text, if its header is not found or does not have the required
+        columns or if a quoted value is not closed
+    """
+
+    lines = readLines(importFile)
+
+    header = None
+
+    for headerIdx, line in enumerate(lines[:MAX_HEADER_LINE]):
+
+        for delimiter in DELIMITERS:
+
+            # a line before the header can not be read as csv (ex an unclosed quote)
+            try:
+                values = splitLines([line], delimiter)
+
+            except csv.Error:
+                continue
+
+            columns = mapColumns(values[0][1] if len(values) > 0 else [])
+
+            if len(columns) >= MIN_HEADER_COLUMNS:
+                header = line
+                break
+
+        if header is not None:
+            break
+
+    if header is None:
+        raise ValueError('No header found in %s' % importFile)
+
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns.values()]
+
+    if len(missing) > 0:
+        raise ValueError('The columns of %s are missing from %s' % (', '.join(missing), importFile))
+
+    try:
+        rows = splitLines(lines[headerIdx + 1:], delimiter)
+
+    except csv.Error as error:
+        raise ValueError('%s can not be read : %s' % (importFile, error))
+
+    # the empty lines (ex at the end of the exports) are skipped
+    requiredIdx = [idx for idx, name in columns.items() if name in REQUIRED_COLUMNS]
+
+    return columns, [(headerIdx + 1 + lineNumber, row) for lineNumber, row in rows
+                     if any(idx < len(row) and row[idx].strip() != '' for idx in requiredIdx)], delimiter
+
+
+
+def getDayFirst(values):
+    """
+    This function determines the order of the day and the month of the numeric dates of an import file, from the dates
+    where one of the two is above 12. The order is the same for the whole file
+
+    Args :
+        - values : (list of strings) dates of the file
+
+    Return :
+        - (bool) True if the day is first, False if the month is first. None if no date tells
+
+    Raise :
+        - (ValueError) if some dates have the day first and others the month first
+    """
+
+    dayFirst = set()
+
+    for value in values:
+
+        match = NUMERIC_DATE.match(value.strip())
+
+        if match is not None and max(int(match.group(1)), int(match.group(2))) > 12:
+            dayFirst.add(int(match.group(1)) > 12)
+
+    if len(dayFirst) > 1:
+        raise ValueError('The dates of the file are both day/month and month/day, give the date format')
+
+    return dayFirst.pop() if len(dayFirst) > 0 else None
+
+
+
+def parseDate(value, dayFirst=None, dateFormat=None):
+    """
+    This helper function converts a date of the import file
+
+    Args :
+        - value : (string) date (ex 2018-02-23, 02/23/2018, 23/02/2018, 23 Feb 2018 or 20180223)
+        - dayFirst : (bool) True if the day of the numeric dates is first, False if the month is first (see
+        getDayFirst). If None the numeric dates where the day and the month could be swapped are invalid
+        - dateFormat : (string) format of the dates of the file (ex %d/%m/%Y). If None the format is guessed
+
+    Return :
+        - (string) date formatted as YYYY-MM-DD
+
+    Raise :
+        - (ValueError) if the value is not a date or if its day and month can not be told apart
+    """
+
+    value = value.strip()
+    match = NUMERIC_DATE.match(value) if dateFormat is None else None
+
+    if match is not None:
+
+        first, second = int(match.group(1)), int(match.group(2))
+
+        if dayFirst is None and first != second and max(first, second) <= 12:
+            raise ValueError('%s is ambiguous (day/month or month/day), give the date format' % value)
+
+    try:
+        if dateFormat is not None:
+            return datetime.datetime.strptime(value, dateFormat).strftime('%Y-%m-%d')
+
+        if match is None:
+            return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+        day, month = (first, second) if dayFirst or (dayFirst is None and first > 12) else (second, first)
+
+        # the two digit years are read as by strptime (69 to 99 are 19xx)
+        year = datetime.datetime.strptime(match.group(3), '%Y' if len(match.group(3)) == 4 else '%y').year
+
+        return datetime.date(year, month, day).strftime('%Y-%m-%d')
+
+    except (ValueError, TypeError, OverflowError):
+        raise ValueError('%s is not a date' % value)
+
+
+
+def parseAmount(value, decimalMark=None):
+    """
+    This helper function converts an amount of the import file. The decimal mark of the amount is its last comma or
+    period, unless that mark is followed by exactly three digits : the mark can then also separate the thousands (ex
+    1,234) and the decimal mark of the file decides
+
+    Args :
+        - value : (string) amount, optionally with a currency sign, thousands separators or a percent sign (ex
+        $1,234.50, 1 234,50 $ or 50%)
+        - decimalMark : (string) decimal mark of the file ('.' or ','). If None the amounts that could be written with
+        either mark are invalid
+
+    Return :
+        - (float) amount, a percentage is converted to a fraction
+
+    Raise :
+        - (ValueError) if the value is not an amount or if its decimal mark can not be determined
+    """
+
+    amount = value.strip()
+
+    for char in AMOUNT_IGNORED:
+        amount = amount.replace(char, '')
+
+    isPercent = amount.endswith('%')
+    amount = amount.rstrip('%')
+
+    marks = [char for char in amount if char in ',.']
+
+    # the decimal mark is the last mark, a mark that is repeated only separates the thousands
+    if len(marks) == 0 or marks.count(marks[-1]) > 1:
+        decimal = None
+
+    elif len(set(marks)) > 1 or len(amount) - amount.rindex(marks[-1]) - 1 != 3:
+        decimal = marks[-1]
+
+    elif decimalMark is not None:
+        decimal = marks[-1] if marks[-1] == decimalMark else None
+
+    else:
+        raise ValueError('%s is ambiguous, the decimal mark of the file is not known' % value)
+
+    thousands = set(marks) - set([decimal])
+
+    if len(thousands) > 1:
+        raise ValueError('%s is not an amount' % value)
+
+    thousands = thousands.pop() if len(thousands) > 0 else None
+
+    integerPattern = r'\d+' if thousands is None else r'\d{1,3}(%s\d{3})*' % re.escape(thousands)
+    decimalPattern = '' if decimal is None else r'(%s\d*)?' % re.escape(decimal)
+
+    if re.match(r'-?%s%s$' % (integerPattern, decimalPattern), amount) is None:
+        raise ValueError('%s is not an amount' % value)
+
+    if thousands is not None:
+        amount = amount.replace(thousands, '')
+
+    amount = float(amount.replace(decimal, '.') if decimal is not None else amount)
+
+    return amount / 100 if isPercent else amount
+
+
+
+def parseAssetType(value):
+    """
+    This helper function converts an asset type of the import file
+
+    Args :
+        - value : (string) asset type (ex Stock, Preferred or COMMON)
+
+    Return :
+        - (string) asset type of the portfolios
+
+    Raise :
+        - (ValueError) if the value is not a known asset type
+    """
+
+    name = normalizeName(value)
+
+    for assetType, aliases in ASSET_TYPE_ALIASES.items():
+        if name in aliases:
+            return assetType
+
+    raise ValueError('%s is not a known asset type' % value)
+
+
+
+def getDefaultFeedType(assetType, priceFeedRef):
+    """
+    This helper function gets the price feed type of a lot when the import file does not give it
+
+    Args :
+        - assetType : (string) asset type of the lot
+        - priceFeedRef : (string) price feed reference of the lot (ticker, url or csv file)
+
+    Return :
+        - (string) price feed type of the lot
+
+    Raise :
+        - (ValueError) if the price feed type can not be determined
+    """
+
+    if assetType in DEFAULT_FEED_TYPES:
+        return DEFAULT_FEED_TYPES[assetType]
+
+    for host, feedType in QUOTE_FEED_HOSTS.items():
+        if host in priceFeedRef:
+            return feedType
+
+    raise ValueError('The price feed type of %s is not given' % priceFeedRef)
+
+
+
+def parseRow(row, columns, decimalMark=None, dayFirst=None, dateFormat=None):
+    """
+    This function converts a row of the import file to the record of a lot and validates it
+
+    Args :
+        - row : (list of strings) values of the row
+        - columns : (dict) attribute of the lots of each matched column index (see mapColumns)
+        - decimalMark : (string) decimal mark of the amounts of the file (see parseAmount)
+        - dayFirst : (bool) order of the day and the month of the numeric dates of the file (see parseDate)
+        - dateFormat : (string) format of the dates of the file. If None the format is guessed
+
+    Return :
+        - (dict) record of the lot, without an asset ID if the file does not give it
+
+    Raise :
+        - (ValueError) if a value is missing or invalid
+    """
+
+    values = dict((name, row[idx].strip()) for idx, name in columns.items() if idx < len(row) and row[idx].strip())
+
+    for name in REQUIRED_COLUMNS:
+        if name not in values:
+            raise ValueError('The %s is missing' % name)
+
+    record = {'assetID': values.get('assetID'),
+              'assetType': parseAssetType(values['assetType']) if 'assetType' in values else 'COMMON',
+              'purchaseDate': parseDate(values['purchaseDate'], dayFirst, dateFormat),
+              'purchasePrice': parseAmount(values['purchasePrice'], decimalMark),
+              'saleDate': parseDate(values['saleDate'], dayFirst, dateFormat) if 'saleDate' in values else None,
+              'salePrice': parseAmount(values['salePrice'], decimalMark) if 'salePrice' in values else None,
+              'volume': parseAmount(values['volume'], decimalMark),
+              'percentOwnership': parseAmount(values['percentOwnership'], decimalMark) if 'percentOwnership' in values
+                                  else 1,
+              'priceFeedType': values.get('priceFeedType'),
+              'priceFeedRef': values['priceFeedRef'],
+              'debtFeedType': values.get('debtFeedType'),
+              'debtFeedRef': values.get('debtFeedRef'),
+              'thresholds': []}
+
+    if record['priceFeedType'] is None:
+        record['priceFeedType'] = getDefaultFeedType(record['assetType'], record['priceFeedRef'])
+
+    if record['volume'] <= 0:
+        raise ValueError('The volume must be positive')
+
+    if record['purchasePrice'] < 0:
+        raise ValueError('The purchase price can not be negative')
+
+    if not 0 < record['percentOwnership'] <= 1:
+        raise ValueError('The ownership must be between 0 and 100%')
+
+    if (record['saleDate'] is None) != (record['salePrice'] is None):
+        raise ValueError('A sold lot needs both a sale date and a sale price')
+
+    if record['saleDate'] is not None and record['saleDate'] < record['purchaseDate']:
+        raise ValueError('The lot is sold before it is purchased')
+
+    return record
+
+
+
+def readLots(importFile, existingIDs=(), dateFormat=None):
+    """
+    This function reads and validates all the lots of an import file. The lots without an asset ID are named after
+    their price feed reference and their line in the file, and an asset ID can not be repeated in the file nor already
+    be in the portfolio. Unless the date format is given, the order of the day and the month of the dates is
+    determined once for the whole file
+
+    Args :
+        - importFile : (string) name of the csv file
+        - existingIDs : (set of strings) asset IDs already in the portfolio
+        - dateFormat : (string) format of the dates of the file (ex %d/%m/%Y). If None the format is guessed
+
+    Return :
+        - (ImportReport) records of the valid lots and errors of the invalid rows
+
+    Raise :
+        - (ValueError) if the header of the file is not found or does not have the required columns, or if its dates
+        are in both the day/month and the month/day orders
+    """
+
+    columns, rows, delimiter = readRows(importFile)
+
+    dateIdx = [idx for idx, name in columns.items() if name in DATE_COLUMNS]
+    dayFirst = None
+
+    if dateFormat is None:
+        dayFirst = getDayFirst([row[idx] for lineNumber, row in rows for idx in dateIdx if idx < len(row)])
+
+    report = ImportReport()
+    assetIDs = set(existingIDs)
+
+    for lineNumber, row in rows:
+
+        try:
+            record = parseRow(row, columns, DECIMAL_MARKS.get(delimiter), dayFirst, dateFormat)
+
+        # the message is unicode when it quotes a value of the file
+        except ValueError as error:
+            report.errors.append((lineNumber, error.args[0]))
+            continue
+
+        if record['assetID'] is None:
+            record['assetID'] = '%s-%d' % (record['priceFeedRef'], lineNumber)
+
+        if record['assetID'] in assetIDs:
+            report.errors.append((lineNumber, 'The asset ID %s is already used' % record['assetID']))
+            continue
+
+        assetIDs.add(record['assetID'])
+        report.records.append(record)
+
+    return report
+
+
+
+def writeLots(portfolioDBFile, records, replace=False):
+    """
+    This function writes a batch of lots to a portfolio at once : in a single transaction for a portfolio store or in
+    a single write for a TinyDB portfolio
+
+    Args :
+        - portfolioDBFile : (string) name of the database file of the portfolio
+        - records : (list of dicts) records of the lots
+        - replace : (bool) True to replace all the lots of the portfolio by the batch
+
+    Return :
+        - (int) number of lots written
+    """
+
+    if portfolioStore.isPortfolioStore(portfolioDBFile):
+        return portfolioStore.PortfolioStore(portfolioDBFile).insertMany(records, replace)
+
+    db = TinyDB(portfolioDBFile)
+
+    try:
+
+        if replace:
+            db.purge()
+
+        db.insert_multiple(records)
+
+    finally:
+        db.close()
+
+    return len(records)
+
+
+
+def importLots(importFile, portfolioDBFile, replace=False, skipInvalid=False, dryRun=False, dateFormat=None):
+    """
+    This function imports the lots of an import file to a portfolio. The lots are only written if all the rows are
+    valid, unless the invalid rows are skipped
+
+    Args :
+        - importFile : (string) name of the csv file
+        - portfolioDBFile : (string) name of the database file of the portfolio
+        - replace : (bool) True to replace all the lots of the portfolio by the imported lots
+        - skipInvalid : (bool) True to write the valid lots when some rows are invalid
+        - dryRun : (bool) True to validate the lots without writing them
+        - dateFormat : (string) format of the dates of the file (ex %d/%m/%Y). If None the format is guessed
+
+    Return :
+        - (ImportReport) records of the valid lots, errors of the invalid rows and number of lots written
+
+    Raise :
+        - (ValueError) if the header of the file is not found or does not have the required columns, if its dates are
+        in both the day/month and the month/day orders or if the lots conflict with the lots of the portfolio
+    """
+
+    existingIDs = set() if replace else set(record['assetID'] for record in portfolioStore.readRecords(portfolioDBFile))
+
+    report = readLots(importFile, existingIDs, dateFormat)
+
+    if dryRun or (len(report.errors) > 0 and not skipInvalid):
+        return report
+
+    report.nbWritten = writeLots(portfolioDBFile, report.records, replace)
+
+    return report
+
+
+
+
+if __name__ == '__main__':
+
+    argParser = argparse.ArgumentParser(description='Bulk import of the lots of an account to a portfolio')
+    argParser.add_argument('importFile', help='csv file of the lots (ex a broker export)')
+    argParser.add_argument('portfolioDBFile', help='database file of the portfolio')
+    argParser.add_argument('--replace', action='store_true', help='replace all the lots of the portfolio')
+    argParser.add_argument('--skip-invalid', action='store_true', help='import the valid lots if some rows are invalid')
+    argParser.add_argument('--dry-run', action='store_true', help='validate the lots without writing them')
+    argParser.add_argument('--date-format', help='format of the dates (ex %%d/%%m/%%Y), guessed if not given')
+    args = argParser.parse_args()
+
+    try:
+        importReport = importLots(args.importFile, args.portfolioDBFile, args.replace, args.skip_invalid, args.dry_run,
+                                  args.date_format)
+
+    except ValueError as error:
+        sys.exit(str(error))
+
+    for lineNumber, message in importReport.errors:
+        print('line %d : %s' % (lineNumber, message if isinstance(message, str) else message.encode('utf-8')))
+
+    print('%d valid lots, %d invalid rows, %d lots written to %s' % (len(importReport.records),
+                                                                      len(importReport.errors),
+                                                                      importReport.nbWritten, args.portfolioDBFile))
+
+    if len(importReport.errors) > 0 and not args.skip_invalid:
+        sys.exit(1)
@@ -0,0 +1,339 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the in-process caches used to avoid recomputing or refetching data
+
+"""
+
+
+import time
+import threading
+from collections import OrderedDict
+
+import instrumentation
+
+
+# marker of the keys that are not in a cache
+MISSING = object()
+
+
+
+class LruCache(object):
+    """
+    This class implements a bounded cache that evicts the least recently used entry when it is full. The cache can be
+    shared between threads
+
+
+    Attributes :
+
+        - maxSize : (int) maximum number of entries in the cache
+        - entries : (OrderedDict) entries of the cache from the least to the most recently used
+        - lock : (Lock) lock that protects the entries
+        - name : (string) name of the cache in the metrics of its hits and misses (see instrumentation), None if they
+        are not counted
+
+    """
+
+    def __init__(self, maxSize, name=None):
+
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.name = name
+
+
+
+    def __len__(self):
+
+        return len(self.entries)
+
+
+
+    def get(self, key, default=None):
+        """
+        This method gets the value of a key and marks the key as the most recently used
+
+        Args :
+            - key : (hashable) key of the entry
+            - default : value returned if the key is not in the cache
+
+        Return :
+            - value of the key, default if the key is not in the cache
+        """
+
+        with self.lock:
+
+            if key not in self.entries:
+                return default
+
+            value = self.entries.pop(key)
+            self.entries[key] = value
+
+            return value
+
+
+
+    def put(self, key, value):
+        """
+        This method sets the value of a key and evicts the least recently used entries if the cache is full
+
+        Args :
+            - key : (hashable) key of the entry
+            - value : value of the entry
+
+        Return :
+            - None
+        """
+
+        with self.lock:
+
+            self.entries.pop(key, None)
+            self.entries[key] = value
+
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+
+
+    def getOrCreate(self, key, create):
+        """
+        This method gets the value of a key. If the key is not in the cache the value is created and added to the cache
+
+        Args :
+            - key : (hashable) key of the entry
+            - create : (function) function without arguments that creates the value
+
+        Return :
+            - value of the key
+        """
+
+        value = self.get(key, MISSING)
+
+        self.countRequest(value is not MISSING)
+
+        if value is not MISSING:
+            return value
+
+        value = create()
+        self.put(key, value)
+
+        return value
+
+
+
+    def countRequest(self, isHit):
+        """
+        This helper method counts a request of a value in the metrics of the cache, if the cache is named
+
+        Args :
+            - isHit : (bool) True if the value was in the cache
+
+        Return :
+            - None
+        """
+
+        if self.name is not None:
+            instrumentation.increment('fipi_cache_requests_total', cache=self.name, result='hit' if isHit else 'miss')
+
+
+
+    def clear(self):
+        """
+        This method removes all the entries of the cache
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+
+
+class PendingValue(object):
+    """
+    This class holds the value of a cache entry while it is being created, so that the other threads that need the
+    entry wait for it instead of creating it again
+
+
+    Attributes :
+
+        - event : (Event) event set once the value is created (or has failed)
+        - value : value of the entry
+        - error : (Exception) exception raised while creating the value, None if the value was created
+
+    """
+
+    def __init__(self):
+
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+
+class TtlCache(LruCache):
+    """
+    This class implements a bounded cache whose entries expire. An entry is valid until an expiry time set when it is
+    added to the cache, and the least recently used entry is evicted when the cache is full. The entries that are
+    being created are shared : a key requested by several threads at once is only created once
+
+
+    Attributes :
+
+        - getExpiry : (function) function that takes the current time (s since the epoch) and returns the expiry time of
+        an entry created at that time
+        - clock : (function) function that returns the current time (s since the epoch)
+        - pending : (dict) entries being created by key
+
+    """
+
+    def __init__(self, maxSize, getExpiry, clock=time.time, name=None):
+
+        LruCache.__init__(self, maxSize, name)
+
+        self.getExpiry = getExpiry
+        self.clock = clock
+        self.pending = {}
+
+
+
+    def get(self, key, default=None):
+        """
+        This method gets the value of a key and marks the key as the most recently used. An expired entry is removed
+
+        Args :
+            - key : (hashable) key of the entry
+            - default : value returned if the key is not in the cache or has expired
+
+        Return :
+            - value of the key, default if the key is not in the cache or has expired
+        """
+
+        with self.lock:
+            return self.getEntry(key, default)
+
+
+
+    def getEntry(self, key, default):
+        """
+        This helper method gets the value of a key, the lock of the cache must be held
+
+        Args :
+            - key : (hashable) key of the entry
+            - default : value returned if the key is not in the cache or has expired
+
+        Return :
+            - value of the key, default if the key is not in the cache or has expired
+        """
+
+        if key not in self.entries:
+            return default
+
+        value, expiry = self.entries.pop(key)
+
+        if expiry <= self.clock():
+            return default
+
+        self.entries[key] = (value, expiry)
+
+        return value
+
+
+
+    def put(self, key, value):
+        """
+        This method sets the value of a key with the expiry time of an entry created now and evicts the least recently
+        used entries if the cache is full
+
+        Args :
+            - key : (hashable) key of the entry
+            - value : value of the entry
+
+        Return :
+            - None
+        """
+
+        LruCache.put(self, key, (value, self.getExpiry(self.clock())))
+
+
+
+    def getOrCreate(self, key, create):
+        """
+        This method gets the value of a key. If the key is not in the cache or has expired the value is created and
+        added to the cache. If the value is already being created by another thread, the method waits for it
+
+        Args :
+            - key : (hashable) key of the entry
+            - create : (function) function without arguments that creates the value
+
+        Return :
+            - value of the key
+
+        Raise :
+            - the exception raised by create, in the thread that created the value and in the threads that waited for it
+        """
+
+        with self.lock:
+
+            value = self.getEntry(key, MISSING)
+
+            if value is not MISSING:
+                self.countRequest(True)
+                return value
+
+            pending = self.pending.get(key)
+            isCreator = pending is None
+
+            if isCreator:
+                pending = self.pending[key] = PendingValue()
+
+
+        # a value created by another thread is a hit
+        self.countRequest(not isCreator)
+
+        # another thread is creating the value
+        if not isCreator:
+
+            pending.event.wait()
+
+            if pending.error is not None:
+                raise pending.error
+
+            return pending.value
+
+
+        try:
+            pending.value = create()
+            self.put(key, pending.value)
+
+        except Exception as error:
+            pending.error = error
+            raise
+
+        finally:
+
+            with self.lock:
+                del self.pending[key]
+
+            pending.event.set()
+
+        return pending.value
+
+
+
+def getConstantExpiry(ttl):
+    """
+    This function creates the expiry function of a cache whose entries are valid for a constant time
+
+    Args :
+        - ttl : (float) time to live of the entries (s)
+
+    Return :
+        - (function) expiry function (see TtlCache)
+    """
+
+    return lambda now: now + ttl
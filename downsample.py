@@ -0,0 +1,109 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the downsampling of the time series sent to the grafs of the app. The series are reduced with
+the largest triangle three buckets (LTTB) algorithm, which keeps the visual shape of a series with a fraction of its
+points
+
+"""
+
+
+from __future__ import division
+
+
+import numpy as np
+import pandas as pd
+
+
+# default maximum number of points of a trace
+MAX_POINTS = 500
+
+
+
+def lttb(x, y, nbPoints):
+    """
+    This function selects the points of a series to keep with the largest triangle three buckets algorithm. The first
+    and last points are always kept and one point is kept in each bucket in between : the point that forms the largest
+    triangle with the point kept in the previous bucket and the average point of the next bucket
+
+    Args :
+        - x : (array) x values of the series (sorted)
+        - y : (array) y values of the series
+        - nbPoints : (int) number of points to keep
+
+    Return :
+        - (array of ints) indices of the points to keep
+    """
+
+    nbValues = len(x)
+
+    if nbPoints >= nbValues or nbPoints < 3:
+        return np.arange(nbValues)
+
+    # the points between the first and the last ones are split in nbPoints - 2 buckets
+    edges = np.linspace(1, nbValues - 1, nbPoints - 1).astype(int)
+
+    selected = np.empty(nbPoints, dtype=int)
+    selected[0] = 0
+    selected[-1] = nbValues - 1
+
+    for idx in range(nbPoints - 2):
+
+        start, end = edges[idx], edges[idx + 1]
+
+        # average point of the next bucket (the last point for the last bucket)
+        if idx == nbPoints - 3:
+            avgX, avgY = x[-1], y[-1]
+
+        else:
+            avgX, avgY = x[end:edges[idx + 2]].mean(), y[end:edges[idx + 2]].mean()
+
+        # point that forms the largest triangle with the previous kept point and the average point
+        prevX, prevY = x[selected[idx]], y[selected[idx]]
+        areas = np.abs((prevX - avgX) * (y[start:end] - prevY) - (prevX - x[start:end]) * (avgY - prevY))
+
+        selected[idx + 1] = start + areas.argmax()
+
+    return selected
+
+
+
+def downsampleSeries(series, startDate=None, endDate=None, nbPoints=MAX_POINTS):
+    """
+    This function downsamples a time series for a graf. The whole series is reduced to nbPoints points and, if a
+    visible range is given, the points of the visible range are added at a resolution of nbPoints points, so that the
+    graf keeps its overview (ex for a range slider) and gets more details as the range is zoomed in. The nan values
+    are dropped
+
+    Args :
+        - series : (Series) time series to downsample
+        - startDate : (string) start date of the visible range. If None the whole series is visible
+        - endDate : (string) end date of the visible range. If None the whole series is visible
+        - nbPoints : (int) number of points of the overview and of the visible range
+
+    Return :
+        - (Series) downsampled time series
+    """
+
+    series = series.dropna()
+
+    if len(series) <= nbPoints:
+        return series
+
+    # days since the epoch as the x values, so that the areas of the triangles do not overflow
+    x = series.index.values.astype('datetime64[ns]').astype(np.int64) / (86400 * 1e9)
+    y = series.values.astype(float)
+
+    selected = lttb(x, y, nbPoints)
+
+
+    # add the details of the visible range (with the points just outside it, so that the lines reach the edges)
+    if startDate is not None and endDate is not None:
+
+        start = max(series.index.searchsorted(pd.Timestamp(startDate), side='left') - 1, 0)
+        end = min(series.index.searchsorted(pd.Timestamp(endDate), side='right') + 1, len(series))
+
+        visible = start + lttb(x[start:end], y[start:end], nbPoints)
+        selected = np.union1d(selected, visible)
+
+    return series.iloc[selected]
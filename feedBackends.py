@@ -0,0 +1,584 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the backends of the price feeds. A backend gets the raw data of the feeds : the daily prices of
+the tickers of the history feeds (yahoo) and the web pages of the quote feeds (TMX and preferred stock channel). The
+backend of each feed type is pluggable :
+
+    - live : the data are requested from the web sites of the feeds
+    - recorded : the data are read from a fixtures directory (saved yahoo csv files and html pages), with an optional
+    simulated latency, so that the app can be run, tested and benchmarked without network
+
+The backends are selected with environment variables : FIPI_FEED_BACKEND sets the backend of all the feed types
+(live by default) and FIPI_FEED_BACKEND_<FEED TYPE> (ex FIPI_FEED_BACKEND_TMX) the backend of one feed type.
+FIPI_FIXTURES_DIR sets the fixtures directory and FIPI_FEED_LATENCY the simulated latency of a request (s)
+
+usage (record the data of the feeds of a set of portfolios as fixtures) : python feedBackends.py DB_FILE [DB_FILE ...]
+
+"""
+
+
+import os
+import sys
+import json
+import time
+import logging
+import datetime
+import threading
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from pandas_datareader import data as pdr
+import pandas as pd
+
+import portfolioStore
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+
+logger = logging.getLogger(__name__)
+
+
+# names of the backends
+LIVE = 'live'
+RECORDED = 'recorded'
+
+# default fixtures directory of the recorded backend, the yahoo prices are saved as yahoo/<ticker>.csv and the pages as
+# pages/<name>.html with the name of the page of each url in pages/index.json
+DEFAULT_FIXTURES_DIR = './data/fixtures'
+YAHOO_DIR = 'yahoo'
+PAGES_DIR = 'pages'
+PAGES_INDEX_FILE = 'index.json'
+
+# columns of the price matrices
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# default settings of the page fetcher : connect and read timeouts (s), number of retries after a failed request, delay
+# before the first retry (s, doubled at each retry), concurrent requests per host and threads of the pool
+DEFAULT_TIMEOUT = (5, 15)
+DEFAULT_NB_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_NB_WORKERS = 16
+
+# status codes of the responses for which a request is retried
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# user agent of the requests, some of the quote sites reject the default user agent of requests
+USER_AGENT = 'Mozilla/5.0 (compatible; fipi)'
+
+
+
+class PageFetcher(object):
+    """
+    This class fetches web pages concurrently. All the requests go through one session whose connections are kept
+    alive and reused, the number of concurrent requests to a host is limited and the failed requests are retried with
+    an exponential backoff
+
+
+    Attributes :
+
+        - session : (Session) HTTP session shared by all the requests
+        - timeout : (tuple of floats) connect and read timeouts of a request (s)
+        - nbRetries : (int) number of retries after a failed request
+        - backoff : (float) delay before the first retry (s), doubled at each retry
+        - maxPerHost : (int) maximum number of concurrent requests to a host
+        - nbWorkers : (int) number of threads that fetch the pages
+        - hostSemaphores : (dict) semaphore that limits the concurrent requests of each host
+        - lock : (Lock) lock that protects the semaphores
+
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, nbRetries=DEFAULT_NB_RETRIES, backoff=DEFAULT_BACKOFF,
+                 maxPerHost=DEFAULT_MAX_PER_HOST, nbWorkers=DEFAULT_NB_WORKERS):
+
+        self.timeout = timeout
+        self.nbRetries = nbRetries
+        self.backoff = backoff
+        self.maxPerHost = maxPerHost
+        self.nbWorkers = nbWorkers
+        self.hostSemaphores = {}
+        self.lock = threading.Lock()
+
+        # the connection pool of each host holds as many connections as there can be concurrent requests to the host
+        adapter = HTTPAdapter(pool_connections=nbWorkers, pool_maxsize=maxPerHost)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+
+
+    def getHostSemaphore(self, url):
+        """
+        This helper method gets the semaphore that limits the concurrent requests to the host of a url
+
+        Args :
+            - url : (string) url of the request
+
+        Return :
+            - (Semaphore) semaphore of the host
+        """
+
+        host = urlparse(url).netloc
+
+        with self.lock:
+
+            if host not in self.hostSemaphores:
+                self.hostSemaphores[host] = threading.Semaphore(self.maxPerHost)
+
+            return self.hostSemaphores[host]
+
+
+
+    def fetchPage(self, url):
+        """
+        This method fetches a web page. The request is retried after a connection error, a timeout or a server error
+
+        Args :
+            - url : (string) url of the page
+
+        Return :
+            - (string) content of the page
+
+        Raise :
+            - (RequestException) the error of the last attempt if all the attempts failed
+        """
+
+        semaphore = self.getHostSemaphore(url)
+
+        for attempt in range(self.nbRetries + 1):
+
+            try:
+                with semaphore:
+                    response = self.session.get(url, timeout=self.timeout)
+
+                response.raise_for_status()
+
+                return response.text
+
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+
+                # the client errors (ex page not found) will not be fixed by a retry
+                isRetryable = not isinstance(error, requests.HTTPError) or \
+                    error.response.status_code in RETRY_STATUS_CODES
+
+                if not isRetryable or attempt == self.nbRetries:
+                    raise
+
+                logger.warning('Request of %s failed (%s), retry %d of %d', url, error, attempt + 1, self.nbRetries)
+
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+
+    def fetchPages(self, urls):
+        """
+        This method fetches a set of web pages concurrently, each distinct url is fetched once
+
+        Args :
+            - urls : (list of strings) urls of the pages
+
+        Return :
+            - (dict) content of the page of each url, or the exception raised by its last attempt if it could not be
+            fetched
+        """
+
+        return self.mapUrls(self.fetchPage, urls)
+
+
+
+    def mapUrls(self, func, urls):
+        """
+        This method applies a function that fetches a url to a set of urls concurrently, each distinct url is processed
+        once
+
+        Args :
+            - func : (function) function that takes a url
+            - urls : (list of strings) urls to process
+
+        Return :
+            - (dict) result of the function for each url, or the exception it raised if the url could not be fetched
+            or its page could not be read
+        """
+
+        urls = list(set(urls))
+
+        def fetch(url):
+
+            try:
+                return func(url)
+
+            except (requests.RequestException, ValueError) as error:
+                logger.error('Request of %s failed : %s', url, error)
+                return error
+
+
+        if len(urls) > 1:
+
+            pool = ThreadPool(min(self.nbWorkers, len(urls)))
+
+            try:
+                pages = pool.map(fetch, urls)
+
+            finally:
+                pool.close()
+                pool.join()
+
+        else:
+            pages = [fetch(url) for url in urls]
+
+        return dict(zip(urls, pages))
+
+
+
+class FeedBackend(object):
+    """
+    This class is the interface of the backends of the price feeds
+
+    """
+
+    def fetchPrices(self, tickers, startDate, endDate):
+        """
+        This method gets the daily prices of a list of tickers
+
+        Args :
+            - tickers : (list of strings) ids of stocks on markets
+            - startDate : (string) start date of the extraction (format YYYY-MM-DD)
+            - endDate : (string) end date of the extraction (format YYYY-MM-DD)
+
+        Return :
+            - (dict) open, low, high, close, adj close and volume matrix of each ticker between a set of dates. The
+            tickers that are not available are left out
+        """
+
+        raise NotImplementedError("Should have implemented this")
+
+
+
+    def fetchPage(self, url):
+        """
+        This method gets a web page
+
+        Args :
+            - url : (string) url of the page
+
+        Return :
+            - (string) content of the page
+        """
+
+        raise NotImplementedError("Should have implemented this")
+
+
+
+class LiveBackend(FeedBackend):
+    """
+    This class is the live backend : the prices are requested from the yahoo finance api and the pages from their web
+    sites
+
+
+    Attributes :
+
+        - pageFetcher : (PageFetcher) fetcher of the pages
+
+    """
+
+    def __init__(self, pageFetcher):
+
+        self.pageFetcher = pageFetcher
+
+
+
+    def fetchPrices(self, tickers, startDate, endDate):
+
+        if len(tickers) == 1:
+            return {tickers[0]: pdr.DataReader(tickers[0], data_source='yahoo', start=startDate, end=endDate)}
+
+        result = pdr.DataReader(tickers, data_source='yahoo', start=startDate, end=endDate)
+
+        histValues = {}
+
+        for ticker in tickers:
+
+            # a multi symbol request returns a panel (fields x dates x tickers) or a frame with (field, ticker) columns
+            if hasattr(result, 'minor_xs'):
+                if ticker in result.minor_axis:
+                    histValues[ticker] = result.minor_xs(ticker)
+
+            elif ticker in result.columns.get_level_values(1):
+                histValues[ticker] = result.xs(ticker, axis=1, level=1)
+
+        # drop the days where the ticker did not trade
+        for ticker in histValues:
+            histValues[ticker] = histValues[ticker].dropna(how='all')
+
+        return histValues
+
+
+
+    def fetchPage(self, url):
+
+        return self.pageFetcher.fetchPage(url)
+
+
+
+class RecordedBackend(FeedBackend):
+    """
+    This class is the recorded backend : the prices and the pages are read from a fixtures directory. Each request
+    waits for a simulated latency before it returns, the files are only read once
+
+
+    Attributes :
+
+        - fixturesDir : (string) fixtures directory
+        - latency : (float) simulated latency of a request (s)
+        - prices : (dict) prices of each ticker already read
+        - pages : (dict) content of each page already read
+        - lock : (Lock) lock that protects the files already read
+
+    """
+
+    def __init__(self, fixturesDir=DEFAULT_FIXTURES_DIR, latency=0.0):
+
+        self.fixturesDir = fixturesDir
+        self.latency = latency
+        self.prices = {}
+        self.pages = {}
+        self.lock = threading.Lock()
+
+
+
+    def readPrices(self, ticker):
+        """
+        This helper method reads the saved prices of a ticker
+
+        Args :
+            - ticker : (string) id of stock on markets
+
+        Return :
+            - (DataFrame) open, low, high, close, adj close and volume matrix of the ticker. None if the ticker was not
+            recorded
+        """
+
+        with self.lock:
+
+            if ticker not in self.prices:
+
+                fileName = os.path.join(self.fixturesDir, YAHOO_DIR, ticker + '.csv')
+
+                if os.path.exists(fileName):
+                    self.prices[ticker] = pd.read_csv(fileName, index_col='Date', parse_dates=True).sort_index()
+
+                else:
+                    self.prices[ticker] = None
+
+            return self.prices[ticker]
+
+
+
+    def fetchPrices(self, tickers, startDate, endDate):
+
+        time.sleep(self.latency)
+
+        histValues = {}
+
+        for ticker in tickers:
+
+            prices = self.readPrices(ticker)
+
+            if prices is not None:
+                histValues[ticker] = prices.loc[startDate:endDate]
+
+        return histValues
+
+
+
+    def fetchPage(self, url):
+
+        time.sleep(self.latency)
+
+        with self.lock:
+
+            if url not in self.pages:
+
+                pagesDir = os.path.join(self.fixturesDir, PAGES_DIR)
+
+                with open(os.path.join(pagesDir, PAGES_INDEX_FILE)) as indexFile:
+                    pageNames = json.load(indexFile)
+
+                if url not in pageNames:
+                    raise ValueError('No recorded page for %s' % url)
+
+                with open(os.path.join(pagesDir, pageNames[url]), 'rb') as pageFile:
+                    self.pages[url] = pageFile.read().decode('utf-8')
+
+            return self.pages[url]
+
+
+
+def createBackend(name):
+    """
+    This function creates a backend from its name, the settings of the recorded backend come from the environment
+
+    Args :
+        - name : (string) name of the backend (live or recorded)
+
+    Return :
+        - (FeedBackend) the backend
+    """
+
+    if name == LIVE:
+        return LiveBackend(fetcher)
+
+    if name == RECORDED:
+        return RecordedBackend(os.environ.get('FIPI_FIXTURES_DIR', DEFAULT_FIXTURES_DIR),
+                               float(os.environ.get('FIPI_FEED_LATENCY', 0)))
+
+    raise ValueError('Unknown feed backend %s' % name)
+
+
+
+def getBackend(feedType):
+    """
+    This function gets the backend of a feed type. The backend is created from the environment the first time it is
+    needed
+
+    Args :
+        - feedType : (string) feed type (ex YAHOO, TMX)
+
+    Return :
+        - (FeedBackend) backend of the feed type
+    """
+
+    with lock:
+
+        if feedType not in backends:
+
+            name = os.environ.get('FIPI_FEED_BACKEND_' + feedType, os.environ.get('FIPI_FEED_BACKEND', LIVE))
+
+            if name not in namedBackends:
+                namedBackends[name] = createBackend(name)
+
+            backends[feedType] = namedBackends[name]
+
+        return backends[feedType]
+
+
+
+def setBackend(feedType, backend):
+    """
+    This function sets the backend of a feed type (ex a recorded backend in a benchmark)
+
+    Args :
+        - feedType : (string) feed type (ex YAHOO, TMX)
+        - backend : (FeedBackend) backend of the feed type
+
+    Return :
+        - None
+    """
+
+    with lock:
+        backends[feedType] = backend
+
+
+
+def recordFixtures(portfolioDBFiles, fixturesDir=DEFAULT_FIXTURES_DIR):
+    """
+    This function records the data of the live feeds referenced by a set of portfolios in a fixtures directory : the
+    prices of the yahoo tickers from the purchase dates and the pages of the quotes
+
+    Args :
+        - portfolioDBFiles : (list of strings) database files of the portfolios
+        - fixturesDir : (string) fixtures directory
+
+    Return :
+        - None
+    """
+
+    live = LiveBackend(fetcher)
+    today = datetime.datetime.now().strftime('%Y-%m-%d')
+
+    startDates = {}
+    pageUrls = set()
+
+    for portfolioDBFile in portfolioDBFiles:
+
+        for record in portfolioStore.readRecords(portfolioDBFile):
+
+            if record['priceFeedType'] == 'YAHOO':
+                startDates[record['priceFeedRef']] = min(record['purchaseDate'],
+                                                         startDates.get(record['priceFeedRef'], today))
+
+            elif record['priceFeedType'] in ('TMX', 'PREFSTOCKCHANNEL'):
+                pageUrls.add(record['priceFeedRef'])
+
+
+    # save the prices of each ticker
+    yahooDir = os.path.join(fixturesDir, YAHOO_DIR)
+
+    if not os.path.exists(yahooDir):
+        os.makedirs(yahooDir)
+
+    for ticker, startDate in sorted(startDates.items()):
+
+        try:
+            prices = live.fetchPrices([ticker], startDate, today)[ticker]
+
+        except Exception:
+            logger.exception('Prices of %s not recorded', ticker)
+            continue
+
+        prices[PRICE_COLUMNS].to_csv(os.path.join(yahooDir, ticker + '.csv'), index_label='Date')
+
+
+    # save the pages and add them to the index of the pages
+    pagesDir = os.path.join(fixturesDir, PAGES_DIR)
+    indexFileName = os.path.join(pagesDir, PAGES_INDEX_FILE)
+
+    if not os.path.exists(pagesDir):
+        os.makedirs(pagesDir)
+
+    pageNames = {}
+
+    if os.path.exists(indexFileName):
+        with open(indexFileName) as indexFile:
+            pageNames = json.load(indexFile)
+
+    for url, page in fetcher.fetchPages(sorted(pageUrls)).items():
+
+        if isinstance(page, Exception):
+            continue
+
+        pageName = pageNames.get(url, 'page_%d.html' % len(pageNames))
+        pageNames[url] = pageName
+
+        with open(os.path.join(pagesDir, pageName), 'wb') as pageFile:
+            pageFile.write(page.encode('utf-8'))
+
+    with open(indexFileName, 'w') as indexFile:
+        json.dump(pageNames, indexFile, indent=4, sort_keys=True)
+
+
+
+# page fetcher of the live backend and backends of the process (by feed type and by name)
+fetcher = PageFetcher()
+backends = {}
+namedBackends = {}
+lock = threading.Lock()
+
+
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        sys.exit('usage : python feedBackends.py DB_FILE [DB_FILE ...]')
+
+    logging.basicConfig(level=logging.INFO)
+
+    recordFixtures(sys.argv[1:], os.environ.get('FIPI_FIXTURES_DIR', DEFAULT_FIXTURES_DIR))
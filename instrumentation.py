@@ -0,0 +1,453 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the instrumentation of the hot paths of the app : timers and counters of the feed, compute and
+render stages kept in memory by a registry of metrics. The metrics are rendered in the Prometheus text format (served
+by the /metrics route of the app) and each callback of the app writes one structured (JSON) log line with its duration
+and the fields gathered while it ran. The metrics are kept per process (ex per gunicorn worker)
+
+"""
+
+
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+
+
+logger = logging.getLogger(__name__)
+
+
+# types of the metrics
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# upper bounds of the buckets of the histograms of durations (s) and of sizes (bytes)
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+# content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# metrics of the app : type, help and buckets of each metric
+METRICS = {'fipi_feed_fetch_seconds': (HISTOGRAM, 'Duration of the requests to the price feeds by feed type',
+                                       TIME_BUCKETS),
+           'fipi_feed_errors_total': (COUNTER, 'Failed requests to the price feeds by feed type', None),
+           'fipi_stage_seconds': (HISTOGRAM, 'Duration of the load, compute and render stages', TIME_BUCKETS),
+           'fipi_rows_computed_total': (COUNTER, 'Rows of performance matrices computed by the performance engine',
+                                        None),
+           'fipi_cache_requests_total': (COUNTER, 'Requests to the caches by cache and result (hit or miss)', None),
+           'fipi_figure_payload_bytes': (HISTOGRAM, 'Size of the figures sent by the callbacks (JSON bytes)',
+                                         BYTE_BUCKETS),
+           'fipi_callback_seconds': (HISTOGRAM, 'Duration of the callbacks of the app', TIME_BUCKETS),
+           'fipi_callback_errors_total': (COUNTER, 'Callbacks of the app that raised an exception', None)}
+
+
+
+class MetricsRegistry(object):
+    """
+    This class implements the registry of the metrics of the process. A metric is a counter or a histogram defined
+    once by its name, and it has a value per set of labels. The registry can be shared between threads
+
+
+    Attributes :
+
+        - definitions : (dict) type, help and buckets of each metric
+        - counters : (dict) value of each counter by name and labels
+        - histograms : (dict) bucket counts, sum and count of each histogram by name and labels
+        - lock : (Lock) lock that protects the values
+
+    """
+
+    def __init__(self, definitions):
+
+        self.definitions = dict(definitions)
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+
+
+    def getDefinition(self, name, metricType):
+        """
+        This helper method gets the definition of a metric and checks its type
+
+        Args :
+            - name : (string) name of the metric
+            - metricType : (string) expected type of the metric (COUNTER or HISTOGRAM)
+
+        Return :
+            - (tuple) type, help and buckets of the metric
+
+        Raise :
+            - (ValueError) if the metric is not defined or is not of the expected type
+        """
+
+        definition = self.definitions.get(name)
+
+        if definition is None or definition[0] != metricType:
+            raise ValueError('%s is not a defined %s' % (name, metricType))
+
+        return definition
+
+
+
+    def increment(self, name, value=1, **labels):
+        """
+        This method increments a counter
+
+        Args :
+            - name : (string) name of the counter
+            - value : (float) increment of the counter
+            - labels : (strings) labels of the value
+
+        Return :
+            - None
+        """
+
+        self.getDefinition(name, COUNTER)
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+
+    def observe(self, name, value, **labels):
+        """
+        This method adds an observation (ex a duration) to a histogram
+
+        Args :
+            - name : (string) name of the histogram
+            - value : (float) observed value
+            - labels : (strings) labels of the value
+
+        Return :
+            - None
+        """
+
+        buckets = self.getDefinition(name, HISTOGRAM)[2]
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+
+            histogram = self.histograms[key]
+
+            # the last count is the bucket of the values above the last bound
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+
+
+    def render(self):
+        """
+        This method renders the values of all the metrics in the Prometheus text format
+
+        Args :
+            - None
+
+        Return :
+            - (string) metrics in the Prometheus text format
+        """
+
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict((key, [list(value[0]), value[1], value[2]]) for key, value in self.histograms.items())
+
+        lines = []
+
+        for name in sorted(self.definitions):
+
+            metricType, helpText, buckets = self.definitions[name]
+
+            lines.append('# HELP %s %s' % (name, helpText))
+            lines.append('# TYPE %s %s' % (name, metricType))
+
+            if metricType == COUNTER:
+
+                for key in sorted(key for key in counters if key[0] == name):
+                    lines.append('%s%s %s' % (name, formatLabels(key[1]), formatValue(counters[key])))
+
+                continue
+
+            for key in sorted(key for key in histograms if key[0] == name):
+
+                bucketCounts, total, count = histograms[key]
+                cumulativeCount = 0
+
+                for bound, bucketCount in zip(list(buckets) + [float('inf')], bucketCounts):
+
+                    cumulativeCount += bucketCount
+                    lines.append('%s_bucket%s %d' % (name, formatLabels(key[1] + (('le', formatValue(bound)),)),
+                                                     cumulativeCount))
+
+                lines.append('%s_sum%s %s' % (name, formatLabels(key[1]), formatValue(total)))
+                lines.append('%s_count%s %d' % (name, formatLabels(key[1]), count))
+
+        return '\n'.join(lines) + '\n'
+
+
+
+    def clear(self):
+        """
+        This method resets the values of all the metrics
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+
+class Timer(object):
+    """
+    This class is a context manager that measures the duration of a block and adds it to a histogram. If the block
+    raises an exception, an error counter can be incremented with the same labels
+
+
+    Attributes :
+
+        - name : (string) name of the histogram
+        - errorName : (string) name of the error counter, None if the errors are not counted
+        - labels : (dict) labels of the value
+        - start : (float) start time of the block (s)
+        - duration : (float) duration of the block (s), None while the block runs
+
+    """
+
+    def __init__(self, name, errorName=None, **labels):
+
+        self.name = name
+        self.errorName = errorName
+        self.labels = labels
+        self.start = None
+        self.duration = None
+
+
+
+    def __enter__(self):
+
+        self.start = time.time()
+
+        return self
+
+
+
+    def __exit__(self, excType, excValue, traceback):
+
+        self.duration = time.time() - self.start
+
+        metrics.observe(self.name, self.duration, **self.labels)
+
+        if excType is not None and self.errorName is not None:
+            metrics.increment(self.errorName, **self.labels)
+
+        return False
+
+
+
+def formatValue(value):
+    """
+    This helper function formats the value of a metric or the bound of a bucket
+
+    Args :
+        - value : (float) value to format
+
+    Return :
+        - (string) formatted value
+    """
+
+    if value == float('inf'):
+        return '+Inf'
+
+    if float(value).is_integer():
+        return '%d' % value
+
+    return repr(float(value))
+
+
+
+def formatLabels(labels):
+    """
+    This helper function formats the labels of a metric value
+
+    Args :
+        - labels : (tuple of tuples) name and value of each label
+
+    Return :
+        - (string) formatted labels, empty if there are no labels
+    """
+
+    if len(labels) == 0:
+        return ''
+
+    values = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for name, value in labels]
+
+    return '{%s}' % ','.join(values)
+
+
+
+def increment(name, value=1, **labels):
+    """
+    This function increments a counter of the registry of the process (see MetricsRegistry.increment)
+
+    """
+
+    metrics.increment(name, value, **labels)
+
+
+
+def observe(name, value, **labels):
+    """
+    This function adds an observation to a histogram of the registry of the process (see MetricsRegistry.observe)
+
+    """
+
+    metrics.observe(name, value, **labels)
+
+
+
+def timer(name, errorName=None, **labels):
+    """
+    This function creates a timer of a block (see Timer)
+
+    Args :
+        - name : (string) name of the histogram of the durations
+        - errorName : (string) name of the error counter, None if the errors are not counted
+        - labels : (strings) labels of the value
+
+    Return :
+        - (Timer) context manager of the block
+    """
+
+    return Timer(name, errorName, **labels)
+
+
+
+def timed(stage):
+    """
+    This function creates a decorator that adds the duration of each call of a function to the durations of a stage
+
+    Args :
+        - stage : (string) name of the stage
+
+    Return :
+        - (function) decorator of the function
+    """
+
+    def decorate(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            with Timer('fipi_stage_seconds', stage=stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+
+def renderMetrics():
+    """
+    This function renders the metrics of the process in the Prometheus text format
+
+    Args :
+        - None
+
+    Return :
+        - (string) metrics in the Prometheus text format
+    """
+
+    return metrics.render()
+
+
+
+def setCallbackField(name, value):
+    """
+    This function sets a field of the log line of the callback that runs in the current thread. Nothing is done
+    outside of a callback
+
+    Args :
+        - name : (string) name of the field
+        - value : value of the field (JSON serializable)
+
+    Return :
+        - None
+    """
+
+    fields = getattr(callbackContext, 'fields', None)
+
+    if fields is not None:
+        fields[name] = value
+
+
+
+def instrumentCallback(callbackName):
+    """
+    This function creates a decorator that instruments a callback of the app : its duration is added to the callback
+    histogram and a structured log line is written after each call, with its duration, its status and the fields set
+    while it ran (see setCallbackField)
+
+    Args :
+        - callbackName : (string) name of the callback
+
+    Return :
+        - (function) decorator of the callback
+    """
+
+    def decorate(func):
+
+        @functools.wraps(func)
+        def wrapper(*args):
+
+            callbackContext.fields = {'event': 'callback', 'callback': callbackName}
+            start = time.time()
+            status = 'ok'
+
+            try:
+                return func(*args)
+
+            except Exception:
+                status = 'error'
+                increment('fipi_callback_errors_total', callback=callbackName)
+                raise
+
+            finally:
+
+                duration = time.time() - start
+                observe('fipi_callback_seconds', duration, callback=callbackName)
+
+                fields = callbackContext.fields
+                callbackContext.fields = None
+
+                fields['status'] = status
+                fields['duration_ms'] = round(duration * 1000, 3)
+
+                logger.info(json.dumps(fields, sort_keys=True))
+
+        return wrapper
+
+    return decorate
+
+
+
+# registry of the metrics of the process and fields of the callback of each thread
+metrics = MetricsRegistry(METRICS)
+callbackContext = threading.local()
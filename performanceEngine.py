@@ -0,0 +1,269 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the performance engine. The engine aligns the prices of a set of assets on a common date index
+and computes the key performance indicators of all the assets in a single vectorized pass
+
+"""
+
+
+from __future__ import division
+
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+
+# columns of the price matrices and of the performance matrices
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+PERF_COLUMNS = PRICE_COLUMNS + ['Market', 'Est Profit', '% Est Profit', 'RateReturn', 'Time Delta', '% Return',
+                                'Annual Return']
+
+# columns that are set to nan once the asset has been sold
+SALE_COLUMNS = ['Market', 'Est Profit', '% Est Profit']
+
+
+
+def calcIndicators(dates, close, adjClose, prevAdjClose, firstDates, firstAdjClose, volumes, acquisitions):
+    """
+    This function calculates the performance indicators of a set of assets. The prices are (assets x dates) arrays and
+    the attributes of the assets are vectors that are broadcast over the dates
+
+    Args :
+        - dates : (datetime64 array) dates of the prices
+        - close : (2D array) close price of each asset for each date
+        - adjClose : (2D array) adj close price of each asset for each date
+        - prevAdjClose : (2D array) adj close price of each asset for its previous trading date
+        - firstDates : (datetime64 array) first trading date of each asset
+        - firstAdjClose : (array) adj close price of each asset on its first trading date
+        - volumes : (array) number of units of each asset
+        - acquisitions : (array) acquisition value of each asset
+
+    Return :
+        - (list of 2D arrays) Market, Est Profit, % Est Profit, RateReturn, Time Delta, % Return and Annual Return of
+        each asset for each date
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # calculate the performance values for each time stamp
+        market = close * volumes[:, None]
+        estProfit = market - acquisitions[:, None]
+        pctEstProfit = estProfit / acquisitions[:, None] * 100
+
+        # calculate the daily simple return
+        rateReturn = adjClose / prevAdjClose - 1
+
+        # calculate the elapsed time in years
+        timeDelta = (dates[None, :] - firstDates[:, None]) / np.timedelta64(1, 'D') / 365
+
+        # calculate the return with regards to the first trading date and the annual return
+        pctReturn = adjClose / firstAdjClose[:, None]
+        annualReturn = pctReturn ** (1 / timeDelta) - 1
+
+    return [market, estProfit, pctEstProfit, rateReturn, timeDelta, pctReturn, annualReturn]
+
+
+
+def setIndicators(cube, dates, indicators, saleDates):
+    """
+    This function sets the performance indicators in an (assets x dates x columns) array, rounds the array and inserts
+    nans for the performance values of the sold assets
+
+    Args :
+        - cube : (3D array) array of the performance matrices with the prices already set
+        - dates : (DatetimeIndex) dates of the array
+        - indicators : (list of 2D arrays) indicators returned by calcIndicators
+        - saleDates : (list of strings) sale date of each asset (None if the asset is not sold)
+
+    Return :
+        - None
+    """
+
+    for col, values in zip(PERF_COLUMNS[len(PRICE_COLUMNS):], indicators):
+        cube[:, :, PERF_COLUMNS.index(col)] = values
+
+    np.round(cube, 2, out=cube)
+
+
+    # if the asset is sold then insert nans for the performance values
+    saleRows = np.array([len(dates) if saleDate is None else dates.searchsorted(pd.Timestamp(saleDate))
+                         for saleDate in saleDates])
+    isSold = np.arange(len(dates))[None, :] >= saleRows[:, None]
+
+    for col in SALE_COLUMNS:
+        cube[:, :, PERF_COLUMNS.index(col)][isSold] = np.nan
+
+
+
+def getAnchors(prices):
+    """
+    This function gets the anchor values of the performance matrix of an asset, the values from which the rows of new
+    trading days can be calculated without the rest of the prices
+
+    Args :
+        - prices : (DataFrame) open, low, high, close, adj close and volume matrix of the asset
+
+    Return :
+        - (dict) first date, first adj close, last adj close and adj close before the last one of the prices. None if
+        there are no prices
+    """
+
+    if prices is None or len(prices) == 0:
+        return None
+
+    adjClose = prices['Adj Close'].values
+
+    return {'firstDate': prices.index[0],
+            'firstAdjClose': adjClose[0],
+            'lastAdjClose': adjClose[-1],
+            'prevAdjClose': adjClose[-2] if len(adjClose) > 1 else np.nan}
+
+
+
+def calcNewPerformanceRows(asset, newBars, anchors, prevAdjClose):
+    """
+    This function calculates the rows of the performance matrix of an asset for new trading days. Only the new rows are
+    calculated, from the anchor values of the performance matrix
+
+    Args :
+        - asset : (Asset) asset of the performance matrix
+        - newBars : (DataFrame) open, low, high, close, adj close and volume matrix of the new trading days
+        - anchors : (dict) anchor values of the performance matrix (see getAnchors)
+        - prevAdjClose : (float) adj close of the trading day before the first new trading day
+
+    Return :
+        - (DataFrame) rows of the performance matrix for the new trading days
+    """
+
+    dates = newBars.index
+
+    cube = np.full((1, len(dates), len(PERF_COLUMNS)), np.nan)
+    cube[0, :, :len(PRICE_COLUMNS)] = newBars[PRICE_COLUMNS].values
+
+    # the previous adj close of the first new day is the adj close of the day before it
+    adjClose = cube[:, :, PERF_COLUMNS.index('Adj Close')]
+    prevAdjCloses = np.concatenate([[[prevAdjClose]], adjClose[:, :-1]], axis=1)
+
+    indicators = calcIndicators(dates.values,
+                                cube[:, :, PERF_COLUMNS.index('Close')],
+                                adjClose,
+                                prevAdjCloses,
+                                np.array([pd.Timestamp(anchors['firstDate']).to_datetime64()]),
+                                np.array([anchors['firstAdjClose']], dtype=float),
+                                np.array([asset.volume], dtype=float),
+                                np.array([asset.calcAcquistionValue()], dtype=float))
+
+    setIndicators(cube, dates, indicators, [asset.saleDate])
+
+    instrumentation.increment('fipi_rows_computed_total', len(dates), mode='append')
+
+    return pd.DataFrame(cube[0], index=dates, columns=PERF_COLUMNS)
+
+
+
+def forwardFill(values, isValid):
+    """
+    This helper function propagates the last valid value of each row of a 2D array over the following invalid values
+
+    Args :
+        - values : (2D array) values to fill
+        - isValid : (2D boolean array) true where the values are valid
+
+    Return :
+        - (2D array) filled values
+    """
+
+    lastValid = np.where(isValid, np.arange(values.shape[1])[None, :], 0)
+    np.maximum.accumulate(lastValid, axis=1, out=lastValid)
+
+    return values[np.arange(values.shape[0])[:, None], lastValid]
+
+
+
+@instrumentation.timed('performance_matrix')
+def calcPerformanceMatrices(assets, prices):
+    """
+    This function calculates the performance matrices of a set of assets. The prices of all the assets are aligned on
+    a single date index as an (assets x dates x columns) array and the indicators are computed in one pass. The
+    performance matrix of each asset is a view on its slice of the array when the asset traded on every date of its
+    period, and a copy of its trading dates otherwise
+
+    Args :
+        - assets : (list of Assets) assets for which the performance matrices are calculated
+        - prices : (list of DataFrames) open, low, high, close, adj close and volume matrix of each asset. None if the
+        prices of the asset are not available
+
+    Return :
+        - (list of DataFrames) performance matrix of each asset (see Asset.perfMatrix). None for the assets without
+        prices
+    """
+
+    available = [idx for idx in range(len(assets)) if prices[idx] is not None and len(prices[idx]) > 0]
+
+    if len(available) == 0:
+        return [None] * len(assets)
+
+
+    # align the prices of the assets on the union of their dates
+    dates = pd.DatetimeIndex(np.unique(np.concatenate([prices[idx].index.values for idx in available])), name='Date')
+    datesValues = dates.values
+
+    nbAssets = len(available)
+    cube = np.full((nbAssets, len(dates), len(PERF_COLUMNS)), np.nan)
+    isValid = np.zeros((nbAssets, len(dates)), dtype=bool)
+
+    for pos, idx in enumerate(available):
+
+        rows = dates.get_indexer(prices[idx].index)
+        cube[pos, rows, :len(PRICE_COLUMNS)] = prices[idx][PRICE_COLUMNS].values
+        isValid[pos, rows] = True
+
+
+    # attributes of the assets
+    volumes = np.array([assets[idx].volume for idx in available], dtype=float)
+    acquisitions = np.array([assets[idx].calcAcquistionValue() for idx in available], dtype=float)
+
+    firstRows = isValid.argmax(axis=1)
+    lastRows = len(dates) - isValid[:, ::-1].argmax(axis=1)
+
+
+    # the previous adj close of a date is the adj close of the previous trading date of the asset
+    adjClose = cube[:, :, PERF_COLUMNS.index('Adj Close')]
+    prevAdjClose = np.full(adjClose.shape, np.nan)
+    prevAdjClose[:, 1:] = forwardFill(adjClose, isValid)[:, :-1]
+
+    indicators = calcIndicators(datesValues,
+                                cube[:, :, PERF_COLUMNS.index('Close')],
+                                adjClose,
+                                prevAdjClose,
+                                datesValues[firstRows],
+                                adjClose[np.arange(nbAssets), firstRows],
+                                volumes,
+                                acquisitions)
+
+    setIndicators(cube, dates, indicators, [assets[idx].saleDate for idx in available])
+
+    # the dates on which an asset did not trade have no indicators
+    cube[~isValid] = np.nan
+
+    instrumentation.increment('fipi_rows_computed_total', int(isValid.sum()), mode='full')
+
+
+    # hand each asset its performance matrix
+    perfMatrices = [None] * len(assets)
+
+    for pos, idx in enumerate(available):
+
+        first, last = firstRows[pos], lastRows[pos]
+
+        if isValid[pos, first:last].all():
+            perfMatrices[idx] = pd.DataFrame(cube[pos, first:last], index=dates[first:last], columns=PERF_COLUMNS,
+                                             copy=False)
+
+        else:
+            perfMatrices[idx] = pd.DataFrame(cube[pos][isValid[pos]], index=dates[isValid[pos]], columns=PERF_COLUMNS)
+
+    return perfMatrices
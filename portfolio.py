@@ -7,12 +7,35 @@ This module implements the portfolio class. The class is responsible for holding
 """
 
 
-from tinydb import TinyDB
+import logging
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
 import securities as st
+from realEstate import RealEstate
+import quoteFeed
+import performanceEngine
+import instrumentation
+import portfolioStore
 import pandas as pd
 import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
+
+# default number of threads used to load the assets of a portfolio
+DEFAULT_NB_WORKERS = 8
+
+# columns of the summary table and columns that are summed in the total of the portfolio
+SUMMARY_COLUMNS = ['Asset ID', 'Purchase date', 'Purchase price', 'Volume', 'Acquisition', 'Close', 'Market',
+                   'Est Profit', '% Est Profit', 'Annual Return']
+TOTAL_COLUMNS = ['Acquisition', 'Market', 'Est Profit']
+
+# keys of the status index
+OPEN = 'OPEN'
+CLOSED = 'CLOSED'
+
+
 
 
 
@@ -24,25 +47,82 @@ class Portfolio(object):
     Attributes :
 
         - portfolioDBFile (string) name of the database file that contains the attributes of the assets in the portfolio
-        - assets (Asset) list of assets
-        - summary (DataFrame) summary table of the assets in the portfolio
+        - assets (list of Assets) list of assets in the order they were added to the portfolio
+        - assetIndex (OrderedDict) assets of the portfolio by asset ID
+        - tickerIndex (dict) assets of the portfolio by ticker (each entry is an OrderedDict of assets by asset ID)
+        - typeIndex (dict) assets of the portfolio by asset type (each entry is an OrderedDict of assets by asset ID)
+        - statusIndex (dict) open and closed (sold) assets of the portfolio (each entry is an OrderedDict of assets by
+        asset ID)
+        - summary (DataFrame) summary table of the assets in the portfolio (one row per asset)
+        - summaryTotal (Series) total of the acquisition, market and estimated profit of the assets in the portfolio
+        - nbWorkers (int) number of threads used to fetch the prices of the assets concurrently (1 fetches them one
+        after the other)
+
+    Note : if the portfolio is created as lazy, the data of the assets, the summary and its total are only computed when
+    they are first needed
+
+    Note : the indexes are kept up to date by addAsset, removeAsset and sellAsset, the assets should not be added,
+    removed or sold otherwise
 
     """
 
-    def __init__(self, portfolioDBFile):
+    def __init__(self, portfolioDBFile, nbWorkers=DEFAULT_NB_WORKERS, lazy=False):
 
         self.portfolioDBFile = portfolioDBFile
-        self.assets = []
-        self.summary = []
+        self.nbWorkers = nbWorkers
+        self.assetIndex = OrderedDict()
+        self.tickerIndex = {}
+        self.typeIndex = {}
+        self.statusIndex = {OPEN: OrderedDict(), CLOSED: OrderedDict()}
+        self._assets = None
+        self._assetList = None
+        self._summary = None
+        self._summaryTotal = None
 
         self.loadPortfolio()
-        self.createSummaryTable()
+
+        # unless the portfolio is lazy, the data of all the assets are computed right away
+        if not lazy:
+            self.setAssetData()
+            self.createSummaryTable()
+
+
+
+    @property
+    def assets(self):
+
+        if self._assets is None:
+            self._assets = list(self.assetIndex.values())
+
+        return self._assets
+
+
+    @property
+    def summary(self):
+
+        if self._summary is None:
+            self.createSummaryTable()
+
+        return self._summary
 
 
+    @property
+    def summaryTotal(self):
 
+        if self._summary is None:
+            self.createSummaryTable()
+
+        return self._summaryTotal
+
+
+
+    @instrumentation.timed('portfolio_load')
     def loadPortfolio(self):
         """
-        This method loads and creates a portfolio of assets from a database on file 
+        This method loads and creates a portfolio of assets from a database on file. Creating the assets is cheap
+        since their data are only computed when they are first needed (see setAssetData). The TinyDB json files do
+        not enforce unique asset IDs : an asset whose ID is already in the portfolio is loaded with a suffixed ID
+        (ex LOT-1-2) and a warning is logged
 
         Args :
             - None
@@ -51,65 +131,434 @@ class Portfolio(object):
             - None
         """
 
-        # load the db from file
-        db = TinyDB(self.portfolioDBFile)
+        # load the records of the assets from the db file (portfolio store or TinyDB json file)
+        records = portfolioStore.readRecords(self.portfolioDBFile)
 
 
         # for each asset in the db
-        for asset in db:
+        for record in records:
 
+            newAsset = createAsset(record)
 
-            if asset['assetType'] == 'COMMON':
+            if newAsset is None:
+                continue
 
-                # create the asset
-                newAsset = st.CommonStock(asset['assetID'],
-                                          asset['purchaseDate'],
-                                          asset['purchasePrice'],
-                                          asset['saleDate'],
-                                          asset['salePrice'],
-                                          asset['volume'],
-                                          asset['percentOwnership'],
-                                          asset['priceFeedRef'],
-                                          asset['priceFeedType'])
+            # give a unique ID to a repeated asset ID
+            if newAsset.assetID in self.assetIndex:
 
-            elif asset['assetType'] == 'PREFFERED':
+                assetID = newAsset.assetID
+                suffix = 2
 
-                # create the asset
-                newAsset = st.PreferredStock(asset['assetID'],
-                                          asset['purchaseDate'],
-                                          asset['purchasePrice'],
-                                          asset['saleDate'],
-                                          asset['salePrice'],
-                                          asset['volume'],
-                                          asset['percentOwnership'],
-                                          asset['priceFeedRef'],
-                                          asset['priceFeedType'])
+                while '%s-%d' % (assetID, suffix) in self.assetIndex:
+                    suffix += 1
 
+                newAsset.assetID = '%s-%d' % (assetID, suffix)
 
-            # append the nes asset to the list of assets in the portfolio
-            self.assets.append(newAsset)
+                logger.warning('asset %s is repeated in %s, loaded as %s', assetID, self.portfolioDBFile,
+                               newAsset.assetID)
 
+            # add the new asset to the portfolio
+            self.addAsset(newAsset)
 
 
-    def getAssetList(self):
+
+    def addAsset(self, asset):
         """
-        This method creates a list of the names of the assets in the portfolio 
+        This method adds an asset to the portfolio and to its indexes. The data of the asset are only computed when they
+        are first needed
 
         Args :
+            - asset (Asset) asset to add, its asset ID must not already be in the portfolio
+
+        Return :
             - None
+        """
+
+        if asset.assetID in self.assetIndex:
+            raise ValueError('Asset %s is already in the portfolio' % asset.assetID)
+
+        self.assetIndex[asset.assetID] = asset
+
+        for index, key in self.getIndexKeys(asset):
+            index.setdefault(key, OrderedDict())[asset.assetID] = asset
+
+        self.invalidateAssets()
+
+
+
+    def removeAsset(self, assetID):
+        """
+        This method removes an asset from the portfolio and from its indexes
+
+        Args :
+            - assetID (string) ID of the asset to remove
 
         Return :
-            - (list of strings) lst of the names of the assets in the portfolio
+            - (Asset) the removed asset
+        """
+
+        asset = self.assetIndex.pop(assetID)
+
+        for index, key in self.getIndexKeys(asset):
+
+            del index[key][assetID]
+
+            # the empty entries are removed so that the keys of the indexes are the values found in the portfolio
+            if len(index[key]) == 0 and index is not self.statusIndex:
+                del index[key]
+
+        self.invalidateAssets()
+
+        return asset
+
+
+
+    def sellAsset(self, assetID, saleDate, salePrice):
+        """
+        This method sells an asset of the portfolio : the sale attributes of the asset are set (which invalidates its
+        data) and the asset is moved to the closed assets
+
+        Args :
+            - assetID (string) ID of the asset to sell
+            - saleDate (string) sale date of the asset (format YYYY-MM-DD)
+            - salePrice (float) unit price of the asset at time of sale
+
+        Return :
+            - (Asset) the sold asset
+        """
+
+        asset = self.assetIndex[assetID]
+
+        self.statusIndex[getAssetStatus(asset)].pop(assetID)
+
+        asset.saleDate = saleDate
+        asset.salePrice = salePrice
+
+        self.statusIndex[getAssetStatus(asset)][assetID] = asset
+
+        # the summary table depends on the sale attributes
+        self._summary = None
+        self._summaryTotal = None
+
+        return asset
+
+
+
+    def getIndexKeys(self, asset):
+        """
+        This helper method gets the secondary indexes of the portfolio and the key of an asset in each of them
+
+        Args :
+            - asset (Asset) asset of the portfolio
+
+        Return :
+            - (list of tuples) index and key of the asset in the index
+        """
+
+        return [(self.tickerIndex, asset.ticker),
+                (self.typeIndex, asset.assetType),
+                (self.statusIndex, getAssetStatus(asset))]
+
+
+
+    def invalidateAssets(self):
+        """
+        This helper method discards the data derived from the list of assets (list of assets, list of asset IDs,
+        summary table and its total) so that they are created again the next time they are needed
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        self._assets = None
+        self._assetList = None
+        self._summary = None
+        self._summaryTotal = None
+
+
+
+    def getAsset(self, assetID):
+        """
+        This method gets the asset with a given id
+
+        Args :
+            - assetID (string) asset ID
+
+        Return :
+            - (Asset) asset with the given ID. None if the asset is not in the portfolio
+        """
+
+        return self.assetIndex.get(assetID)
+
+
+
+    def getAssets(self, assetType=None, ticker=None, isOpen=None):
+        """
+        This method gets the assets of the portfolio that match a set of filters (ex all the open COMMON assets). Only
+        the smallest entry of the indexes that are filtered on is scanned
+
+        Args :
+            - assetType (string) type of the assets (ex COMMON). If None the assets of all types are kept
+            - ticker (string) ticker of the assets. If None the assets of all tickers are kept
+            - isOpen (boolean) true to keep the open assets and false to keep the closed (sold) ones. If None both are
+            kept
+
+        Return :
+            - (list of Assets) assets that match the filters, in the order of the portfolio
+        """
+
+        entries = []
+
+        if assetType is not None:
+            entries.append(self.typeIndex.get(assetType, {}))
+
+        if ticker is not None:
+            entries.append(self.tickerIndex.get(ticker, {}))
+
+        if isOpen is not None:
+            entries.append(self.statusIndex[OPEN if isOpen else CLOSED])
+
+        if len(entries) == 0:
+            return list(self.assets)
+
+        entries.sort(key=len)
+
+        return [asset for assetID, asset in entries[0].items()
+                if all(assetID in entry for entry in entries[1:])]
+
+
+
+    def mapAssets(self, func, assets):
+        """
+        This helper method applies a function to a list of assets. Since the function usually blocks on a price feed,
+        the assets are processed concurrently by a pool of nbWorkers threads (one after the other if there is a single
+        worker)
+
+        Args :
+            - func (function) function that takes an asset
+            - assets (list of Assets) assets to process
+
+        Return :
+            - (list) result of the function for each asset
+        """
+
+        if self.nbWorkers > 1 and len(assets) > 1:
+
+            pool = ThreadPool(min(self.nbWorkers, len(assets)))
+
+            try:
+                return pool.map(func, assets)
+
+            finally:
+                pool.close()
+                pool.join()
+
+        return [func(asset) for asset in assets]
+
+
+
+    @instrumentation.timed('price_fetch')
+    def fetchHistoricalPrices(self):
+        """
+        This method fetches the prices of all the assets in the portfolio. The assets that can be requested in batch
+        are fetched first : each common stock ticker of the yahoo feed is requested once over the widest range needed
+        by the assets that share it and the prices are then sliced out to each asset, and the quotes of all the preferred
+        stocks are fetched at once (see getQuotePrices). The other assets are then fetched concurrently
+
+        Args :
+            - None
+
+        Return :
+            - (list of DataFrames) prices of each asset of the portfolio (None if not available)
+        """
+
+        # determine the widest date range needed for each ticker
+        dateRanges = {}
+
+        for asset in self.assets:
+
+            if asset.feedType == 'YAHOO':
+
+                startDate, endDate = asset.getPerformanceDates()
+
+                if asset.ticker in dateRanges:
+                    startDate = min(startDate, dateRanges[asset.ticker][0])
+                    endDate = max(endDate, dateRanges[asset.ticker][1])
+
+                dateRanges[asset.ticker] = (startDate, endDate)
+
+
+        # fetch each ticker once
+        tickerPrices = st.getYahooPrices(dateRanges) if len(dateRanges) > 0 else {}
+
+        # fetch each quote page once
+        quotePrices = self.getQuotePrices()
+
+
+        def getPrices(asset):
+
+            startDate, endDate = asset.getPerformanceDates()
+
+            # slice the prices of the assets fetched in batch
+            if asset.feedType == 'YAHOO' and tickerPrices.get(asset.ticker) is not None:
+                return tickerPrices[asset.ticker].loc[startDate:endDate]
+
+            # the quotes without history are not fetched again
+            if asset.ticker in quotePrices:
+                return quotePrices[asset.ticker].loc[startDate:endDate] if quotePrices[asset.ticker] is not None \
+                    else None
+
+            return asset.getHistoricalPrice(startDate, endDate)
+
+
+        return self.mapAssets(getPrices, self.assets)
+
+
+
+    def getQuotePrices(self):
+        """
+        This method gets the quote history of all the preferred stocks in the portfolio. The current quotes are
+        fetched concurrently (the page of a quote shared by several assets is fetched once) and the history of each
+        quote is read from the archive over the widest range needed by the assets that share it
+
+        Args :
+            - None
+
+        Return :
+            - (dict) open, low, high, close, adj close and volume matrix of each quote url (see
+            quoteFeed.getHistoricalQuotes)
+        """
+
+        # determine the widest date range needed for each quote
+        quoteRanges = {}
+
+        for asset in self.getAssets(assetType='PREFERRED'):
+
+            if asset.feedType not in quoteFeed.PAGE_PARSERS:
+                continue
+
+            startDate, endDate = asset.getPerformanceDates()
+
+            if asset.ticker in quoteRanges:
+                startDate = min(startDate, quoteRanges[asset.ticker][1])
+                endDate = max(endDate, quoteRanges[asset.ticker][2])
+
+            quoteRanges[asset.ticker] = (asset.feedType, startDate, endDate)
+
+        if len(quoteRanges) == 0:
+            return {}
+
+        return quoteFeed.getHistoricalQuotes(quoteRanges)
+
+
+
+    def setAssetData(self):
         """
+        This method computes the data of all the assets in the portfolio. The prices of all the assets are fetched
+        first, then the performance matrices of all the assets are calculated in a single pass of the performance
+        engine
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        prices = self.fetchHistoricalPrices()
+
+        perfMatrices = performanceEngine.calcPerformanceMatrices(self.assets, prices)
+
+        for asset, perfMatrix, assetPrices in zip(self.assets, perfMatrices, prices):
+            asset.setPerformanceMatrix(perfMatrix, performanceEngine.getAnchors(assetPrices))
+
 
-        
-        assetList = []
+
+    @instrumentation.timed('price_refresh')
+    def refreshPrices(self):
+        """
+        This method refreshes the price data of all the assets in the portfolio without reloading the portfolio from
+        its database. The new trading days of the common stocks are appended to their performance matrices (only the
+        new rows are calculated) and the other assets are calculated again. Only the days missing from the price store
+        are requested from the feeds
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        # determine the range of new trading days needed for each ticker, from the last day of the matrices
+        dateRanges = {}
 
         for asset in self.assets:
-            
-            assetList.append(asset.assetID)
 
-        return assetList
+            lastDate = asset.getLastPerformanceDate()
+
+            if asset.feedType == 'YAHOO' and lastDate is not None:
+
+                startDate, endDate = lastDate, asset.getPerformanceDates()[1]
+
+                if asset.ticker in dateRanges:
+                    startDate = min(startDate, dateRanges[asset.ticker][0])
+                    endDate = max(endDate, dateRanges[asset.ticker][1])
+
+                dateRanges[asset.ticker] = (startDate, endDate)
+
+
+        # fetch each ticker once
+        tickerPrices = st.getYahooPrices(dateRanges) if len(dateRanges) > 0 else {}
+
+        # fetch each quote page once
+        quotePrices = self.getQuotePrices()
+
+
+        def refresh(asset):
+
+            lastDate = asset.getLastPerformanceDate()
+
+            # append the new trading days of the assets fetched in batch
+            if asset.feedType == 'YAHOO' and lastDate is not None and tickerPrices.get(asset.ticker) is not None:
+                asset.appendBars(tickerPrices[asset.ticker].loc[lastDate:asset.getPerformanceDates()[1]])
+
+            # the quotes without history are not fetched again
+            elif asset.ticker in quotePrices and quotePrices[asset.ticker] is None:
+                asset.setPerformanceMatrix(None)
+
+            elif asset.ticker in quotePrices:
+                startDate, endDate = asset.getPerformanceDates()
+                asset.setAssetData(quotePrices[asset.ticker].loc[startDate:endDate])
+
+            else:
+                asset.setAssetData()
+
+
+        self.mapAssets(refresh, self.assets)
+
+        self.createSummaryTable()
+
+
+
+    def getAssetList(self):
+        """
+        This method creates a list of the names of the assets in the portfolio. The list is kept until the assets of
+        the portfolio change
+
+        Args :
+            - None
+
+        Return :
+            - (list of strings) lst of the names of the assets in the portfolio
+        """
+
+        if self._assetList is None:
+            self._assetList = list(self.assetIndex.keys())
+
+        return self._assetList
 
 
     def getGrafParams(self):
@@ -128,69 +577,141 @@ class Portfolio(object):
 
 
 
-    def getAssetIdx(self,assetID):
+    @instrumentation.timed('summary_table')
+    def createSummaryTable(self):
         """
-        This method gets the index in the portfolio of an asset with a given id
-        
+        This method creates a summary table of the key attributes of the assets in the portfolio (one row per asset
+        with typed columns) and the total of the performance indicators that can be summed
+
         Args :
-            - asset id
+            - None
 
         Return :
-            - (int) index of the asset in the portfolio 
+            - None 
         """
 
-        for idx in range(len(self.assets)):
 
-            if self.assets[idx].assetID == assetID:
+        # gather the performance vector of each asset as a record
+        records = [asset.perfVector[SUMMARY_COLUMNS].values[0].tolist() for asset in self.assets]
 
-                return idx
+        # create the summary table in one shot and type its columns
+        self.setSummaryTable(createTypedSummary(records))
 
 
 
+    def setSummaryTable(self, summary):
+        """
+        This method sets the summary table of the portfolio when it has been created outside of the portfolio (ex
+        from a snapshot) and calculates its total
 
-    def createSummaryTable(self):
+        Args :
+            - summary (DataFrame) summary table of the assets in the portfolio
+
+        Return :
+            - None
+        """
+
+        # calculate the sum of some of the performace indicators
+        self._summaryTotal = summary[TOTAL_COLUMNS].sum()
+
+        self._summary = summary
+
+
+
+    def getSummaryTable(self):
         """
-        This method creates a summary table of the key attributes of the assets in the portfolio
+        This method creates the summary table for display : the dates are formatted and the total of the portfolio is
+        added as the last row
 
         Args :
             - None
 
         Return :
-            - None 
+            - (DataFrame) summary table of the portfolio with its total
         """
 
+        summary = self.summary.copy()
+        summary['Purchase date'] = summary['Purchase date'].dt.strftime('%Y-%m-%d')
 
-        # create an empty dataframe with the column headings (must create a dummy row)
-        summary = pd.DataFrame(
-            [['Dummy', '00-00-00', np.nan, np.nan,np.nan ,np.nan, np.nan, np.nan, np.nan, np.nan]],
-            columns=['Asset ID', 'Purchase date', 'Purchase price', 'Volume','Acquisition', 'Close', 'Market',
-                     'Est Profit', '% Est Profit', 'Annual Return'])
+        total = dict((col, '') for col in SUMMARY_COLUMNS)
+        total['Asset ID'] = 'Total'
 
-        # add the perfprmance vector of each asset to the newly created dataframe
-        for asset in self.assets:
-            summary = pd.concat([summary, asset.perfVector])
+        for col in TOTAL_COLUMNS:
+            total[col] = self.summaryTotal[col]
+
+        return pd.concat([summary.astype(object), pd.DataFrame([total], columns=SUMMARY_COLUMNS)], ignore_index=True)
+
+
+
+
+def createTypedSummary(records):
+    """
+    This helper function creates a summary table with typed columns from the records of the assets
+
+    Args :
+        - records (list of lists) values of the summary columns for each asset
+
+    Return :
+        - (DataFrame) summary table
+    """
+
+    summary = pd.DataFrame.from_records(records, columns=SUMMARY_COLUMNS)
+
+    summary['Asset ID'] = summary['Asset ID'].astype(object)
+    summary['Purchase date'] = pd.to_datetime(summary['Purchase date'])
+
+    for col in SUMMARY_COLUMNS[2:]:
+        summary[col] = summary[col].astype(np.float64)
+
+    return summary
 
-        # remove the dummy row
-        summary = summary[1:]
 
 
-        # remove date indexes
-        summary = pd.DataFrame(summary.values, columns=summary.columns)
+def getAssetStatus(asset):
+    """
+    This helper function gets the status of an asset
+
+    Args :
+        - asset (Asset) asset
+
+    Return :
+        - (string) OPEN if the asset is not sold, CLOSED otherwise
+    """
 
-        # create a dataframe with the sum of some of the performace indicators
-        total = pd.DataFrame([['Total', '', '', '', summary['Acquisition'].sum(), '', summary['Market'].sum(), summary['Est Profit'].sum(), '', '']],
-                            columns=['Asset ID', 'Purchase date', 'Purchase price', 'Volume', 'Acquisition', 'Close', 'Market',
-                                     'Est Profit', '% Est Profit', 'Annual Return'])
+    return OPEN if asset.saleDate is None else CLOSED
 
-        # add the sum dataframe to the summary table
-        summary = pd.concat([summary, total])
 
 
-        self.summary = summary
+def createAsset(record):
+    """
+    This helper function creates an asset from its record in the portfolio database
+
+    Args :
+        - record (dict) attributes of the asset as stored in the database
+
+    Return :
+        - (Asset) the new asset. None if the asset type is not supported
+    """
 
+    if record['assetType'] == 'COMMON':
+        assetClass = st.CommonStock
 
+    elif record['assetType'] == 'PREFFERED':
+        assetClass = st.PreferredStock
 
-            
-            
+    elif record['assetType'] == 'REAL':
+        assetClass = RealEstate
 
+    else:
+        return None
 
+    # create the asset
+    return assetClass(record['assetID'],
+                      record['purchaseDate'],
+                      record['purchasePrice'],
+                      record['saleDate'],
+                      record['salePrice'],
+                      record['volume'],
+                      record['percentOwnership'],
+                      record['priceFeedRef'],
+                      record['priceFeedType'])
@@ -0,0 +1,176 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the portfolio registry. The registry keeps the loaded portfolios in memory so that they can be
+reused across the callbacks of the app
+
+"""
+
+
+import os
+import threading
+
+from portfolio import Portfolio
+import portfolioSnapshot
+import tradingCalendar
+
+
+
+class PortfolioRegistry(object):
+    """
+    This class is the portfolio registry. A portfolio is loaded the first time it is requested and is then reused. It
+    is loaded again only when its database file changes, and only its price data are refreshed when a new trading day
+    closes. A snapshot of the computed portfolio is saved each time, so that the next process starts from it
+
+
+    Attributes :
+
+        - portfolios (dict) loaded portfolio of each database file
+        - versions (dict) modification time of the database file and last closing day of the prices of each loaded
+        portfolio
+        - lock (Lock) lock that protects the file locks
+        - fileLocks (dict) one lock per database file so that a portfolio is never loaded twice at the same time
+        - snapshotDir (string) directory of the snapshots of the portfolios
+        - isShared (boolean) true if the portfolios are served from the snapshots published by a loader process (see
+        priceRefresher) rather than computed by this process. The performance matrices are then read only views on the
+        memory mapped snapshots, so the processes that share the snapshots share their memory. A portfolio is only
+        computed by the process when it has no snapshot
+
+    """
+
+    def __init__(self, snapshotDir=portfolioSnapshot.DEFAULT_SNAPSHOT_DIR, isShared=False):
+
+        self.snapshotDir = snapshotDir
+        self.isShared = isShared
+        self.portfolios = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.fileLocks = {}
+
+
+
+    def getFileLock(self, portfolioDBFile):
+        """
+        This method gets the lock of a given database file
+
+        Args :
+            - portfolioDBFile (string) name of the database file of the portfolio
+
+        Return :
+            - (Lock) lock of the database file
+        """
+
+        with self.lock:
+
+            if portfolioDBFile not in self.fileLocks:
+                self.fileLocks[portfolioDBFile] = threading.Lock()
+
+            return self.fileLocks[portfolioDBFile]
+
+
+
+    def getPortfolio(self, portfolioDBFile):
+        """
+        This method gets the portfolio of a given database file. The portfolio is loaded if it is not in the registry
+        or if its database file has changed, and its prices are refreshed if a new trading day has closed since they
+        were computed
+
+        Args :
+            - portfolioDBFile (string) name of the database file of the portfolio
+
+        Return :
+            - (Portfolio) the portfolio
+        """
+
+        with self.getFileLock(portfolioDBFile):
+
+            modificationTime = os.path.getmtime(portfolioDBFile)
+            closingDay = tradingCalendar.getLastClosingDay()
+
+            version = self.versions.get(portfolioDBFile)
+
+            # a shared registry serves the latest snapshot published by the loader process
+            if self.isShared and self.mapSharedSnapshot(portfolioDBFile, modificationTime):
+                return self.portfolios[portfolioDBFile]
+
+            # the portfolio is not loaded or its database has changed, it is loaded from its snapshot if there is
+            # one for the current database
+            if version is None or version[0] != modificationTime:
+
+                snapshot = portfolioSnapshot.loadSnapshot(portfolioDBFile, self.snapshotDir)
+
+                if snapshot is None:
+                    self.portfolios[portfolioDBFile] = Portfolio(portfolioDBFile)
+                    portfolioSnapshot.saveSnapshot(self.portfolios[portfolioDBFile], closingDay, self.snapshotDir)
+                    version = (modificationTime, closingDay)
+
+                else:
+                    self.portfolios[portfolioDBFile] = snapshot[0]
+                    version = (modificationTime, snapshot[1])
+
+
+            # a new trading day has closed since the prices were computed
+            if version[1] != closingDay:
+                self.portfolios[portfolioDBFile].refreshPrices()
+                portfolioSnapshot.saveSnapshot(self.portfolios[portfolioDBFile], closingDay, self.snapshotDir)
+
+            self.versions[portfolioDBFile] = (modificationTime, closingDay)
+
+            return self.portfolios[portfolioDBFile]
+
+
+
+    def mapSharedSnapshot(self, portfolioDBFile, modificationTime):
+        """
+        This method maps the latest snapshot of a portfolio published by the loader process. The snapshot is mapped
+        again only when the loader has published a new one
+
+        Args :
+            - portfolioDBFile (string) name of the database file of the portfolio
+            - modificationTime (float) current modification time of the database file
+
+        Return :
+            - (boolean) true if the portfolio is served from a snapshot, false if there is no snapshot for the
+            current database
+        """
+
+        meta = portfolioSnapshot.readSnapshotMeta(portfolioDBFile, self.snapshotDir)
+
+        if meta is None or meta['modificationTime'] != modificationTime:
+            return False
+
+        # the mapped snapshot is the latest one
+        if self.versions.get(portfolioDBFile) == (modificationTime, meta['closingDay']):
+            return True
+
+        snapshot = portfolioSnapshot.loadSnapshot(portfolioDBFile, self.snapshotDir)
+
+        if snapshot is None:
+            return False
+
+        self.portfolios[portfolioDBFile] = snapshot[0]
+        self.versions[portfolioDBFile] = (modificationTime, snapshot[1])
+
+        return True
+
+
+
+    def getVersion(self, portfolioDBFile):
+        """
+        This method gets the version of a loaded portfolio. The version changes each time the portfolio is loaded again
+        or its prices are refreshed
+
+        Args :
+            - portfolioDBFile (string) name of the database file of the portfolio
+
+        Return :
+            - (tuple) modification time of the database file and last closing day of the prices. None if the portfolio
+            is not loaded
+        """
+
+        return self.versions.get(portfolioDBFile)
+
+
+
+# portfolio registry of the process, shared with the other processes when the environment asks for it
+registry = PortfolioRegistry(isShared=os.environ.get('FIPI_SHARED_SNAPSHOTS') == '1')
@@ -0,0 +1,307 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the snapshots of the computed portfolios. A snapshot stores the performance matrices of all the
+assets of a portfolio as a single columnar block of float64 values on disk. The block is memory mapped when the snapshot
+is loaded, so that a process can start serving a portfolio without fetching or computing anything and the pages of the
+block are shared by all the processes through the page cache of the OS
+
+Each snapshot is written in its own version directory and published by atomically replacing a symbolic link named
+after the portfolio, so the readers always find a complete snapshot. Several processes can save the snapshot of a
+portfolio at once (ex the price refresher and gunicorn workers that boot without a snapshot) : the writers of a
+portfolio take turns on a lock file and the last one published is served
+
+"""
+
+
+import os
+import json
+import fcntl
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from portfolio import Portfolio, SUMMARY_COLUMNS, createTypedSummary
+import performanceEngine
+
+
+# directory of the snapshots
+DEFAULT_SNAPSHOT_DIR = './data/snapshots'
+
+# files of a snapshot
+VALUES_FILE = 'values.npy'
+DATES_FILE = 'dates.npy'
+META_FILE = 'meta.json'
+
+# suffixes of the lock file of the writers and of the link being published
+LOCK_SUFFIX = '.lock'
+LINK_SUFFIX = '.link'
+
+
+
+def getSnapshotDir(portfolioDBFile, snapshotDir=DEFAULT_SNAPSHOT_DIR):
+    """
+    This function gets the directory of the snapshot of a portfolio
+
+    Args :
+        - portfolioDBFile : (string) name of the database file of the portfolio
+        - snapshotDir : (string) directory of the snapshots
+
+    Return :
+        - (string) directory of the snapshot
+    """
+
+    return os.path.join(snapshotDir, os.path.splitext(os.path.basename(portfolioDBFile))[0])
+
+
+
+def getVersionDirs(targetDir):
+    """
+    This helper function gets the version directories of the snapshots of a portfolio
+
+    Args :
+        - targetDir : (string) directory of the snapshot of the portfolio (see getSnapshotDir)
+
+    Return :
+        - (list of strings) version directories of the snapshots
+    """
+
+    snapshotDir, name = os.path.split(targetDir)
+
+    # the names of the versions are the name of the snapshot and a random suffix without dots (see tempfile.mkdtemp)
+    versionDirs = [os.path.join(snapshotDir, fileName) for fileName in os.listdir(snapshotDir)
+                   if fileName.startswith(name + '.') and '.' not in fileName[len(name) + 1:]]
+
+    return [versionDir for versionDir in versionDirs if os.path.isdir(versionDir) and not os.path.islink(versionDir)]
+
+
+
+def publishSnapshot(versionDir, targetDir):
+    """
+    This helper function publishes a version of the snapshot of a portfolio : the link of the snapshot is replaced in
+    a single rename, so a reader finds either the previous version or the new one. The version that was replaced is
+    kept for the readers that are still loading it and the older versions are removed. It must be called by the
+    writer that holds the lock of the snapshot
+
+    Args :
+        - versionDir : (string) version directory of the new snapshot
+        - targetDir : (string) directory of the snapshot of the portfolio (see getSnapshotDir)
+
+    Return :
+        - None
+    """
+
+    previousDir = os.path.realpath(targetDir) if os.path.islink(targetDir) else None
+
+    # the snapshots saved as a plain directory are replaced once by a link
+    if os.path.isdir(targetDir) and not os.path.islink(targetDir):
+        shutil.rmtree(targetDir)
+
+    linkName = '%s.%d%s' % (targetDir, os.getpid(), LINK_SUFFIX)
+
+    if os.path.lexists(linkName):
+        os.remove(linkName)
+
+    os.symlink(os.path.basename(versionDir), linkName)
+    os.rename(linkName, targetDir)
+
+    keptDirs = [os.path.realpath(versionDir), previousDir]
+
+    for oldDir in getVersionDirs(targetDir):
+
+        if os.path.realpath(oldDir) not in keptDirs:
+            shutil.rmtree(oldDir, ignore_errors=True)
+
+
+
+def saveSnapshot(portfolio, closingDay, snapshotDir=DEFAULT_SNAPSHOT_DIR):
+    """
+    This function saves the snapshot of a portfolio. The performance matrices of the assets are stacked in a single
+    (rows x columns) float64 block and the metadata (versions, row range and anchors of each asset, summary) are saved
+    as json. The snapshot is written in a new version directory that is then published (see publishSnapshot). The
+    writers of the snapshot of a portfolio take turns, so a concurrent save only delays this one
+
+    Args :
+        - portfolio : (Portfolio) portfolio to save, its data are computed if they are not already
+        - closingDay : (string) last closing day of the prices of the portfolio (format YYYY-MM-DD)
+        - snapshotDir : (string) directory of the snapshots
+
+    Return :
+        - (string) directory of the snapshot
+    """
+
+    targetDir = getSnapshotDir(portfolio.portfolioDBFile, snapshotDir)
+
+    # stack the performance matrices of the assets
+    blocks = []
+    dates = []
+    assets = []
+    nbRows = 0
+
+    for asset in portfolio.assets:
+
+        perfMatrix = asset.perfMatrix
+
+        if perfMatrix is None:
+            continue
+
+        anchors = asset.anchors
+
+        if anchors is not None:
+            anchors = dict(anchors)
+            anchors['firstDate'] = pd.Timestamp(anchors['firstDate']).strftime('%Y-%m-%d')
+
+        blocks.append(perfMatrix[performanceEngine.PERF_COLUMNS].values.astype(np.float64))
+        dates.append(perfMatrix.index.values.astype('datetime64[ns]'))
+        assets.append({'assetID': asset.assetID, 'start': nbRows, 'stop': nbRows + len(perfMatrix),
+                       'anchors': anchors})
+
+        nbRows += len(perfMatrix)
+
+
+    summary = portfolio.summary.copy()
+    summary['Purchase date'] = summary['Purchase date'].dt.strftime('%Y-%m-%d')
+
+    meta = {'portfolioDBFile': portfolio.portfolioDBFile,
+            'modificationTime': os.path.getmtime(portfolio.portfolioDBFile),
+            'closingDay': closingDay,
+            'columns': performanceEngine.PERF_COLUMNS,
+            'assets': assets,
+            'summary': summary[SUMMARY_COLUMNS].values.tolist()}
+
+
+    if not os.path.exists(snapshotDir):
+
+        try:
+            os.makedirs(snapshotDir)
+
+        except OSError:
+            # another writer created it
+            if not os.path.isdir(snapshotDir):
+                raise
+
+
+    # the writers of the snapshot take turns on its lock file, which is released when it is closed
+    with open(targetDir + LOCK_SUFFIX, 'w') as lockFile:
+
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+
+        # write the snapshot in a new version directory
+        versionDir = tempfile.mkdtemp(prefix=os.path.basename(targetDir) + '.', dir=snapshotDir)
+
+        try:
+            emptyBlock = np.empty((0, len(performanceEngine.PERF_COLUMNS)))
+            np.save(os.path.join(versionDir, VALUES_FILE), np.concatenate(blocks) if len(blocks) > 0 else emptyBlock)
+            np.save(os.path.join(versionDir, DATES_FILE), np.concatenate(dates) if len(dates) > 0 else
+                    np.empty(0, dtype='datetime64[ns]'))
+
+            with open(os.path.join(versionDir, META_FILE), 'w') as metaFile:
+                json.dump(meta, metaFile)
+
+            # the processes that mapped the previous snapshot keep their pages
+            publishSnapshot(versionDir, targetDir)
+
+        except:
+            shutil.rmtree(versionDir, ignore_errors=True)
+            raise
+
+    return targetDir
+
+
+
+def readSnapshotMeta(portfolioDBFile, snapshotDir=DEFAULT_SNAPSHOT_DIR):
+    """
+    This function reads the metadata of the snapshot of a portfolio
+
+    Args :
+        - portfolioDBFile : (string) name of the database file of the portfolio
+        - snapshotDir : (string) directory of the snapshots
+
+    Return :
+        - (dict) metadata of the snapshot. None if there is no snapshot
+    """
+
+    return readMeta(getSnapshotDir(portfolioDBFile, snapshotDir))
+
+
+
+def readMeta(directory):
+    """
+    This helper function reads the metadata of a snapshot from its directory
+
+    Args :
+        - directory : (string) directory of the snapshot
+
+    Return :
+        - (dict) metadata of the snapshot. None if there is no snapshot
+    """
+
+    metaFileName = os.path.join(directory, META_FILE)
+
+    try:
+        with open(metaFileName) as metaFile:
+            return json.load(metaFile)
+
+    except (IOError, OSError, ValueError):
+        return None
+
+
+
+def loadSnapshot(portfolioDBFile, snapshotDir=DEFAULT_SNAPSHOT_DIR):
+    """
+    This function loads a portfolio from its snapshot. The assets are created from the database of the portfolio
+    without computing anything and their performance matrices are views on the memory mapped block of the snapshot
+
+    Args :
+        - portfolioDBFile : (string) name of the database file of the portfolio
+        - snapshotDir : (string) directory of the snapshots
+
+    Return :
+        - (tuple) the portfolio and the last closing day of its prices. None if there is no snapshot or if the
+        database of the portfolio has changed since the snapshot was saved
+    """
+
+    # the metadata and the blocks are read from the same version of the snapshot, even if a new one is published
+    versionDir = os.path.realpath(getSnapshotDir(portfolioDBFile, snapshotDir))
+
+    meta = readMeta(versionDir)
+
+    if meta is None or meta['modificationTime'] != os.path.getmtime(portfolioDBFile):
+        return None
+
+    try:
+        values = np.load(os.path.join(versionDir, VALUES_FILE), mmap_mode='r')
+        dates = np.load(os.path.join(versionDir, DATES_FILE), mmap_mode='r')
+
+    except (IOError, OSError, ValueError):
+        return None
+
+
+    # create the assets without computing their data
+    portfolio = Portfolio(portfolioDBFile, lazy=True)
+
+    for assetMeta in meta['assets']:
+
+        asset = portfolio.getAsset(assetMeta['assetID'])
+
+        if asset is None:
+            return None
+
+        start, stop = assetMeta['start'], assetMeta['stop']
+
+        perfMatrix = pd.DataFrame(values[start:stop], index=pd.DatetimeIndex(dates[start:stop], name='Date'),
+                                  columns=meta['columns'], copy=False)
+
+        anchors = assetMeta['anchors']
+
+        if anchors is not None:
+            anchors['firstDate'] = pd.Timestamp(anchors['firstDate'])
+
+        asset.setPerformanceMatrix(perfMatrix, anchors)
+
+
+    portfolio.setSummaryTable(createTypedSummary(meta['summary']))
+
+    return portfolio, meta['closingDay']
@@ -0,0 +1,439 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the portfolio store. The lots of a portfolio are kept in a sqlite file with one row per lot and
+indexes on the asset ID, the asset type, the price feed reference and the sale date, so that a lot is read, filtered,
+added or edited without reading or rewriting the whole portfolio (as the TinyDB json files did). The lots are written
+in transactions and a batch of lots is written at once. The portfolios still in the TinyDB format can be read as well
+and are migrated to the store once
+
+usage (migrate TinyDB portfolios to the store, next to the json files) : python portfolioStore.py JSON_FILE [...]
+
+"""
+
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+
+from tinydb import TinyDB
+
+
+# attributes of the lots as in the records of the TinyDB portfolios, in the order of the columns of the store
+RECORD_COLUMNS = ['assetID', 'assetType', 'purchaseDate', 'purchasePrice', 'saleDate', 'salePrice', 'volume',
+                  'percentOwnership', 'priceFeedType', 'priceFeedRef', 'debtFeedType', 'debtFeedRef', 'thresholds']
+
+# first bytes of a sqlite file and extensions of the store files
+SQLITE_HEADER = b'SQLite format 3\x00'
+STORE_EXTENSIONS = ('.db', '.sqlite')
+
+
+
+class PortfolioStore(object):
+    """
+    This class is the portfolio store. The lots of a portfolio are kept in a sqlite file, in the order they were added.
+    Iterating over the store gives the records of the lots, as iterating over a TinyDB portfolio does
+
+    Note : the store is written with the default rollback journal so that each transaction changes the modification
+    time of the file, which is what the registry and the snapshots check to know that a portfolio has changed
+
+
+    Attributes :
+
+        - storeFile : (string) name of the sqlite file that contains the lots
+        - lock : (Lock) lock that protects the creation of the tables
+        - isCreated : (boolean) true when the tables of the store have been created
+
+    """
+
+    def __init__(self, storeFile):
+
+        self.storeFile = storeFile
+        self.lock = threading.Lock()
+        self.isCreated = False
+
+
+
+    def __iter__(self):
+
+        return iter(self.readLots())
+
+
+
+    def __len__(self):
+
+        conn = self.connect()
+
+        try:
+            return conn.execute('SELECT COUNT(*) FROM lots').fetchone()[0]
+
+        finally:
+            conn.close()
+
+
+
+    def connect(self):
+        """
+        This method opens a connection to the store and creates the tables if they do not exist. A new connection is
+        opened for each operation since sqlite connections can not be shared between threads
+
+        Args :
+            - None
+
+        Return :
+            - (Connection) connection to the store
+        """
+
+        conn = sqlite3.connect(self.storeFile, timeout=30)
+
+        if not self.isCreated:
+
+            with self.lock:
+
+                conn.execute('CREATE TABLE IF NOT EXISTS lots (id INTEGER PRIMARY KEY, assetID TEXT NOT NULL UNIQUE, '
+                             'assetType TEXT NOT NULL, purchaseDate TEXT, purchasePrice REAL, saleDate TEXT, '
+                             'salePrice REAL, volume REAL, percentOwnership REAL, priceFeedType TEXT, '
+                             'priceFeedRef TEXT, debtFeedType TEXT, debtFeedRef TEXT, thresholds TEXT)')
+
+                # the asset ID is indexed by its unique constraint
+                conn.execute('CREATE INDEX IF NOT EXISTS lotsAssetType ON lots (assetType)')
+                conn.execute('CREATE INDEX IF NOT EXISTS lotsPriceFeedRef ON lots (priceFeedRef)')
+                conn.execute('CREATE INDEX IF NOT EXISTS lotsSaleDate ON lots (saleDate)')
+                conn.commit()
+
+                self.isCreated = True
+
+        return conn
+
+
+
+    def readLots(self, assetType=None, priceFeedRef=None, isOpen=None):
+        """
+        This method reads the lots of the portfolio, optionally filtered on the indexed attributes
+
+        Args :
+            - assetType : (string) type of the lots (ex COMMON). If None the lots of all the types are read
+            - priceFeedRef : (string) price feed reference of the lots (ticker or url). If None the lots of all the
+            references are read
+            - isOpen : (bool) True to read the lots that are not sold, False the sold lots. If None all the lots are
+            read
+
+        Return :
+            - (list of dicts) records of the lots in the order they were added
+        """
+
+        clauses = []
+        params = []
+
+        if assetType is not None:
+            clauses.append('assetType = ?')
+            params.append(assetType)
+
+        if priceFeedRef is not None:
+            clauses.append('priceFeedRef = ?')
+            params.append(priceFeedRef)
+
+        if isOpen is not None:
+            clauses.append('saleDate IS NULL' if isOpen else 'saleDate IS NOT NULL')
+
+        query = 'SELECT %s FROM lots' % ', '.join(RECORD_COLUMNS)
+
+        if len(clauses) > 0:
+            query += ' WHERE ' + ' AND '.join(clauses)
+
+        conn = self.connect()
+
+        try:
+            rows = conn.execute(query + ' ORDER BY id', params).fetchall()
+
+        finally:
+            conn.close()
+
+        return [createRecord(row) for row in rows]
+
+
+
+    def getLot(self, assetID):
+        """
+        This method reads a lot of the portfolio
+
+        Args :
+            - assetID : (string) ID of the lot
+
+        Return :
+            - (dict) record of the lot. None if the lot is not in the portfolio
+        """
+
+        conn = self.connect()
+
+        try:
+            row = conn.execute('SELECT %s FROM lots WHERE assetID = ?' % ', '.join(RECORD_COLUMNS),
+                               (assetID,)).fetchone()
+
+        finally:
+            conn.close()
+
+        return createRecord(row) if row is not None else None
+
+
+
+    def insertMany(self, records, replace=False):
+        """
+        This method adds a batch of lots to the portfolio in a single transaction : either all the lots are added or
+        none is
+
+        Args :
+            - records : (list of dicts) records of the lots, with at least an asset ID and an asset type (the missing
+            attributes are None and the missing thresholds are empty)
+            - replace : (bool) True to replace all the lots of the portfolio by the batch
+
+        Return :
+            - (int) number of lots added
+
+        Raise :
+            - (ValueError) if an asset ID is already in the portfolio or is repeated in the batch
+        """
+
+        rows = [getRecordRow(record) for record in records]
+
+        conn = self.connect()
+
+        try:
+            with conn:
+
+                if replace:
+                    conn.execute('DELETE FROM lots')
+
+                conn.executemany('INSERT INTO lots (%s) VALUES (%s)' % (', '.join(RECORD_COLUMNS),
+                                                                        ', '.join('?' * len(RECORD_COLUMNS))), rows)
+
+        except sqlite3.IntegrityError as error:
+            raise ValueError('The lots could not be added, no lot was added : %s' % error)
+
+        finally:
+            conn.close()
+
+        return len(rows)
+
+
+
+    def insert(self, record):
+        """
+        This method adds a lot to the portfolio
+
+        Args :
+            - record : (dict) record of the lot (see insertMany)
+
+        Return :
+            - None
+
+        Raise :
+            - (ValueError) if the asset ID is already in the portfolio
+        """
+
+        self.insertMany([record])
+
+
+
+    def updateLot(self, assetID, **attributes):
+        """
+        This method sets attributes of a lot of the portfolio (ex its sale date and sale price when it is sold)
+
+        Args :
+            - assetID : (string) ID of the lot
+            - attributes : new values of the attributes of the lot (all but the asset ID)
+
+        Return :
+            - None
+
+        Raise :
+            - (ValueError) if an attribute is not an attribute of the lots
+            - (KeyError) if the lot is not in the portfolio
+        """
+
+        invalid = [name for name in attributes if name not in RECORD_COLUMNS]
+
+        if len(invalid) > 0:
+            raise ValueError('The lots have no attribute %s' % ', '.join(sorted(invalid)))
+
+        if len(attributes) == 0:
+            return
+
+        names = sorted(attributes)
+        assignments = ', '.join(name + ' = ?' for name in names)
+        values = [json.dumps(attributes[name]) if name == 'thresholds' else attributes[name] for name in names]
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                cursor = conn.execute('UPDATE lots SET %s WHERE assetID = ?' % assignments, values + [assetID])
+
+        finally:
+            conn.close()
+
+        if cursor.rowcount == 0:
+            raise KeyError(assetID)
+
+
+
+    def removeLot(self, assetID):
+        """
+        This method removes a lot from the portfolio
+
+        Args :
+            - assetID : (string) ID of the lot
+
+        Return :
+            - None
+
+        Raise :
+            - (KeyError) if the lot is not in the portfolio
+        """
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                cursor = conn.execute('DELETE FROM lots WHERE assetID = ?', (assetID,))
+
+        finally:
+            conn.close()
+
+        if cursor.rowcount == 0:
+            raise KeyError(assetID)
+
+
+
+    def purge(self):
+        """
+        This method removes all the lots of the portfolio
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        self.insertMany([], replace=True)
+
+
+
+def getRecordRow(record):
+    """
+    This helper function creates the row of the store of a lot from its record
+
+    Args :
+        - record : (dict) record of the lot
+
+    Return :
+        - (tuple) values of the columns of the lot (see RECORD_COLUMNS)
+    """
+
+    values = [record.get(name) for name in RECORD_COLUMNS]
+    values[RECORD_COLUMNS.index('thresholds')] = json.dumps(record.get('thresholds') or [])
+
+    return tuple(values)
+
+
+
+def createRecord(row):
+    """
+    This helper function creates the record of a lot from its row in the store
+
+    Args :
+        - row : (tuple) values of the columns of the lot (see RECORD_COLUMNS)
+
+    Return :
+        - (dict) record of the lot
+    """
+
+    record = dict(zip(RECORD_COLUMNS, row))
+    record['thresholds'] = json.loads(record['thresholds']) if record['thresholds'] is not None else []
+
+    return record
+
+
+
+def isPortfolioStore(portfolioDBFile):
+    """
+    This function determines if a portfolio database file is a portfolio store (sqlite) or a TinyDB json file. An
+    existing file is recognized by its content, a new file by its extension
+
+    Args :
+        - portfolioDBFile : (string) name of the database file of the portfolio
+
+    Return :
+        - (bool) True if the file is a portfolio store
+    """
+
+    if os.path.exists(portfolioDBFile) and os.path.getsize(portfolioDBFile) > 0:
+
+        with open(portfolioDBFile, 'rb') as dbFile:
+            return dbFile.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+    return os.path.splitext(portfolioDBFile)[1].lower() in STORE_EXTENSIONS
+
+
+
+def readRecords(portfolioDBFile):
+    """
+    This function reads the records of the lots of a portfolio from its database file, a portfolio store or a TinyDB
+    json file
+
+    Args :
+        - portfolioDBFile : (string) name of the database file of the portfolio
+
+    Return :
+        - (list of dicts) records of the lots in the order they were added
+    """
+
+    if isPortfolioStore(portfolioDBFile):
+        return PortfolioStore(portfolioDBFile).readLots()
+
+    db = TinyDB(portfolioDBFile)
+
+    try:
+        return [dict(record) for record in db]
+
+    finally:
+        db.close()
+
+
+
+def migrate(jsonFile, storeFile=None):
+    """
+    This function migrates a TinyDB portfolio to a portfolio store. The lots of the store are replaced by the lots of
+    the json file in a single transaction, so the migration can be run again
+
+    Args :
+        - jsonFile : (string) name of the TinyDB json file of the portfolio
+        - storeFile : (string) name of the sqlite file of the store. If None the json file name with the .db extension
+        is used
+
+    Return :
+        - (tuple) name of the sqlite file of the store and number of lots migrated
+    """
+
+    if storeFile is None:
+        storeFile = os.path.splitext(jsonFile)[0] + '.db'
+
+    nbLots = PortfolioStore(storeFile).insertMany(readRecords(jsonFile), replace=True)
+
+    return storeFile, nbLots
+
+
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        sys.exit('usage : python portfolioStore.py JSON_FILE [JSON_FILE ...]')
+
+    for jsonFile in sys.argv[1:]:
+
+        storeFile, nbLots = migrate(jsonFile)
+        print('%d lots migrated from %s to %s' % (nbLots, jsonFile, storeFile))
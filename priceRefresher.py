@@ -0,0 +1,246 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the background price refresher. After each market close the refresher appends the new bars of
+every ticker referenced by the portfolios to the local price store and archives the closing quotes of the preferred
+stocks, so that the app only reads data that are already on disk. The module can be run as a separate worker process (see the Procfile)
+
+"""
+
+
+import sys
+import logging
+import threading
+import datetime
+
+import pandas as pd
+
+import securities as st
+import quoteFeed
+import tradingCalendar
+import portfolioStore
+from portfolioRegistry import PortfolioRegistry
+
+
+# database files of the portfolios to refresh
+PORTFOLIO_DB_FILES = ['./data/reg.db', './data/fidAmelie.db', './data/fiDB.db']
+
+# delay after the market close before the prices are refreshed (the feeds publish the final bars after the close)
+REFRESH_DELAY = datetime.timedelta(minutes=30)
+
+
+logger = logging.getLogger(__name__)
+
+
+
+def getDateRanges(portfolioDBFiles):
+    """
+    This function determines the widest date range needed for each yahoo ticker referenced by a set of portfolios
+
+    Args :
+        - portfolioDBFiles : (list of strings) database files of the portfolios
+
+    Return :
+        - (dict) start and end dates (format YYYY-MM-DD) of each ticker
+    """
+
+    today = datetime.datetime.now().strftime('%Y-%m-%d')
+
+    dateRanges = {}
+
+    for portfolioDBFile in portfolioDBFiles:
+
+        for record in portfolioStore.readRecords(portfolioDBFile):
+
+            if record['priceFeedType'] != 'YAHOO':
+                continue
+
+            startDate = record['purchaseDate']
+            endDate = record['saleDate'] if record['saleDate'] is not None else today
+
+            if record['priceFeedRef'] in dateRanges:
+                startDate = min(startDate, dateRanges[record['priceFeedRef']][0])
+                endDate = max(endDate, dateRanges[record['priceFeedRef']][1])
+
+            dateRanges[record['priceFeedRef']] = (startDate, endDate)
+
+    return dateRanges
+
+
+
+def getQuoteRefs(portfolioDBFiles):
+    """
+    This function gets the quotes referenced by a set of portfolios (the feeds that only give the current price)
+
+    Args :
+        - portfolioDBFiles : (list of strings) database files of the portfolios
+
+    Return :
+        - (list of tuples) feed type and url of each quote
+    """
+
+    quoteRefs = set()
+
+    for portfolioDBFile in portfolioDBFiles:
+
+        for record in portfolioStore.readRecords(portfolioDBFile):
+
+            if record['priceFeedType'] in quoteFeed.PAGE_PARSERS and record['saleDate'] is None:
+                quoteRefs.add((record['priceFeedType'], record['priceFeedRef']))
+
+    return sorted(quoteRefs)
+
+
+
+def refreshPrices(portfolioDBFiles=PORTFOLIO_DB_FILES):
+    """
+    This function appends to the local price store the new bars of every ticker referenced by a set of portfolios and
+    archives the current quotes of the preferred stocks
+
+    Args :
+        - portfolioDBFiles : (list of strings) database files of the portfolios
+
+    Return :
+        - (list of strings) tickers for which new prices were written to the store
+    """
+
+    updatedTickers = st.updateYahooPrices(getDateRanges(portfolioDBFiles))
+
+    logger.info('refreshed %d tickers : %s', len(updatedTickers), ', '.join(updatedTickers))
+
+    # the quotes of the available pages are archived even if some pages are not available
+    quotePrices = quoteFeed.fetchQuotes(getQuoteRefs(portfolioDBFiles))
+
+    logger.info('archived %d quotes', len([prices for prices in quotePrices.values() if prices is not None]))
+
+    return updatedTickers
+
+
+
+def getNextRefreshTime(now=None):
+    """
+    This function determines the next time the prices have to be refreshed, that is the next market close plus the
+    refresh delay
+
+    Args :
+        - now : (datetime) time of the market. If None the current time of the market is used
+
+    Return :
+        - (datetime) next refresh time in the time zone of the market
+    """
+
+    if now is None:
+        now = tradingCalendar.getMarketTime()
+
+    refreshDay = tradingCalendar.getLastTradingDay(now)
+
+    while True:
+
+        refreshTime = datetime.datetime.combine(pd.Timestamp(refreshDay).date(), tradingCalendar.MARKET_CLOSE) + \
+            REFRESH_DELAY
+
+        if refreshTime > now:
+            return refreshTime
+
+        refreshDay = tradingCalendar.getNextTradingDay(refreshDay)
+
+
+
+class PriceRefresher(threading.Thread):
+    """
+    This class is the background price refresher. The refresher thread waits for the next market close, refreshes
+    the prices of the portfolios in the price store and then refreshes the portfolios of a registry. Since the registry
+    saves a snapshot of each refreshed portfolio, a refresher run as a separate process is the loader of the snapshots
+    shared by the web processes
+
+
+    Attributes :
+
+        - portfolioDBFiles : (list of strings) database files of the portfolios to refresh
+        - registry : (PortfolioRegistry) registry of the portfolios to refresh. None if only the price store is
+        refreshed
+        - stopEvent : (Event) event set to stop the refresher
+
+    """
+
+    def __init__(self, portfolioDBFiles=PORTFOLIO_DB_FILES, registry=None):
+
+        threading.Thread.__init__(self, name='PriceRefresher')
+        self.daemon = True
+
+        self.portfolioDBFiles = portfolioDBFiles
+        self.registry = registry
+        self.stopEvent = threading.Event()
+
+
+
+    def refresh(self):
+        """
+        This method refreshes the prices in the price store and the loaded portfolios of the registry. An error is
+        logged rather than raised so that the refresher keeps running
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        try:
+            refreshPrices(self.portfolioDBFiles)
+
+            # refresh the portfolios of the registry, which publishes their snapshots
+            if self.registry is not None:
+                for portfolioDBFile in self.portfolioDBFiles:
+                    self.registry.getPortfolio(portfolioDBFile)
+
+        except Exception:
+            logger.exception('price refresh failed')
+
+
+
+    def run(self):
+
+        while not self.stopEvent.is_set():
+
+            refreshTime = getNextRefreshTime()
+            delay = (refreshTime - tradingCalendar.getMarketTime()).total_seconds()
+
+            logger.info('next price refresh at %s', refreshTime)
+
+            # wait until the refresh time unless the refresher is stopped
+            if self.stopEvent.wait(max(delay, 0)):
+                break
+
+            self.refresh()
+
+
+
+    def stop(self):
+        """
+        This method stops the refresher
+
+        Args :
+            - None
+
+        Return :
+            - None
+        """
+
+        self.stopEvent.set()
+
+
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    # the worker process is the loader of the portfolio snapshots shared by the web processes
+    refresher = PriceRefresher(registry=PortfolioRegistry())
+
+    # bring the store and the snapshots up to date right away, then refresh after each market close
+    refresher.refresh()
+
+    if '--once' not in sys.argv:
+        refresher.run()
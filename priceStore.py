@@ -0,0 +1,535 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the local price store. The store keeps the daily price bars of each ticker in a sqlite file on
+disk so that only the trading days that are not already on disk have to be requested from the price feed. The store is
+also the archive of the quotes of the feeds that only give the current price (ex the preferred stock pages) : the quote
+of each scrape is kept as the bar of its day, under the url of the feed, so that their history accumulates over time
+
+usage (import the daily prices of a feed from a csv file) : python priceStore.py FEED_REF CSV_FILE
+
+"""
+
+
+import os
+import sys
+import sqlite3
+import threading
+import datetime
+
+import pandas as pd
+
+import tradingCalendar
+import instrumentation
+
+
+# name of the price columns as returned by the price feeds and the matching column names in the store
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+STORE_COLUMNS = ['open', 'high', 'low', 'close', 'adjClose', 'volume']
+
+# default location of the store (FIPI_PRICE_STORE sets another location, ex a scratch store for a benchmark)
+DEFAULT_STORE_FILE = os.environ.get('FIPI_PRICE_STORE', './data/prices.db')
+
+
+
+class PriceStore(object):
+    """
+    This class is the local price store. The daily bars of each ticker are kept in a sqlite file together with the
+    date range that has already been requested from the feed (the coverage) for the ticker
+
+
+    Attributes :
+
+        - storeFile : (string) name of the sqlite file that contains the price bars
+        - lock : (Lock) lock that protects the creation of the tables and of the ticker locks
+        - tickerLocks : (dict) one lock per ticker so that a ticker is never fetched twice at the same time
+        - isCreated : (boolean) true when the tables of the store have been created
+
+    """
+
+    def __init__(self, storeFile=DEFAULT_STORE_FILE):
+
+        self.storeFile = storeFile
+        self.lock = threading.Lock()
+        self.tickerLocks = {}
+        self.isCreated = False
+
+
+
+    def connect(self):
+        """
+        This method opens a connection to the store and creates the tables if they do not exist. A new connection is
+        opened for each operation since sqlite connections can not be shared between threads
+
+        Args :
+            - None
+
+        Return :
+            - (Connection) connection to the store
+        """
+
+        conn = sqlite3.connect(self.storeFile, timeout=30)
+
+        if not self.isCreated:
+
+            with self.lock:
+
+                conn.execute('CREATE TABLE IF NOT EXISTS prices (ticker TEXT, date TEXT, open REAL, high REAL, '
+                             'low REAL, close REAL, adjClose REAL, volume REAL, PRIMARY KEY (ticker, date))')
+                conn.execute('CREATE TABLE IF NOT EXISTS coverage (ticker TEXT PRIMARY KEY, startDate TEXT, '
+                             'endDate TEXT)')
+                conn.execute('CREATE INDEX IF NOT EXISTS pricesDate ON prices (date)')
+                conn.commit()
+
+                self.isCreated = True
+
+        return conn
+
+
+
+    def getTickerLock(self, ticker):
+        """
+        This method gets the lock of a given ticker
+
+        Args :
+            - ticker : (string) id of stock on markets
+
+        Return :
+            - (Lock) lock of the ticker
+        """
+
+        with self.lock:
+
+            if ticker not in self.tickerLocks:
+                self.tickerLocks[ticker] = threading.Lock()
+
+            return self.tickerLocks[ticker]
+
+
+
+    def getCoverage(self, ticker):
+        """
+        This method gets the date range that has already been requested from the feed for a given ticker
+
+        Args :
+            - ticker : (string) id of stock on markets
+
+        Return :
+            - (tuple of strings) start and end dates (format YYYY-MM-DD) of the coverage. None if the ticker is not
+            in the store
+        """
+
+        conn = self.connect()
+
+        try:
+            row = conn.execute('SELECT startDate, endDate FROM coverage WHERE ticker = ?', (ticker,)).fetchone()
+
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+
+        return row[0], row[1]
+
+
+
+    def getDataVersion(self):
+        """
+        This method gets the version of the data in the store, which is the most recent date of the price bars. The
+        version changes when the store advances to a new trading day
+
+        Args :
+            - None
+
+        Return :
+            - (string) most recent date of the price bars (format YYYY-MM-DD). None if the store is empty
+        """
+
+        conn = self.connect()
+
+        try:
+            return conn.execute('SELECT MAX(date) FROM prices').fetchone()[0]
+
+        finally:
+            conn.close()
+
+
+
+    def readPrices(self, ticker, startDate, endDate):
+        """
+        This method reads the price bars of a ticker between a set of dates from the store
+
+        Args :
+            - ticker : (string) id of stock on markets
+            - startDate : (string) start date of the extraction (format YYYY-MM-DD)
+            - endDate : (string) end date of the extraction (format YYYY-MM-DD)
+
+        Return :
+            - (DataFrame) open, low, high, close, adj close and volume matrix between a set of dates
+        """
+
+        conn = self.connect()
+
+        try:
+            rows = conn.execute('SELECT date, ' + ', '.join(STORE_COLUMNS) + ' FROM prices WHERE ticker = ? AND '
+                                'date >= ? AND date <= ? ORDER BY date', (ticker, startDate, endDate)).fetchall()
+
+        finally:
+            conn.close()
+
+        index = pd.DatetimeIndex([row[0] for row in rows], name='Date')
+
+        return pd.DataFrame([row[1:] for row in rows], index=index, columns=PRICE_COLUMNS, dtype=float)
+
+
+
+    def writePrices(self, ticker, prices, startDate, endDate):
+        """
+        This method writes price bars of a ticker to the store and extends the coverage of the ticker with the
+        requested dates, up to the last market close. The bars and the coverage are written in a single transaction
+
+        Args :
+            - ticker : (string) id of stock on markets
+            - prices : (DataFrame) open, low, high, close, adj close and volume matrix returned by the feed
+            - startDate : (string) start date that was requested from the feed (format YYYY-MM-DD)
+            - endDate : (string) end date that was requested from the feed (format YYYY-MM-DD)
+
+        Return :
+            - None
+        """
+
+        rows = getPriceRows(ticker, prices)
+
+        # the days after the last market close are not covered since their bars are not final
+        endDate = min(endDate, tradingCalendar.getLastClosingDay())
+
+        coverage = self.getCoverage(ticker)
+
+        if coverage is not None:
+            startDate = min(startDate, coverage[0])
+            endDate = max(endDate, coverage[1])
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                conn.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)', (ticker, startDate, endDate))
+
+        finally:
+            conn.close()
+
+
+
+    def writeBars(self, ticker, prices):
+        """
+        This method writes price bars of a ticker to the store in a single transaction, without changing the coverage
+        of the ticker. The bars replace the bars of the same days already in the store. This is how the quotes are
+        archived (the last quote of a day is its bar) and how the prices are imported
+
+        Args :
+            - ticker : (string) id of stock on markets, or url of the feed of a quote
+            - prices : (DataFrame) open, low, high, close, adj close and volume matrix
+
+        Return :
+            - (int) number of bars written
+        """
+
+        rows = getPriceRows(ticker, prices)
+
+        conn = self.connect()
+
+        try:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        finally:
+            conn.close()
+
+        return len(rows)
+
+
+
+    def importCsv(self, ticker, csvFile):
+        """
+        This method imports the daily prices of a ticker from a csv file, ex to backfill the quote archive of a
+        preferred stock. The file has a Date column and at least a Close column, the missing price columns are set to
+        the close and a missing volume to 0
+
+        Args :
+            - ticker : (string) id of stock on markets, or url of the feed of a quote
+            - csvFile : (string) name of the csv file
+
+        Return :
+            - (int) number of bars imported
+        """
+
+        return self.writeBars(ticker, readPriceCsv(csvFile))
+
+
+
+    def getMissingRanges(self, ticker, startDate, endDate):
+        """
+        This method determines the date ranges that have to be requested from the feed to cover a set of dates for a
+        given ticker. The last day of the coverage is requested again with the trailing days since its bar may have
+        been adjusted
+
+        Args :
+            - ticker : (string) id of stock on markets
+            - startDate : (string) start date of the extraction (format YYYY-MM-DD)
+            - endDate : (string) end date of the extraction (format YYYY-MM-DD)
+
+        Return :
+            - (list of tuples) start and end dates (format YYYY-MM-DD) of the ranges to request from the feed
+        """
+
+        coverage = self.getCoverage(ticker)
+
+        # nothing on disk, the whole range is requested
+        if coverage is None:
+            return [(startDate, endDate)]
+
+        missingRanges = []
+
+        # leading days before the coverage
+        if startDate < coverage[0]:
+            missingRanges.append((startDate, shiftDate(coverage[0], -1)))
+
+        # trailing days after the coverage, only if there is at least one trading day that is not covered
+        if endDate > coverage[1] and len(tradingCalendar.getBusinessDays(shiftDate(coverage[1], 1), endDate)) > 0:
+            missingRanges.append((coverage[1], endDate))
+
+        return missingRanges
+
+
+
+    def getHistoricalPrice(self, ticker, startDate, endDate, fetcher):
+        """
+        Gets the historical prices (open, low, high, close, adj close and volume) of a ticker between a set of dates.
+        The prices are served from the store and only the missing days are requested from the feed
+
+        Args :
+            - ticker : (string) id of stock on markets
+            - startDate : (string) start date of the extraction (format YYYY-MM-DD)
+            - endDate : (string) end date of the extraction (format YYYY-MM-DD)
+            - fetcher : (function) function (ticker, startDate, endDate) that gets the prices from the feed
+
+        Return :
+            - (DataFrame) open, low, high, close, adj close and volume matrix between a set of dates. None if the
+            prices are neither in the store nor available from the feed
+        """
+
+        startDate = formatDate(startDate)
+        endDate = formatDate(endDate)
+
+        with self.getTickerLock(ticker):
+
+            for fetchStart, fetchEnd in self.getMissingRanges(ticker, startDate, endDate):
+
+                # if the feed is not available the prices already on disk are served
+                try:
+                    prices = fetcher(ticker, fetchStart, fetchEnd)
+
+                except Exception:
+                    continue
+
+                self.writePrices(ticker, prices, fetchStart, fetchEnd)
+
+            histValues = self.readPrices(ticker, startDate, endDate)
+
+        if len(histValues) == 0:
+            return None
+
+        return histValues
+
+
+
+    def updatePrices(self, dateRanges, fetcher):
+        """
+        This method requests from the feed the days missing from the store for several tickers. Each ticker is
+        requested once for its missing days and the tickers that are missing the same days are requested together
+
+        Args :
+            - dateRanges : (dict) start and end dates (format YYYY-MM-DD) of the extraction for each ticker
+            - fetcher : (function) function (tickers, startDate, endDate) that gets the prices of a list of tickers
+            from the feed and returns a dict of the prices of each ticker
+
+        Return :
+            - (list of strings) tickers for which new prices were written to the store
+        """
+
+        dateRanges = dict((ticker, (formatDate(startDate), formatDate(endDate)))
+                          for ticker, (startDate, endDate) in dateRanges.items())
+
+        updatedTickers = set()
+
+        # lock the tickers in a fixed order so that concurrent batches can not deadlock
+        tickerLocks = [self.getTickerLock(ticker) for ticker in sorted(dateRanges)]
+
+        for tickerLock in tickerLocks:
+            tickerLock.acquire()
+
+        try:
+
+            # group the tickers that are missing the same days
+            batches = {}
+
+            for ticker, (startDate, endDate) in dateRanges.items():
+
+                missingRanges = self.getMissingRanges(ticker, startDate, endDate)
+
+                # the store is the cache of the feed, a ticker without missing days is a hit
+                instrumentation.increment('fipi_cache_requests_total', cache='price_store',
+                                          result='miss' if len(missingRanges) > 0 else 'hit')
+
+                for missingRange in missingRanges:
+                    batches.setdefault(missingRange, []).append(ticker)
+
+
+            # request each batch of tickers from the feed
+            for (fetchStart, fetchEnd), tickers in batches.items():
+
+                # if the feed is not available the prices already on disk are served
+                try:
+                    batchPrices = fetcher(sorted(tickers), fetchStart, fetchEnd)
+
+                except Exception:
+                    continue
+
+                for ticker, prices in batchPrices.items():
+                    self.writePrices(ticker, prices, fetchStart, fetchEnd)
+                    updatedTickers.add(ticker)
+
+        finally:
+
+            for tickerLock in tickerLocks:
+                tickerLock.release()
+
+        return sorted(updatedTickers)
+
+
+
+    def getHistoricalPrices(self, dateRanges, fetcher):
+        """
+        Gets the historical prices (open, low, high, close, adj close and volume) of several tickers. The days missing
+        from the store are first requested from the feed in batches (see updatePrices)
+
+        Args :
+            - dateRanges : (dict) start and end dates (format YYYY-MM-DD) of the extraction for each ticker
+            - fetcher : (function) function (tickers, startDate, endDate) that gets the prices of a list of tickers
+            from the feed and returns a dict of the prices of each ticker
+
+        Return :
+            - (dict) open, low, high, close, adj close and volume matrix of each ticker between its set of dates.
+            None for the tickers that are neither in the store nor available from the feed
+        """
+
+        self.updatePrices(dateRanges, fetcher)
+
+        histValues = {}
+
+        for ticker, (startDate, endDate) in dateRanges.items():
+
+            prices = self.readPrices(ticker, formatDate(startDate), formatDate(endDate))
+            histValues[ticker] = prices if len(prices) > 0 else None
+
+        return histValues
+
+
+
+
+def getPriceRows(ticker, prices):
+    """
+    This helper function creates the rows of the prices table for the price bars of a ticker
+
+    Args :
+        - ticker : (string) id of stock on markets, or url of the feed of a quote
+        - prices : (DataFrame) open, low, high, close, adj close and volume matrix. None if there are no prices
+
+    Return :
+        - (list of lists) ticker, date and prices of each bar
+    """
+
+    rows = []
+
+    if prices is not None:
+
+        for date, values in zip(prices.index, prices[PRICE_COLUMNS].values.tolist()):
+            rows.append([ticker, date.strftime('%Y-%m-%d')] + values)
+
+    return rows
+
+
+
+def readPriceCsv(csvFile):
+    """
+    This function reads daily prices from a csv file. The file has a Date column and at least a Close column, the
+    missing open, high, low and adj close columns are set to the close and a missing volume to 0
+
+    Args :
+        - csvFile : (string) name of the csv file
+
+    Return :
+        - (DataFrame) open, low, high, close, adj close and volume matrix, sorted by date
+    """
+
+    prices = pd.read_csv(csvFile, index_col='Date', parse_dates=True)
+
+    if 'Close' not in prices.columns:
+        raise ValueError('%s has no Close column' % csvFile)
+
+    for col in PRICE_COLUMNS:
+
+        if col not in prices.columns:
+            prices[col] = 0.0 if col == 'Volume' else prices['Close']
+
+    prices = prices[PRICE_COLUMNS].astype(float).dropna(subset=['Close'])
+
+    return prices.sort_index()
+
+
+
+def formatDate(date):
+    """
+    This helper function formats a date in the YYYY-MM-DD format used by the store
+
+    Args :
+        - date : (string, datetime or Timestamp) date to format
+
+    Return :
+        - (string) date in the YYYY-MM-DD format
+    """
+
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+
+def shiftDate(date, nbDays):
+    """
+    This helper function shifts a date by a number of days
+
+    Args :
+        - date : (string) date to shift (format YYYY-MM-DD)
+        - nbDays : (int) number of days of the shift
+
+    Return :
+        - (string) shifted date (format YYYY-MM-DD)
+    """
+
+    return (pd.Timestamp(date) + datetime.timedelta(days=nbDays)).strftime('%Y-%m-%d')
+
+
+
+# price store shared by all the assets of the process
+store = PriceStore()
+
+
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 3:
+        sys.exit('usage : python priceStore.py FEED_REF CSV_FILE')
+
+    print('%d bars imported' % store.importCsv(sys.argv[1], sys.argv[2]))
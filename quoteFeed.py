@@ -0,0 +1,183 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the quote feeds of the preferred stocks (TMX and preferred stock channel pages). A quote is the
+current price of a stock scraped from its web page. The pages are fetched concurrently by a pool of threads from the
+backend of their feed type (see feedBackends, the live backend shares a single keep-alive HTTP session with a limit of
+concurrent requests per host, timeouts and retries with backoff), so that all the quotes of a portfolio are fetched in
+about the latency of one page. Each fetched quote is archived in the
+price store as the bar of its day, which gives the history of the quotes
+
+"""
+
+
+import logging
+import datetime
+
+import pandas as pd
+
+import feedBackends
+import tradingCalendar
+import quoteParser
+import priceStore
+import instrumentation
+from cache import TtlCache
+
+
+logger = logging.getLogger(__name__)
+
+
+# feed types of the quotes
+TMX = 'TMX'
+PREFSTOCKCHANNEL = 'PREFSTOCKCHANNEL'
+
+# columns of the price matrices
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# time to live of the quotes while the market is open (s) and maximum number of quotes in the cache
+QUOTE_TTL = 15 * 60
+QUOTE_CACHE_SIZE = 256
+
+
+
+# page parser of each feed type
+PAGE_PARSERS = {TMX: quoteParser.parseTmxPage, PREFSTOCKCHANNEL: quoteParser.parsePrefStockChannelPage}
+
+
+
+def getQuoteExpiry(now):
+    """
+    This function gets the expiry time of a quote. While the market is open a quote is valid for QUOTE_TTL seconds
+    (and at most until the close), once the market is closed the quote is the closing price and it is valid until
+    the market opens again
+
+    Args :
+        - now : (float) time the quote is fetched (s since the epoch)
+
+    Return :
+        - (float) expiry time of the quote (s since the epoch)
+    """
+
+    marketTime = datetime.datetime.fromtimestamp(now, tradingCalendar.MARKET_TIMEZONE).replace(tzinfo=None)
+
+    if tradingCalendar.isMarketOpen(marketTime):
+        closeTime = datetime.datetime.combine(marketTime.date(), tradingCalendar.MARKET_CLOSE)
+        return now + min(QUOTE_TTL, (closeTime - marketTime).total_seconds())
+
+    return now + (tradingCalendar.getNextOpenTime(marketTime) - marketTime).total_seconds()
+
+
+
+def createQuotePrices(stockPrice, volume, date=None):
+    """
+    This function creates the price matrix of a quote : a single row for the day of the quote where all the prices are
+    the price of the quote
+
+    Args :
+        - stockPrice : (float) price of the quote
+        - volume : (float) volume of the quote
+        - date : (string) date of the quote (format YYYY-MM-DD). If None the current day is used while the market is
+        open, otherwise the last closing day (the quote is then the closing price of that day)
+
+    Return :
+        - (DataFrame) open, low, high, close, adj close and volume matrix of the quote
+    """
+
+    if date is None:
+
+        now = tradingCalendar.getMarketTime()
+
+        # before the open the quote is still the closing price of the previous trading day
+        if tradingCalendar.isMarketOpen(now):
+            date = tradingCalendar.getLastTradingDay(now)
+
+        else:
+            date = tradingCalendar.getLastClosingDay(now)
+
+    entries = [stockPrice, stockPrice, stockPrice, stockPrice, stockPrice, volume]
+
+    return pd.DataFrame([entries], columns=PRICE_COLUMNS, index=pd.date_range(date, periods=1))
+
+
+
+def fetchQuotes(quoteRefs, quoteCache=None):
+    """
+    This function fetches a set of quotes. The quotes are taken from the quote cache while they are valid, the pages
+    of the other quotes are fetched at once and each distinct page is fetched only once (also when another thread is
+    already fetching it). A page that can not be fetched or that does not contain its quote is logged and counted as
+    an error of its feed, the other quotes are still fetched
+
+    Args :
+        - quoteRefs : (list of tuples) feed type and url of each quote
+        - quoteCache : (TtlCache) cache of the quotes by url. If None the cache of the module is used
+
+    Return :
+        - (dict) price matrix of each url (see createQuotePrices). None for the urls whose quote could not be fetched
+    """
+
+    if quoteCache is None:
+        quoteCache = quotes
+
+    feedTypes = dict((url, feedType) for feedType, url in quoteRefs)
+
+
+    def createQuote(url):
+
+        # a page without its quote is an error of its feed as well
+        with instrumentation.timer('fipi_feed_fetch_seconds', 'fipi_feed_errors_total', feed_type=feedTypes[url]):
+            page = feedBackends.getBackend(feedTypes[url]).fetchPage(url)
+            quotePrices = createQuotePrices(*PAGE_PARSERS[feedTypes[url]](page))
+
+        # the last quote of a day is the bar of the day in the archive
+        priceStore.store.writeBars(url, quotePrices)
+
+        return quotePrices
+
+
+    def fetchQuote(url):
+
+        return quoteCache.getOrCreate(url, lambda: createQuote(url))
+
+
+    # the error of each page is logged by the fetcher
+    quotePrices = feedBackends.fetcher.mapUrls(fetchQuote, list(feedTypes.keys()))
+
+    failedUrls = sorted(url for url, prices in quotePrices.items() if isinstance(prices, Exception))
+
+    if len(failedUrls) > 0:
+        logger.warning('%d of %d quotes could not be fetched : %s', len(failedUrls), len(quotePrices),
+                       ', '.join(failedUrls))
+
+    return dict((url, None if url in failedUrls else prices) for url, prices in quotePrices.items())
+
+
+
+def getHistoricalQuotes(quoteRanges):
+    """
+    This function gets the history of a set of quotes between their sets of dates. The current quotes are fetched
+    (which archives them) and the histories are then read from the archive of the price store. If the feeds are not
+    available the quotes already in the archive are served
+
+    Args :
+        - quoteRanges : (dict) feed type and start and end dates (format YYYY-MM-DD) of the extraction for each url
+
+    Return :
+        - (dict) open, low, high, close, adj close and volume matrix of each url between its set of dates. None for the
+        urls that have no quotes in the archive
+    """
+
+    fetchQuotes([(feedType, url) for url, (feedType, startDate, endDate) in quoteRanges.items()])
+
+    histValues = {}
+
+    for url, (feedType, startDate, endDate) in quoteRanges.items():
+
+        prices = priceStore.store.readPrices(url, priceStore.formatDate(startDate), priceStore.formatDate(endDate))
+        histValues[url] = prices if len(prices) > 0 else None
+
+    return histValues
+
+
+
+# quote cache of the process
+quotes = TtlCache(QUOTE_CACHE_SIZE, getQuoteExpiry, name='quote')
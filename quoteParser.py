@@ -0,0 +1,265 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the extraction of the quotes from the quote pages of the preferred stocks. The pages are parsed
+with the event (target) interface of the lxml HTML parser : no tree is built, only the text of the few elements of the
+quote is kept and the parsing stops as soon as the quote has been found, usually well before the end of the page
+
+"""
+
+
+from lxml import etree
+
+
+# size of the chunks of the page fed to the parser
+CHUNK_SIZE = 16384
+
+# elements of the quote on the TMX pages
+TMX_PRICE_CLASS = 'quote-price priceLarge'
+TMX_VOLUME_CLASS = 'quote-volume volumeLarge'
+
+# elements of the quote on the preferred stock channel pages
+PSC_LABEL_CLASS = 'dsty'
+PSC_VALUE_CLASS = 'dstyb'
+PSC_PRICE_LABEL = 'Recent Market Price:'
+
+
+
+class QuoteFound(Exception):
+    """
+    This exception is raised by a parser target to stop the parsing of a page once its quote has been found
+
+    """
+
+    pass
+
+
+
+class TmxQuoteTarget(object):
+    """
+    This class is the parser target of the TMX quote pages. It keeps the text of the first span of the price element
+    and the text of the volume element
+
+
+    Attributes :
+
+        - depth : (int) depth of the current element
+        - priceDepth : (int) depth of the price element when it is being read, None otherwise
+        - field : (string) name of the field being read (price or volume), None if no field is being read
+        - fieldDepth : (int) depth of the element of the field being read
+        - texts : (dict) text pieces of each field
+
+    """
+
+    def __init__(self):
+
+        self.depth = 0
+        self.priceDepth = None
+        self.field = None
+        self.fieldDepth = None
+        self.texts = {}
+
+
+
+    def start(self, tag, attrib):
+
+        self.depth += 1
+
+        if self.field is not None or tag not in ('div', 'span'):
+            return
+
+        if tag == 'div' and attrib.get('class') == TMX_PRICE_CLASS and 'price' not in self.texts:
+            self.priceDepth = self.depth
+
+        elif tag == 'div' and attrib.get('class') == TMX_VOLUME_CLASS and 'volume' not in self.texts:
+            self.field, self.fieldDepth = 'volume', self.depth
+
+        # the price is the text of the first span of the price element
+        elif tag == 'span' and self.priceDepth is not None:
+            self.field, self.fieldDepth = 'price', self.depth
+
+
+    def data(self, data):
+
+        if self.field is not None:
+            self.texts.setdefault(self.field, []).append(data)
+
+
+    def end(self, tag):
+
+        if self.field is not None and self.depth == self.fieldDepth:
+
+            self.texts.setdefault(self.field, [])
+
+            if self.field == 'price':
+                self.priceDepth = None
+
+            self.field, self.fieldDepth = None, None
+
+            if 'price' in self.texts and 'volume' in self.texts:
+                raise QuoteFound()
+
+        # the price element ended without a span
+        elif self.priceDepth is not None and self.depth == self.priceDepth:
+            self.priceDepth = None
+
+        self.depth -= 1
+
+
+    def close(self):
+
+        return None
+
+
+
+class PrefStockChannelQuoteTarget(object):
+    """
+    This class is the parser target of the preferred stock channel pages. The data of a stock are a list of labels and
+    a list of values, the target keeps their texts until the value of the price label is found
+
+
+    Attributes :
+
+        - depth : (int) depth of the current element
+        - field : (string) name of the list being read (labels or values), None if no list is being read
+        - fieldDepth : (int) depth of the element being read
+        - texts : (dict) texts of the elements of each list
+
+    """
+
+    def __init__(self):
+
+        self.depth = 0
+        self.field = None
+        self.fieldDepth = None
+        self.texts = {'labels': [], 'values': []}
+
+
+
+    def start(self, tag, attrib):
+
+        self.depth += 1
+
+        if self.field is None and tag == 'td':
+
+            if attrib.get('class') == PSC_LABEL_CLASS:
+                self.field = 'labels'
+
+            elif attrib.get('class') == PSC_VALUE_CLASS:
+                self.field = 'values'
+
+            else:
+                return
+
+            self.fieldDepth = self.depth
+            self.texts[self.field].append('')
+
+
+    def data(self, data):
+
+        if self.field is not None:
+            self.texts[self.field][-1] += data
+
+
+    def end(self, tag):
+
+        if self.field is not None and self.depth == self.fieldDepth:
+
+            self.field, self.fieldDepth = None, None
+
+            labels = self.texts['labels']
+
+            if PSC_PRICE_LABEL in labels and len(self.texts['values']) > labels.index(PSC_PRICE_LABEL):
+                raise QuoteFound()
+
+        self.depth -= 1
+
+
+    def close(self):
+
+        return None
+
+
+
+def parsePage(page, target):
+    """
+    This function feeds a page to an HTML parser with a given target, chunk by chunk, until the target has found its
+    quote or the page ends
+
+    Args :
+        - page : (string) content of the page
+        - target : (object) parser target
+
+    Return :
+        - (object) the target, with the texts it has kept
+    """
+
+    parser = etree.HTMLParser(target=target)
+
+    try:
+        for start in range(0, len(page), CHUNK_SIZE):
+            parser.feed(page[start:start + CHUNK_SIZE])
+
+        parser.close()
+
+    except QuoteFound:
+        pass
+
+    return target
+
+
+
+def parseTmxPage(page):
+    """
+    This function extracts the quote from a TMX quote page
+
+    Args :
+        - page : (string) content of the page
+
+    Return :
+        - (tuple of floats) price and volume of the quote
+
+    Raise :
+        - (ValueError) if the quote is not in the page
+    """
+
+    texts = parsePage(page, TmxQuoteTarget()).texts
+
+    if 'price' not in texts or 'volume' not in texts:
+        raise ValueError('No quote in the TMX page')
+
+    stockPrice = float(''.join(texts['price']))
+
+    # the text of the volume element is 'Volume: ' followed by the volume
+    volume = ''.join(texts['volume']).strip()[8:].strip()
+    volume = float(volume.replace(',', ''))
+
+    return stockPrice, volume
+
+
+
+def parsePrefStockChannelPage(page):
+    """
+    This function extracts the quote from a preferred stock channel page. The page has no volume, a volume of 1 is
+    returned
+
+    Args :
+        - page : (string) content of the page
+
+    Return :
+        - (tuple of floats) price and volume of the quote
+
+    Raise :
+        - (ValueError) if the quote is not in the page
+    """
+
+    texts = parsePage(page, PrefStockChannelQuoteTarget()).texts
+
+    labels, values = texts['labels'], texts['values']
+
+    if PSC_PRICE_LABEL not in labels or len(values) <= labels.index(PSC_PRICE_LABEL):
+        raise ValueError('No quote in the preferred stock channel page')
+
+    stockPrice = values[labels.index(PSC_PRICE_LABEL)]
+
+    return float(stockPrice.strip().strip('$')), 1
@@ -1,6 +1,5 @@
-
 """
-@author: Vincent Roy 
+@author: Vincent Roy
 
 This module implements the real estate classes
 
@@ -9,82 +8,144 @@ This module implements the real estate classes
 
 
 from asset import *
+from cache import LruCache
+import tradingCalendar
 
+import os
 
-class RealEstate(Asset):
-    """
-    This class is the abstract real estate class
 
+# maximum number of interpolated valuation series kept in the cache
+VALUATION_CACHE_SIZE = 32
 
-    Attributes :
+# interpolated valuation series by csv file
+valuationCache = LruCache(VALUATION_CACHE_SIZE, name='valuation')
 
-        - aaa : (aaa) aaa
 
 
+class RealEstate(Asset):
     """
+    This class is the real estate class. The value of a real estate asset comes from a few dated valuations (ex
+    appraisals or municipal assessments) archived in a csv file, the values of the trading days in between are
+    interpolated
 
 
-    def __init__(self,assetID, purchaseDate, purchasePrice, saleDate, salePrice, volume, percentOwnership, ticker):
-        Asset.__init__(self, assetID, purchaseDate, purchasePrice, saleDate, salePrice, volume, percentOwnership,ticker)
+    Attributes :
+
+        - feedRef : (string) name of the csv file of the valuations (Date and Adj Close columns, dates formatted as
+        YYYYMMDD)
 
 
+    """
 
 
-        self.feedType = 'ARCHIVED'
-        self.feedRef = feedRef
+    def __init__(self,assetID, purchaseDate, purchasePrice, saleDate, salePrice, volume, percentOwnership, ticker, feedType):
+        Asset.__init__(self, assetID, purchaseDate, purchasePrice, saleDate, salePrice, volume, percentOwnership,ticker,feedType)
 
-        # load the archived values from the assigned csv file
-        df = pd.read_csv(self.feedRef, parse_dates=['Date'])
-        df = pd.DataFrame(df['Adj Close'].values, index=df['Date'], columns=['Adj Close'])
-        self.archivedValues = df
+        self.assetType = 'REAL'
+        self.feedRef = ticker
 
 
 
 
-    def getHistoricalValues(self, startDate, endDate):
+    def getHistoricalPrice(self, startDate, endDate):
         """
-        Gets the historical stat values (price) from the feed for the asset (close open avg etc.)
+        Gets the historical values (open, low, high, close, adj close and volume) between a set of dates. The value of
+        each trading day is interpolated from the valuations of the asset, all the prices are the interpolated value
 
         Args :
-        - startDate : (string) string representing the start date for the query of the historical asset prices
-        - endDate : (string) string representing the end date for the query of the historical asset prices
-
-        Note : if startDate is equal to endDate the method will return the last entry
+        - startDate : (string) start date of the extraction (format YY-MM-DD)
+        - endDate : (string) end date of the extraction (format YY-MM-DD)
 
         Return :
-            - (DataFrame) matrix of the historical stat values of the asset
-
+            - (DataFrame) open, low, high, close, adj close and volume matrix between a set of dates. None if the
+            valuations can not be read or if there is no valuation before the end date
         """
 
         try:
+            histValues = getValuationSeries(self.feedRef).loc[startDate:endDate]
 
-            # get reference trading days for the specified periode by using the IBM stock and add a new column
-            # with NaN
-            referenceDates = pdr.DataReader('IBM', data_source='yahoo', start=startDate, end=endDate)
-            referenceDates['New'] = np.NaN
+        except (IOError, OSError, ValueError, KeyError):
+            return None
 
+        if len(histValues) == 0:
+            return None
 
-            # from the reference dates create a new frame for the historical values
-            histValues = pd.DataFrame(referenceDates['New'])
+        return histValues
 
 
-            # append and sort the archived values of the asset
-            histValues = histValues.append(self.archivedValues)
-            histValues = histValues.sort_index()
 
-            # interpolate the reference dates with the archived values
-            histValues = histValues.interpolate()
 
-            # clean up the data frame
-            histValues = histValues.drop('New',1)
-            histValues = histValues.loc[startDate:endDate]
+def readValuations(csvFile):
+    """
+    This function reads the valuations of a real estate asset from a csv file
 
+    Args :
+        - csvFile : (string) name of the csv file, with a Date column (YYYYMMDD, optionally quoted) and an Adj Close
+        column
 
-            return  histValues
+    Return :
+        - (Series) valuations sorted by date
+    """
 
-        except:
+    valuations = pd.read_csv(csvFile, dtype={'Date': str})
 
-            return None
+    dates = pd.to_datetime(valuations['Date'].str.strip().str.strip('\'"'), format='%Y%m%d')
+
+    return pd.Series(valuations['Adj Close'].values.astype(float), index=dates).sort_index()
+
+
+
+def interpolateValuations(valuations, dates):
+    """
+    This function interpolates linearly the valuations of a real estate asset on a set of dates. The dates are
+    converted to day numbers and interpolated in a single pass, the dates before the first valuation have no value and
+    the dates after the last valuation keep the last value
+
+    Args :
+        - valuations : (Series) valuations sorted by date
+        - dates : (DatetimeIndex) dates of the interpolation
+
+    Return :
+        - (array) interpolated value of each date
+    """
+
+    valuationDays = valuations.index.values.astype('datetime64[D]').astype(np.int64)
+    days = dates.values.astype('datetime64[D]').astype(np.int64)
+
+    return np.interp(days, valuationDays, valuations.values, left=np.nan)
+
+
+
+def getValuationSeries(csvFile):
+    """
+    This function gets the price matrix of the valuations of a real estate asset on every trading day from its first
+    valuation to the last trading day. The matrix is created once per version of the csv file and trading day, and
+    then served from the cache
+
+    Args :
+        - csvFile : (string) name of the csv file of the valuations
+
+    Return :
+        - (DataFrame) open, low, high, close, adj close and volume matrix of the interpolated values
+    """
+
+    lastTradingDay = tradingCalendar.getLastTradingDay()
+    key = (os.path.abspath(csvFile), os.path.getmtime(csvFile), lastTradingDay)
+
+
+    def create():
+
+        valuations = readValuations(csvFile)
+
+        dates = tradingCalendar.getBusinessDays(valuations.index[0], lastTradingDay)
+        values = interpolateValuations(valuations, dates)
+
+        prices = pd.DataFrame({'Open': values, 'High': values, 'Low': values, 'Close': values, 'Adj Close': values,
+                               'Volume': 0.0}, index=dates, columns=['Open', 'High', 'Low', 'Close', 'Adj Close',
+                                                                      'Volume'])
+        prices.index.name = 'Date'
 
+        return prices
 
 
+    return valuationCache.getOrCreate(key, create)
@@ -9,15 +9,84 @@ This module implements the concrete securities classes
 
 
 from asset import *
-from pandas_datareader import data as pdr
-import datetime
-from bs4 import BeautifulSoup
+import priceStore
+import quoteFeed
+import feedBackends
+import instrumentation
 
 
-import urllib2
-import pandas as pd
 
-import datetime
+
+def fetchYahooPrice(ticker, startDate, endDate):
+    """
+    Gets the historical prices (open, low, high, close, adj close and volume) of a ticker from the yahoo finance api
+    (through the backend of the yahoo feed, see feedBackends)
+
+    Args :
+    - ticker : (string) id of stock on markets
+    - startDate : (string) start date of the extraction (format YY-MM-DD)
+    - endDate : (string) end date of the extraction (format YY-MM-DD)
+
+    Return :
+        - (Dataframe) open, low, high, close, adj close and volume matrix between a set of dates
+
+    Raise :
+        - (KeyError) if the ticker is not available from the feed
+    """
+
+    with instrumentation.timer('fipi_feed_fetch_seconds', 'fipi_feed_errors_total', feed_type='YAHOO'):
+        return feedBackends.getBackend('YAHOO').fetchPrices([ticker], startDate, endDate)[ticker]
+
+
+
+def fetchYahooPrices(tickers, startDate, endDate):
+    """
+    Gets the historical prices (open, low, high, close, adj close and volume) of a list of tickers from the yahoo
+    finance api with a single multi symbol request (through the backend of the yahoo feed, see feedBackends)
+
+    Args :
+    - tickers : (list of strings) ids of stocks on markets
+    - startDate : (string) start date of the extraction (format YY-MM-DD)
+    - endDate : (string) end date of the extraction (format YY-MM-DD)
+
+    Return :
+        - (dict) open, low, high, close, adj close and volume matrix of each ticker between a set of dates. The tickers
+        that are not available from the api are left out
+    """
+
+    with instrumentation.timer('fipi_feed_fetch_seconds', 'fipi_feed_errors_total', feed_type='YAHOO'):
+        return feedBackends.getBackend('YAHOO').fetchPrices(tickers, startDate, endDate)
+
+
+
+def getYahooPrices(dateRanges):
+    """
+    Gets the historical prices (open, low, high, close, adj close and volume) of several tickers from the local price
+    store, the days missing from the store are requested from the yahoo finance api in batches
+
+    Args :
+    - dateRanges : (dict) start and end dates (format YY-MM-DD) of the extraction for each ticker
+
+    Return :
+        - (dict) open, low, high, close, adj close and volume matrix of each ticker between its set of dates
+    """
+
+    return priceStore.store.getHistoricalPrices(dateRanges, fetchYahooPrices)
+
+
+
+def updateYahooPrices(dateRanges):
+    """
+    Requests from the yahoo finance api the days missing from the local price store for several tickers
+
+    Args :
+    - dateRanges : (dict) start and end dates (format YY-MM-DD) of the extraction for each ticker
+
+    Return :
+        - (list of strings) tickers for which new prices were written to the store
+    """
+
+    return priceStore.store.updatePrices(dateRanges, fetchYahooPrices)
 
 
 
@@ -80,9 +149,10 @@ class CommonStock(Equity):
             - (Dataframe) open, low, high, close, adj close and volume matrix between a set of dates 
         """
 
-        # try to get the values from the yahoo finance api
+        # try to get the values from the local price store, only the days missing from the store are requested
+        # from the yahoo finance api
         try :
-            histValues = pdr.DataReader(self.ticker, data_source='yahoo', start=startDate,end=endDate)
+            histValues = priceStore.store.getHistoricalPrice(self.ticker, startDate, endDate, fetchYahooPrice)
 
             return histValues
 
@@ -124,60 +194,12 @@ class PreferredStock(Equity):
         - endDate : (string) end date of the extraction (format YY-MM-DD)
 
         Return :
-            - (Dataframe) open, low, high, close, adj close and volume matrix between a set of dates 
+            - (Dataframe) open, low, high, close, adj close and volume matrix between a set of dates. The feeds of the
+            preferred stocks only give the current quote, the prices are the quotes archived in the price store
         """
 
-
-        if self.feedType == 'PREFSTOCKCHANNEL':
-
-            pageURL = 'https://www.preferredstockchannel.com/symbol/enb.prv.ca/'
-            page = urllib2.urlopen(pageURL)
-            parsedPage = BeautifulSoup(page)
-
-            categories = parsedPage.find_all('td', attrs={'class': 'dsty'})
-
-            for idx in range(len(categories)):
-                if categories[idx].text == 'Recent Market Price:':
-                    break
-
-            stockPrice = parsedPage.find_all('td', attrs={'class': 'dstyb'})[idx].text
-
-            stockPrice = float(stockPrice.strip('$'))
-
-            entries = [stockPrice, stockPrice, stockPrice, stockPrice, stockPrice, 1]
-
-            dateNow = datetime.datetime.now().strftime("%Y-%m-%d")
-            ref = pdr.DataReader('IBM', data_source='yahoo', start=dateNow, end=dateNow)
-            lastTradingDay = ref.index[0].strftime("%Y-%m-%d")
-
-            result = pd.DataFrame([entries], columns=['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'],
-                              index=pd.date_range(lastTradingDay, periods=1))
-
-
-
-        elif self.feedType == 'TMX':
-
-            pageURL = self.ticker
-
-            page = urllib2.urlopen(pageURL)
-            parsedPage = BeautifulSoup(page,"lxml")
-
-            stockPrice = float(parsedPage.find('div', attrs={'class': 'quote-price priceLarge'}).find('span').text)
-
-            volume = parsedPage.find('div', attrs={'class': 'quote-volume volumeLarge'}).text.strip()[8:].strip()
-            volume = float(volume.replace(',', ''))
-
-            entries = [stockPrice, stockPrice, stockPrice, stockPrice, stockPrice, volume]
-
-            dateNow = datetime.datetime.now().strftime("%Y-%m-%d")
-            ref = pdr.DataReader('IBM', data_source='yahoo', start=dateNow, end=dateNow)
-            lastTradingDay = ref.index[0].strftime("%Y-%m-%d")
-
-            result = pd.DataFrame([entries], columns=['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'],
-                              index=pd.date_range(lastTradingDay, periods=1))
-
-
-        return result
+        # the feed type gives the parser of the quote page and the ticker is the url of the page
+        return quoteFeed.getHistoricalQuotes({self.ticker: (self.feedType, startDate, endDate)})[self.ticker]
 
 
 
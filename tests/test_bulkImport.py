@@ -0,0 +1,116 @@
+"""
+@author: Vincent Roy [*]
+
+This module tests the reading of the import files of the bulk import
+
+"""
+
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import bulkImport
+
+
+# header of the import files of the tests
+HEADER = b'Symbol,Quantity,Trade Date,Unit Cost,Notes\r\n'
+
+
+
+class TestReadLots(unittest.TestCase):
+    """
+    This class tests the reading and the validation of the lots of an import file
+
+    """
+
+    def setUp(self):
+
+        self.tempDir = tempfile.mkdtemp()
+
+
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tempDir)
+
+
+
+    def writeImportFile(self, content):
+        """
+        This helper method writes an import file in the temporary directory
+
+        Args :
+            - content : (bytes) content of the file
+
+        Return :
+            - (string) name of the file
+        """
+
+        importFile = os.path.join(self.tempDir, 'lots.csv')
+
+        with open(importFile, 'wb') as csvFile:
+            csvFile.write(content)
+
+        return importFile
+
+
+
+    def testMultilineValue(self):
+
+        importFile = self.writeImportFile(HEADER +
+                                          b'ENB.TO,10,2018-02-23,12.50,"line one\r\nline two"\r\n'
+                                          b'XX.TO,abc,2018-02-23,1,\r\n')
+
+        columns, rows, delimiter = bulkImport.readRows(importFile)
+
+        self.assertEqual(rows[0][1][4], u'line one\r\nline two')
+
+        report = bulkImport.readLots(importFile)
+
+        # the invalid row is on the 4th line of the file, after the 2 lines of the quoted value
+        self.assertEqual([record['priceFeedRef'] for record in report.records], [u'ENB.TO'])
+        self.assertEqual(report.errors, [(4, u'abc is not an amount')])
+
+
+
+    def testLineNumbersAfterPreamble(self):
+
+        importFile = self.writeImportFile(b'Account,123\r\n\r\n' + HEADER +
+                                          b'ENB.TO,10,2018-02-23,12.50,"a\nb\nc"\r\n'
+                                          b'\r\n'
+                                          b'XX.TO,-1,2018-02-23,1,\r\n')
+
+        report = bulkImport.readLots(importFile)
+
+        self.assertEqual(report.errors, [(8, u'The volume must be positive')])
+        self.assertEqual(report.records[0]['assetID'], u'ENB.TO-4')
+
+
+
+    def testUtf8Values(self):
+
+        importFile = self.writeImportFile(b'\xef\xbb\xbfLot ID,' + HEADER + b'caf\xc3\xa9,ENB.TO,10,2018-02-23,12.50,\r\n')
+
+        report = bulkImport.readLots(importFile)
+
+        self.assertEqual(report.errors, [])
+        self.assertEqual(report.records[0]['assetID'], u'caf\xe9')
+
+
+
+    def testNotUtf8(self):
+
+        importFile = self.writeImportFile(HEADER + b'ENB.TO,10,2018-02-23,12.50,caf\xe9\r\n')
+
+        self.assertRaises(ValueError, bulkImport.readLots, importFile)
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
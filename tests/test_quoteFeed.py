@@ -0,0 +1,124 @@
+"""
+@author: Vincent Roy [*]
+
+This module tests the date of the quotes fetched and archived by the quote feed
+
+"""
+
+
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import feedBackends
+import priceStore
+import quoteFeed
+import tradingCalendar
+from cache import TtlCache
+
+
+# url and page of the quote of the tests
+QUOTE_URL = 'https://web.tmxmoney.com/quote.php?qm_symbol=ENB'
+QUOTE_PAGE = ('<html><body><div class="quote-price priceLarge"><span>21.50</span></div>'
+              '<div class="quote-volume volumeLarge">Volume: 1,200</div></body></html>')
+
+
+
+class PageBackend(feedBackends.FeedBackend):
+    """
+    This class is a backend that returns the same page for every url
+
+    """
+
+    def fetchPage(self, url):
+
+        return QUOTE_PAGE
+
+
+
+class TestQuoteDate(unittest.TestCase):
+    """
+    This class tests the day of the bar archived for a quote depending on the time of the market
+
+    """
+
+    def setUp(self):
+
+        self.tempDir = tempfile.mkdtemp()
+        self.backends = dict(feedBackends.backends)
+        self.store = priceStore.store
+        self.getMarketTime = tradingCalendar.getMarketTime
+
+        priceStore.store = priceStore.PriceStore(os.path.join(self.tempDir, 'prices.sqlite'))
+        feedBackends.setBackend(quoteFeed.TMX, PageBackend())
+
+
+
+    def tearDown(self):
+
+        tradingCalendar.getMarketTime = self.getMarketTime
+        priceStore.store = self.store
+        feedBackends.backends.clear()
+        feedBackends.backends.update(self.backends)
+
+        shutil.rmtree(self.tempDir)
+
+
+
+    def fetchArchivedDates(self, now):
+        """
+        This helper method fetches the quote at a given time of the market and reads the days archived for it
+
+        Args :
+            - now : (datetime) time of the market
+
+        Return :
+            - (list of strings) days of the bars archived for the quote (format YYYY-MM-DD)
+        """
+
+        tradingCalendar.getMarketTime = lambda: now
+
+        quotePrices = quoteFeed.fetchQuotes([(quoteFeed.TMX, QUOTE_URL)], TtlCache(1, quoteFeed.getQuoteExpiry))
+
+        self.assertEqual(quotePrices[QUOTE_URL]['Close'].tolist(), [21.5])
+
+        bars = priceStore.store.readPrices(QUOTE_URL, '2018-01-01', '2018-12-31')
+
+        return [date.strftime('%Y-%m-%d') for date in bars.index]
+
+
+
+    def testBeforeOpen(self):
+
+        # friday before the open : the quote is the close of thursday
+        self.assertEqual(self.fetchArchivedDates(datetime.datetime(2018, 2, 23, 8, 0)), ['2018-02-22'])
+
+
+
+    def testBeforeOpenAfterWeekend(self):
+
+        # monday before the open : the quote is the close of the previous friday
+        self.assertEqual(self.fetchArchivedDates(datetime.datetime(2018, 2, 26, 9, 0)), ['2018-02-23'])
+
+
+
+    def testMarketOpen(self):
+
+        self.assertEqual(self.fetchArchivedDates(datetime.datetime(2018, 2, 23, 11, 0)), ['2018-02-23'])
+
+
+
+    def testAfterClose(self):
+
+        self.assertEqual(self.fetchArchivedDates(datetime.datetime(2018, 2, 23, 17, 0)), ['2018-02-23'])
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
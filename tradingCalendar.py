@@ -0,0 +1,244 @@
+"""
+@author: Vincent Roy [*]
+
+This module implements the trading calendar. The trading days are generated offline from the holidays of the Toronto
+stock exchange and are cached for the whole process, so that no price feed has to be queried to know them
+
+"""
+
+
+import threading
+import datetime
+
+import pandas as pd
+import pytz
+from pandas.tseries.holiday import AbstractHolidayCalendar, Holiday, GoodFriday, weekend_to_monday, \
+    next_monday_or_tuesday
+from pandas.tseries.offsets import CustomBusinessDay, DateOffset
+from dateutil.relativedelta import MO
+
+
+# first year of the cached trading days and number of years cached after the current year
+FIRST_YEAR = 1990
+NB_YEARS_AHEAD = 2
+
+# time zone and trading hours of the market
+MARKET_TIMEZONE = pytz.timezone('America/Toronto')
+MARKET_OPEN = datetime.time(9, 30)
+MARKET_CLOSE = datetime.time(16, 0)
+
+
+
+class TsxHolidayCalendar(AbstractHolidayCalendar):
+    """
+    This class is the holiday calendar of the Toronto stock exchange
+
+    """
+
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=weekend_to_monday),
+        Holiday('Family Day', month=2, day=1, offset=DateOffset(weekday=MO(3)), start_date=datetime.datetime(2008, 1, 1)),
+        GoodFriday,
+        Holiday('Victoria Day', month=5, day=24, offset=DateOffset(weekday=MO(-1))),
+        Holiday('Canada Day', month=7, day=1, observance=weekend_to_monday),
+        Holiday('Civic Holiday', month=8, day=1, offset=DateOffset(weekday=MO(1))),
+        Holiday('Labour Day', month=9, day=1, offset=DateOffset(weekday=MO(1))),
+        Holiday('Thanksgiving', month=10, day=1, offset=DateOffset(weekday=MO(2))),
+        Holiday('Christmas', month=12, day=25, observance=weekend_to_monday),
+        Holiday('Boxing Day', month=12, day=26, observance=next_monday_or_tuesday)
+    ]
+
+
+
+# trading days of the process, generated the first time they are needed
+tradingDays = None
+lock = threading.Lock()
+
+
+
+def getTradingDays():
+    """
+    This function gets all the cached trading days. The trading days are generated the first time they are needed and
+    again when the current date moves past the cached years
+
+    Args :
+        - None
+
+    Return :
+        - (DatetimeIndex) trading days from the first cached year to the last cached year
+    """
+
+    global tradingDays
+
+    with lock:
+
+        lastYear = datetime.datetime.now().year + NB_YEARS_AHEAD
+
+        if tradingDays is None or tradingDays[-1].year < lastYear:
+
+            businessDay = CustomBusinessDay(calendar=TsxHolidayCalendar())
+            tradingDays = pd.date_range(datetime.datetime(FIRST_YEAR, 1, 1), datetime.datetime(lastYear, 12, 31),
+                                        freq=businessDay)
+
+        return tradingDays
+
+
+
+def getBusinessDays(startDate, endDate):
+    """
+    This function gets the trading days between a set of dates
+
+    Args :
+        - startDate : (string) start date (format YYYY-MM-DD)
+        - endDate : (string) end date (format YYYY-MM-DD)
+
+    Return :
+        - (DatetimeIndex) trading days between the start and end dates (inclusively)
+    """
+
+    days = getTradingDays()
+
+    start = days.searchsorted(pd.Timestamp(startDate), side='left')
+    end = days.searchsorted(pd.Timestamp(endDate), side='right')
+
+    return days[start:end]
+
+
+
+def getLastTradingDay(date=None):
+    """
+    This function gets the last trading day on or before a given date
+
+    Args :
+        - date : (string) date (format YYYY-MM-DD). If None the current date is used
+
+    Return :
+        - (string) last trading day (format YYYY-MM-DD)
+    """
+
+    if date is None:
+        date = datetime.datetime.now()
+
+    days = getTradingDays()
+
+    return days[days.searchsorted(pd.Timestamp(date).normalize(), side='right') - 1].strftime('%Y-%m-%d')
+
+
+
+def getNextTradingDay(date=None):
+    """
+    This function gets the first trading day strictly after a given date
+
+    Args :
+        - date : (string) date (format YYYY-MM-DD). If None the current date is used
+
+    Return :
+        - (string) next trading day (format YYYY-MM-DD)
+    """
+
+    if date is None:
+        date = datetime.datetime.now()
+
+    days = getTradingDays()
+
+    return days[days.searchsorted(pd.Timestamp(date).normalize(), side='right')].strftime('%Y-%m-%d')
+
+
+
+def isTradingDay(date=None):
+    """
+    This function determines if a given date is a trading day
+
+    Args :
+        - date : (string) date (format YYYY-MM-DD). If None the current date is used
+
+    Return :
+        - (boolean) true if the date is a trading day
+    """
+
+    if date is None:
+        date = datetime.datetime.now()
+
+    return getLastTradingDay(date) == pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+
+def getMarketTime():
+    """
+    This function gets the current time in the time zone of the market
+
+    Args :
+        - None
+
+    Return :
+        - (datetime) current time of the market (naive datetime)
+    """
+
+    return datetime.datetime.now(MARKET_TIMEZONE).replace(tzinfo=None)
+
+
+
+def getLastClosingDay(now=None):
+    """
+    This function gets the last trading day for which the market is closed, that is the last day with final prices
+
+    Args :
+        - now : (datetime) time of the market. If None the current time of the market is used
+
+    Return :
+        - (string) last trading day with a closed market (format YYYY-MM-DD)
+    """
+
+    if now is None:
+        now = getMarketTime()
+
+    lastTradingDay = getLastTradingDay(now)
+
+    # the market of the current day is not closed yet
+    if lastTradingDay == now.strftime('%Y-%m-%d') and now.time() < MARKET_CLOSE:
+        lastTradingDay = getLastTradingDay(pd.Timestamp(lastTradingDay) - datetime.timedelta(days=1))
+
+    return lastTradingDay
+
+
+
+def isMarketOpen(now=None):
+    """
+    This function determines if the market is open
+
+    Args :
+        - now : (datetime) time of the market. If None the current time of the market is used
+
+    Return :
+        - (boolean) true if the current day is a trading day and the time is within the trading hours
+    """
+
+    if now is None:
+        now = getMarketTime()
+
+    return isTradingDay(now) and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+
+def getNextOpenTime(now=None):
+    """
+    This function gets the next opening time of the market (the current one if the market is open)
+
+    Args :
+        - now : (datetime) time of the market. If None the current time of the market is used
+
+    Return :
+        - (datetime) next opening time of the market (naive datetime in the time zone of the market)
+    """
+
+    if now is None:
+        now = getMarketTime()
+
+    # the market of the current day has not opened yet
+    if isTradingDay(now) and now.time() < MARKET_CLOSE:
+        nextOpenDay = now.strftime('%Y-%m-%d')
+
+    else:
+        nextOpenDay = getNextTradingDay(now)
+
+    return datetime.datetime.combine(pd.Timestamp(nextOpenDay).date(), MARKET_OPEN)